@@ -1,5 +1,7 @@
 import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -11,23 +13,91 @@ from app.routes.ingestion import router as ingestion_router
 from app.routes.query import router as query_router
 from app.routes.workflow import router as workflow_router
 from app.routes.user_chats import router as user_chats_router
+from app.routes.metrics import router as metrics_router
+from app.routes.health import router as health_router
 
-# Import Supabase client
-from app.utils.supabase import get_supabase_client
+# Import storage backend (Supabase or SQLite), the write-behind queue and lead workers
+from app.storage import get_storage, close_storage
+from app.utils.supabase import lead_workers, write_queue
 
-# Import LightRAG initialization
-from app.utils.lightrag_init import initialize_rag, insert_data
-from app.utils.scrape_website import scrape_site_from_sitemap
+# LightRAG initialization; the heavy LightRAG/LLM imports happen during warmup
+from app.utils.lightrag_init import preload_rag_modules
+from app.utils.tenants import DEFAULT_EMBED_ID, tenants
+from app.utils.embedding_cache import embedding_cache
+from app.utils.ingestion import ingest_jobs
+from app.utils.ingest_index import ingest_index
+from app.utils.doc_support import shutdown_extract_pool
 
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
+
+async def load_rag(app: FastAPI):
+    try:
+        # Importing lightrag blocks for seconds; do it off the event loop so /healthz keeps answering
+        await asyncio.to_thread(preload_rag_modules)
+        # Other embeds are loaded on their first request
+        rag = await tenants.rag(DEFAULT_EMBED_ID)
+        app.state.rag_ready = True
+        print("✅ LightRAG initialized")
+
+        # await insert_data(rag, "./mock.txt")
+    except Exception as e:
+        print(f"❌ Error initializing LightRAG: {str(e)}")
+
+    # Websites are ingested page by page by "url" jobs (app/utils/ingestion.py)
+
+# Check the storage backend is reachable
+async def probe_storage(app: FastAPI):
+    try:
+        storage = get_storage()
+        await storage.ping()
+        app.state.storage_ok = True
+        print(f"✅ Storage connection successful ({storage.name})")
+    except Exception as e:
+        print(f"❌ Error connecting to storage: {str(e)}")
+
+async def warmup(app: FastAPI):
+    started = time.perf_counter()
+    await asyncio.gather(load_rag(app), probe_storage(app))
+    app.state.warmup_seconds = round(time.perf_counter() - started, 3)
+    print(f"✅ Warmup finished in {app.state.warmup_seconds}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await write_queue.start()
+    await lead_workers.start()
+    # Ingestion workers; jobs left unfinished by a stopped process resume once their lease lapses
+    await ingest_jobs.start()
+    # The server accepts requests right away; /readyz turns 200 once warmup has loaded LightRAG
+    warmup_task = asyncio.create_task(warmup(app))
+    try:
+        yield
+    finally:
+        if not warmup_task.done():
+            warmup_task.cancel()
+            await asyncio.gather(warmup_task, return_exceptions=True)
+        # Running ingestion jobs are interrupted and resume on the next start
+        await ingest_jobs.stop()
+        # Finish queued lead capture, flush queued writes, then release connections
+        await lead_workers.stop()
+        await write_queue.stop()
+        await close_storage()
+        await tenants.close()
+        await embedding_cache.close()
+        await ingest_jobs.close()
+        await ingest_index.close()
+        shutdown_extract_pool()
+
+
 # --- FastAPI Application Setup ---
 app = FastAPI(
     title="RAG-Powered Embed API",
     description="API using LightRAG for responses, with Supabase for history storage and SSE streaming.",
-    version="0.6.0"
+    version="0.6.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -39,34 +109,10 @@ app.add_middleware(
 )
 
 # Initialize application state
-app.state.frontend_url = None
-app.state.rag = None
-
-# Initialize LightRAG
-@app.on_event("startup")
-async def initialize_lightrag():
-    try:
-        rag = asyncio.run(initialize_rag())
-        app.state.rag = rag
-
-        # insert_data(rag, "./mock.txt")
-    except Exception as e:
-        print(f"❌ Error initializing LightRAG: {str(e)}")
-
-    
-    # Insert data from the combined.txt file
-    # scrape_site_from_sitemap("https://www.alphabase.co")
-    # insert_data(rag, "./db/www.alphabase.co/combined.txt")
-
-# Initialize Supabase tables if they don't exist
-@app.on_event("startup")
-async def initialize_supabase():
-    try:
-        supabase = await get_supabase_client()
-        supabase.table("chat_histories").select("id").limit(1).execute()
-        print("✅ Supabase connection successful")
-    except Exception as e:
-        print(f"❌ Error connecting to Supabase: {str(e)}")
+app.state.frontend_urls = {}  # embed_id -> base domain already scraped
+app.state.rag_ready = False
+app.state.storage_ok = False
+app.state.warmup_seconds = None
 
 
 # app.include_router(stream_chat_router)
@@ -76,6 +122,8 @@ app.include_router(widget_router)
 app.include_router(ingestion_router)
 app.include_router(query_router)
 app.include_router(user_chats_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
 
 if __name__ == "__main__":
     import uvicorn
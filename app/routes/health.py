@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return JSONResponse(content={"status": "ok"})
+
+
+@router.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: LightRAG is loaded (default embed warm), so RAG routes can be served. 503 while warming up."""
+    state = request.app.state
+    ready = state.rag_ready
+    return JSONResponse(
+        content={
+            "status": "ready" if ready else "starting",
+            "rag": ready,
+            "storage": state.storage_ok,
+            "warmup_seconds": state.warmup_seconds,
+        },
+        status_code=200 if ready else 503,
+    )
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Path, Response, status, Request, BackgroundTasks, Depends
+from typing import Optional
 
-from app.types.types import HistoryResponse, ChatMessage
-from app.utils.supabase import get_session_history, delete_session_history
+from fastapi import APIRouter, Path, Query, Response, status, Request, BackgroundTasks, Depends
+
+from app.types.types import HistoryResponse
+from app.utils.supabase import get_session_history_json, delete_session_history
 from app.utils.utils import process_frontend_url
 from app.utils.auth import authenticate_request
 
@@ -13,6 +15,8 @@ async def get_chat_history(
     background_tasks: BackgroundTasks,
     embed_id: str = Path(..., title="The ID of the embed configuration"),
     session_id: str = Path(..., title="The specific session ID"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Only return the most recent N messages"),
+    before: Optional[str] = Query(None, description="Cursor (next_cursor) to load messages older than a previous page"),
     # _auth: bool = Depends(authenticate_request)
 ):
     frontend_url = request.headers.get("origin") or request.headers.get("referer")
@@ -20,15 +24,11 @@ async def get_chat_history(
     
     # Process the frontend URL in the background
     if frontend_url:
-        background_tasks.add_task(process_frontend_url, request.app, frontend_url)
+        background_tasks.add_task(process_frontend_url, request.app, frontend_url, embed_id)
 
-    # Get session history from Supabase
-    session_history_dicts = await get_session_history(session_id)
-    print(f"Found {len(session_history_dicts)} messages in history for session {session_id}")
-    
-    # Convert to Pydantic models
-    session_history_models = [ChatMessage(**msg) for msg in session_history_dicts]
-    return HistoryResponse(history=session_history_models)
+    # Served from the history cache when warm, already serialized as a HistoryResponse
+    body = await get_session_history_json(session_id, limit=limit, before=before)
+    return Response(content=body, media_type="application/json")
 
 
 @router.delete("/embed/{embed_id}/{session_id}", status_code=status.HTTP_200_OK)
@@ -1,5 +1,8 @@
 import os
 import asyncio
+import shutil
+import uuid
+from dotenv import load_dotenv
 from typing import Optional
 from urllib.parse import unquote
 
@@ -9,61 +12,118 @@ from pydantic import HttpUrl
 
 from app.utils.auth import authenticate_request
 
-from app.utils.scrape_website import scrape_site_from_sitemap
-from app.utils.lightrag_init import insert_data
-from app.utils.doc_support import extract_pdf_text, extract_docx_text, extract_txt_text, get_file_type
+from app.utils.ingestion import ingest_jobs
+from app.utils.ingest_jobs import INGEST_UPLOADS_DIR
+from app.utils.tenants import validate_embed_id
+from app.utils.doc_support import get_file_type
+
+# Load environment variables
+load_dotenv()
+
+# Largest accepted upload, and the size of the pieces it's copied to disk in
+INGEST_MAX_UPLOAD_MB = float(os.getenv("INGEST_MAX_UPLOAD_MB", "50"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 router = APIRouter()
 
+
+async def _spool_upload(upload: UploadFile, path: str, max_bytes: int) -> int:
+    """Copies an upload to `path` one piece at a time; 413 once it's over `max_bytes`."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File is too large. The limit is {INGEST_MAX_UPLOAD_MB:g} MB.")
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, os.path.dirname(path), True)
+        raise
+    return size
+
+
 # ---------- 🚀 FastAPI Endpoint ----------
 
 @router.post("/ingest/file")
-async def ingest(request: Request, file: UploadFile = File(...), _auth: bool = Depends(authenticate_request)):
-    file_bytes = await file.read()
+async def ingest(
+    request: Request,
+    file: UploadFile = File(...),
+    embed_id: str = Form("default"),  # Knowledge base the document is added to
+    _auth: bool = Depends(authenticate_request)
+):
+    validate_embed_id(embed_id)
+    max_bytes = int(INGEST_MAX_UPLOAD_MB * 1024 * 1024)
+    # Starlette has already spooled the multipart body to a temp file; refuse big ones before copying
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is too large. The limit is {INGEST_MAX_UPLOAD_MB:g} MB.")
     file_type = get_file_type(file.filename, file.content_type)
 
     if file_type == 'unsupported':
         raise HTTPException(status_code=400, detail="Unsupported file type. Only PDF, DOCX, TXT allowed.")
 
-    # Route to appropriate extractor
-    if file_type == 'pdf':
-        extracted_text = extract_pdf_text(file_bytes)
-    elif file_type == 'docx':
-        extracted_text = extract_docx_text(file_bytes)
-    elif file_type == 'txt':
-        extracted_text = extract_txt_text(file_bytes)
+    # The upload is kept on disk until the job is done, so the job survives a restart
+    job_id = uuid.uuid4().hex
+    upload_path = os.path.join(INGEST_UPLOADS_DIR, job_id, f"upload.{file_type}")
+    await _spool_upload(file, upload_path, max_bytes)
 
-    os.makedirs("db/documents", exist_ok=True)
-    with open(f"db/documents/{file.filename}", "w", encoding="utf-8") as f:
-        f.write(extracted_text)
+    # Content the knowledge base already has is skipped by the ingest index (see insert_document)
+    job = await ingest_jobs.submit(embed_id, "file", upload_path, name=os.path.basename(file.filename), job_id=job_id)
 
-    # Check if extracted text is empty
-    if not extracted_text or extracted_text.strip() == "":
-        raise HTTPException(status_code=400, detail="Extracted text is empty. Cannot process document.")
-
-    # TODO: add a index or check to avoid double adding a document
-    insert_data(request.app.state.rag, f"db/documents/{file.filename}")
-
-    return JSONResponse(content={
+    return JSONResponse(status_code=202, content={
         "type": "document",
-        "file_name": file.filename,
+        "file_name": job.name,
         "file_type": file_type,
+        "job_id": job.id,
+        "status": job.status,
     })
 
 
 @router.post("/ingest/url")
-async def ingest(request: Request, url: str, _auth: bool = Depends(authenticate_request)):
+async def ingest(
+    request: Request,
+    url: str,
+    embed_id: str = "default",  # Knowledge base the site is added to
+    _auth: bool = Depends(authenticate_request)
+):
+    validate_embed_id(embed_id)
     url = unquote(url)
-    folder = scrape_site_from_sitemap(url)
+    job = await ingest_jobs.submit(embed_id, "url", url)
+
+    return JSONResponse(status_code=202, content={
+        "type": "website",
+        "url": url,
+        "job_id": job.id,
+        "status": job.status,
+    })
+
 
-    if os.path.exists(f"{folder}/combined.txt"):
-        insert_data(request.app.state.rag, f"{folder}/combined.txt")
-        
-        return JSONResponse(content={
-            "type": "website",
-            "url": url,
-        })
+@router.get("/ingest/jobs")
+async def list_ingest_jobs(
+    embed_id: str = "default",
+    limit: int = 20,
+    _auth: bool = Depends(authenticate_request)
+):
+    validate_embed_id(embed_id)
+    jobs = await ingest_jobs.list(embed_id, max(1, min(limit, 100)))
+    return JSONResponse(content={"jobs": [job.as_dict() for job in jobs]})
 
 
+@router.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str, _auth: bool = Depends(authenticate_request)):
+    job = await ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    return JSONResponse(content=job.as_dict())
 
 
+@router.post("/ingest/jobs/{job_id}/cancel")
+async def cancel_ingest_job(job_id: str, _auth: bool = Depends(authenticate_request)):
+    job = await ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    return JSONResponse(content=job.as_dict())
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from app.utils.auth import authenticate_request
+from app.utils.admission import admission
+from app.utils.answer_cache import answer_cache
+from app.utils.embedding_cache import embedding_cache
+from app.utils.ingest_index import ingest_index
+from app.utils.ingest_jobs import ingest_jobs
+from app.utils.query_router import query_router
+from app.utils.supabase import history_cache, known_user_chats, lead_workers, write_queue
+from app.utils.tenants import tenants
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(_auth: bool = Depends(authenticate_request)):
+    """In-process counters for caches and background queues of this worker."""
+    return JSONResponse(content={
+        "user_chat_cache": known_user_chats.stats(),
+        "history_cache": history_cache.stats(),
+        "write_queue": write_queue.stats(),
+        "lead_workers": lead_workers.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "query_router": query_router.stats(),
+        "admission": admission.stats(),
+        "tenants": tenants.stats(),
+        "ingest_jobs": ingest_jobs.stats(),
+        "ingest_index": ingest_index.stats(),
+    })
@@ -2,9 +2,13 @@ import asyncio
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 
-from app.utils.lightrag_init import query_rag, stream_query_rag, initialize_rag
+from app.utils.lightrag_init import query_rag, stream_query_rag
 from app.utils.auth import authenticate_request
+from app.utils.admission import admission
+from app.utils.query_router import QueryTrace, validate_mode
+from app.utils.tenants import tenants, validate_embed_id
 
 router = APIRouter()
 
@@ -13,30 +17,59 @@ router = APIRouter()
 async def query(
     request: Request,
     query: str,
+    embed_id: str = "default",  # Knowledge base to query; also the admission control tenant
+    mode: str = "auto",  # LightRAG query mode; "auto" lets the query router pick one
     _auth: bool = Depends(authenticate_request)   # <-- Universal authenticator dependency
 ):
-    rag = request.app.state.rag
-    if rag is None:
+    validate_embed_id(embed_id)
+    validate_mode(mode)
+    if not request.app.state.rag_ready:
         return JSONResponse(content={"error": "LightRAG system is not initialized."}, status_code=503)
 
-    response = query_rag(rag, query)
-    return JSONResponse(content={"response": response})
+    # 429 with Retry-After when this worker is saturated
+    async with admission.slot(embed_id):
+        lease = await tenants.acquire(embed_id)
+        try:
+            trace = QueryTrace()
+            response = await query_rag(lease.rag, query, embed_id, mode, trace)
+        finally:
+            lease.release()
+    # The chosen mode and per-stage timings are reported alongside the answer
+    return JSONResponse(content={"response": response, "routing": trace.as_dict()})
 
 @router.get("/stream-query")
 async def stream_query(
     request: Request, 
     query: str,
+    embed_id: str = "default",  # Knowledge base to query; also the admission control tenant
+    mode: str = "auto",  # LightRAG query mode; "auto" lets the query router pick one
     _auth: bool = Depends(authenticate_request)   # <-- Universal authenticator dependency
 ):
-    rag = request.app.state.rag
-    if rag is None:
+    validate_embed_id(embed_id)
+    validate_mode(mode)
+    if not request.app.state.rag_ready:
         return JSONResponse(content={"error": "LightRAG system is not initialized."}, status_code=503)
 
+    # Admitted before streaming starts so overload is a clean 429; the slot is held until the stream ends
+    ticket = await admission.admit(embed_id)
+    try:
+        lease = await tenants.acquire(embed_id)
+    except BaseException:
+        ticket.release()
+        raise
+
+    def release():
+        lease.release()
+        ticket.release()
+
     async def stream_generator():
         try:
-            async for chunk in stream_query_rag(rag, query):
+            async for chunk in stream_query_rag(lease.rag, query, embed_id, mode):
                 yield chunk
         except Exception as e:
             yield f"[Streaming error: {str(e)}]"
+        finally:
+            release()
 
-    return StreamingResponse(stream_generator(), media_type="text/plain")
+    # The background task releases the slot if the stream never started (client gone)
+    return StreamingResponse(stream_generator(), media_type="text/plain", background=BackgroundTask(release))
@@ -3,14 +3,17 @@ import json
 import uuid
 from fastapi import APIRouter, Path, Body, HTTPException, status, Request, Depends
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import ValidationError
 
 # from app.utils.auth import authenticate_request
 
 from app.types.types import StreamChatRequest
 from app.utils.utils import format_sse_chunk
-from app.utils.supabase import save_message, ensure_user_chat_record, get_supabase_client
+from app.utils.sse import SSEWriter
+from app.utils.supabase import save_message, ensure_user_chat_record
 from app.utils.lightrag_init import query_rag, stream_query_rag
+from app.utils.tenants import tenants, validate_embed_id
 
 router = APIRouter()
 
@@ -47,8 +50,13 @@ async def stream_chat_rag(
 
     assistant_message_uuid = str(uuid.uuid4())
 
-    # --- Check if RAG is initialized ---
-    rag = request.app.state.rag
+    # --- Check if RAG is initialized, and load this embed's knowledge base ---
+    validate_embed_id(embed_id)
+    rag = None
+    lease = None
+    if request.app.state.rag_ready:
+        lease = await tenants.acquire(embed_id)
+        rag = lease.rag
     early_exit_data = None # Store data for early exit chunks
     sources = []
     
@@ -97,8 +105,12 @@ async def stream_chat_rag(
         # await asyncio.sleep(0.2)
 
         accumulated_text = ""
-        try:
-            async for chunk in stream_query_rag(rag, user_message_text):
+        # Renders the chunk envelope once and merges token-sized chunks into fewer frames
+        writer = SSEWriter(assistant_message_uuid)
+
+        async def text_chunks():
+            nonlocal accumulated_text
+            async for chunk in stream_query_rag(rag, user_message_text, embed_id):
                 if isinstance(chunk, str):
                     chunk_text = chunk
                 elif isinstance(chunk, dict) and "text" in chunk:
@@ -109,27 +121,16 @@ async def stream_chat_rag(
                     chunk_text = str(chunk)
                 
                 accumulated_text += chunk_text
-                
-                text_chunk_data = {
-                    "uuid": assistant_message_uuid,
-                    "type": "textResponseChunk",
-                    "textResponse": chunk_text,
-                    "sources": [],
-                    "close": False,
-                    "error": False,
-                }
-                yield format_sse_chunk(text_chunk_data)
+                yield chunk_text
+
+        try:
+            async for frame in writer.frames(text_chunks()):
+                yield frame
         except Exception as e:
             print(f"Error during streaming: {str(e)}")
-            error_chunk = {
-                "uuid": assistant_message_uuid,
-                "type": "textResponseChunk",
-                "textResponse": f" [Error during streaming: {str(e)}]",
-                "sources": [],
-                "close": False,
-                "error": True,
-            }
-            yield format_sse_chunk(error_chunk)
+            yield writer.frame(f" [Error during streaming: {str(e)}]", error=True)
+        finally:
+            lease.release()
 
         complete_data = {
             "uuid": assistant_message_uuid,
@@ -165,4 +166,4 @@ async def stream_chat_rag(
 
     return StreamingResponse(rag_stream_generator(), media_type="text/event-stream", headers={
         "Cache-Control": "no-cache", "Connection": "keep-alive", "Access-Control-Allow-Origin": "*",
-    })
+    }, background=BackgroundTask(lease.release))
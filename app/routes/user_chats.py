@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import APIRouter, Path, HTTPException, status, Query
 from app.types.types import UserChatsResponse
 
@@ -15,7 +17,8 @@ async def list_user_chats(
     embed_id: str = Path(..., title="The ID of the embed configuration", min_length=1),
     client_user_id: str = Path(..., title="The unique ID of the client user", min_length=1),
     limit: int = Query(20, ge=1, le=100, description="Number of chat sessions to return"),
-    offset: int = Query(0, ge=0, description="Offset for pagination"),
+    offset: int = Query(0, ge=0, description="Offset for pagination (prefer `cursor`)"),
+    cursor: Optional[str] = Query(None, description="Cursor (next_cursor) from the previous page"),
     # auth_result: bool = Depends(authenticate_request) # Uncomment if auth is needed
 ):
     """
@@ -25,11 +28,11 @@ async def list_user_chats(
     print(f"Received request for /chats: embed_id={embed_id}, client_user_id={client_user_id}")
     
     try:
-        chat_sessions_data = await fetch_user_chat_sessions(
-            client_user_id, embed_id, limit, offset
+        chat_sessions_data, next_cursor = await fetch_user_chat_sessions(
+            client_user_id, embed_id, limit, offset, before=cursor
         )
         
-        return UserChatsResponse(chats=chat_sessions_data)
+        return UserChatsResponse(chats=chat_sessions_data, next_cursor=next_cursor)
 
     except HTTPException:
         raise # Re-raise HTTPExceptions from fetch_user_chat_sessions
@@ -7,11 +7,14 @@ from pydantic import ValidationError, BaseModel
 import httpx
 from typing import AsyncGenerator, Dict, Any
 from app.utils.utils import format_sse_chunk
+from app.utils.sse import SSEWriter
 import os
 
 from app.utils.auth import authenticate_request
 from app.types.types import StreamChatRequest
-from app.utils.supabase import save_message, ensure_user_chat_record, get_supabase_client
+from app.utils.supabase import save_message, ensure_user_chat_record
+from app.utils.admission import admission
+from app.utils.tenants import validate_embed_id
 
 router = APIRouter()
 
@@ -29,6 +32,7 @@ async def chat_rag(
     Handles chat requests, sending the query to n8n for processing
     and returns the response in the same format as a streaming response, but without actual streaming.
     """
+    validate_embed_id(embed_id)
     request_uuid = str(uuid.uuid4()) + "1fd"
     print(f"Request ID: {request_uuid}")
     print(f"Received chat request for embed_id: {embed_id}")
@@ -80,11 +84,13 @@ async def chat_rag(
     #     })
 
     try:
-        async with httpx.AsyncClient() as client:
-            n8n_response = await client.post(N8N_WEBHOOK_URL, json={"query_text": user_message_text, "session_id": session_id})
-            n8n_response.raise_for_status()
-            n8n_data = n8n_response.json()
-            print(f"Received response from n8n: {n8n_data}")
+        # Per-embed admission control; raises 429 with Retry-After when saturated
+        async with admission.slot(embed_id):
+            async with httpx.AsyncClient() as client:
+                n8n_response = await client.post(N8N_WEBHOOK_URL, json={"query_text": user_message_text, "session_id": session_id})
+                n8n_response.raise_for_status()
+                n8n_data = n8n_response.json()
+                print(f"Received response from n8n: {n8n_data}")
 
         if not isinstance(n8n_data, dict):
             raise ValueError("Expected a JSON object from n8n, but got a different type.")
@@ -99,9 +105,7 @@ async def chat_rag(
         
         user_message_timestamp = saved_user_message_data.get("created_at") # Get the actual timestamp
         
-        supabase_client = await get_supabase_client() # Get Supabase client for the next operation
         await ensure_user_chat_record(
-            supabase_client=supabase_client,
             client_user_id=client_user_id,
             embed_id=embed_id,
             session_id=session_id,
@@ -113,14 +117,9 @@ async def chat_rag(
         await save_message(session_id, assistant_message_entry)
         print(f"Saved assistant response for session {session_id} with UUID: {assistant_message_uuid}")
 
-        text_chunk_data = {
-            "uuid": assistant_message_uuid,
-            "type": "textResponseChunk",
-            "textResponse": assistant_message_text,
-            "sources": [],
-            "close": False,
-            "error": False,
-        }
+        # n8n answers in one piece, so there's a single textResponseChunk; the
+        # writer renders it from its pre-serialized envelope
+        writer = SSEWriter(assistant_message_uuid)
 
         # Construct the response in the same format as the final streaming chunk ("complete")
         formatted_response = {
@@ -133,7 +132,7 @@ async def chat_rag(
         }
 
         async def response_generator():
-            yield format_sse_chunk(text_chunk_data)
+            yield writer.frame(assistant_message_text)
             yield format_sse_chunk(formatted_response)
 
         return StreamingResponse(response_generator(), media_type="text/event-stream", headers={
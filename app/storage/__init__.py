@@ -0,0 +1,43 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from app.storage.base import (
+    CHAT_HISTORY_TABLE,
+    LEAD_CAPTURE_TABLE,
+    USER_CHATS_TABLE,
+    Keyset,
+    StorageBackend,
+)
+
+# Load environment variables
+load_dotenv()
+
+# "supabase" (default) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Returns the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "sqlite":
+            from app.storage.sqlite_backend import SQLiteStorage
+            _storage = SQLiteStorage()
+        elif STORAGE_BACKEND == "supabase":
+            from app.storage.supabase_backend import SupabaseStorage
+            _storage = SupabaseStorage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'. Use 'supabase' or 'sqlite'.")
+    return _storage
+
+
+async def close_storage() -> None:
+    """Closes the backend's connections; the next get_storage() builds a fresh one."""
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
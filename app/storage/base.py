@@ -0,0 +1,70 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Table names
+CHAT_HISTORY_TABLE = "chat_histories"
+LEAD_CAPTURE_TABLE = "lead_capture_form"
+USER_CHATS_TABLE = "user_chats"
+
+# (timestamp, tiebreaker) position of the last row of the previous page
+Keyset = Tuple[str, str]
+
+
+class StorageBackend(ABC):
+    """
+    Persistence for chat history, user chat sessions and captured leads.
+
+    Rows use the same column names in every backend. History rows carry
+    role, content, uuid and created_at; pages are keyset-paginated on
+    (created_at, uuid) for history and (last_interacted_at, session_id)
+    for user chats, newest first.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Bulk-inserts rows (all with the same keys) into one table."""
+
+    @abstractmethod
+    async def update_message(self, session_id: str, message_uuid: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Updates a chat message in place; returns the updated row or None if it doesn't exist."""
+
+    @abstractmethod
+    async def fetch_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Every message of a session, oldest first."""
+
+    @abstractmethod
+    async def fetch_history_page(self, session_id: str, limit: int, before: Optional[Keyset] = None) -> List[Dict[str, Any]]:
+        """Up to `limit` messages older than `before`, newest first."""
+
+    @abstractmethod
+    async def delete_history(self, session_id: str) -> bool:
+        """Deletes a session's messages; False if there were none."""
+
+    @abstractmethod
+    async def ensure_user_chat(self, row: Dict[str, Any]) -> None:
+        """Inserts a user_chats row unless one exists for its (client_user_id, embed_id, session_id)."""
+
+    @abstractmethod
+    async def list_user_chats(
+        self,
+        client_user_id: str,
+        embed_id: str,
+        limit: int,
+        offset: int = 0,
+        before: Optional[Keyset] = None,
+    ) -> List[Dict[str, Any]]:
+        """Up to `limit` user_chats rows, most recently active first."""
+
+    @abstractmethod
+    async def last_messages(self, session_ids: List[str], since: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """Latest message (content, role) per session. `since` is a hint that the last messages are newer than it."""
+
+    @abstractmethod
+    async def ping(self) -> None:
+        """Raises if the backend cannot be reached."""
+
+    async def close(self) -> None:
+        """Releases connections held by the backend."""
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.storage.base import (
+    CHAT_HISTORY_TABLE,
+    LEAD_CAPTURE_TABLE,
+    USER_CHATS_TABLE,
+    Keyset,
+    StorageBackend,
+)
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./db/chat.sqlite3")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {CHAT_HISTORY_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    uuid TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_histories_session_created
+    ON {CHAT_HISTORY_TABLE} (session_id, created_at, uuid);
+
+CREATE TABLE IF NOT EXISTS {USER_CHATS_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_user_id TEXT NOT NULL,
+    embed_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    title TEXT,
+    first_message_preview TEXT,
+    created_at TEXT NOT NULL,
+    last_interacted_at TEXT NOT NULL,
+    UNIQUE (client_user_id, embed_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS idx_user_chats_recent
+    ON {USER_CHATS_TABLE} (client_user_id, embed_id, last_interacted_at);
+CREATE INDEX IF NOT EXISTS idx_user_chats_session
+    ON {USER_CHATS_TABLE} (session_id);
+
+CREATE TABLE IF NOT EXISTS {LEAD_CAPTURE_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_message_uuid TEXT UNIQUE,
+    session_id TEXT NOT NULL,
+    detected_name TEXT,
+    detected_email TEXT,
+    detected_phone TEXT,
+    original_message_content TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_lead_capture_session
+    ON {LEAD_CAPTURE_TABLE} (session_id);
+
+-- Same job as the trigger on Supabase: keep user_chats.last_interacted_at current
+CREATE TRIGGER IF NOT EXISTS trg_chat_histories_touch_user_chats
+AFTER INSERT ON {CHAT_HISTORY_TABLE}
+BEGIN
+    UPDATE {USER_CHATS_TABLE}
+    SET last_interacted_at = NEW.created_at
+    WHERE session_id = NEW.session_id AND last_interacted_at < NEW.created_at;
+END;
+"""
+
+# Columns accepted by insert_rows, per table
+COLUMNS = {
+    CHAT_HISTORY_TABLE: ("session_id", "role", "content", "uuid", "created_at"),
+    USER_CHATS_TABLE: ("client_user_id", "embed_id", "session_id", "title", "first_message_preview", "created_at", "last_interacted_at"),
+    LEAD_CAPTURE_TABLE: ("chat_message_uuid", "session_id", "detected_name", "detected_email", "detected_phone", "original_message_content"),
+}
+
+# Fixed statement texts, so sqlite3's statement cache keeps them prepared
+SQL_UPDATE_MESSAGE = f"UPDATE {CHAT_HISTORY_TABLE} SET role = ?, content = ? WHERE session_id = ? AND uuid = ?"
+SQL_SELECT_MESSAGE = f"SELECT role, content, uuid, created_at FROM {CHAT_HISTORY_TABLE} WHERE session_id = ? AND uuid = ?"
+SQL_HISTORY = f"""
+    SELECT role, content, uuid, created_at FROM {CHAT_HISTORY_TABLE}
+    WHERE session_id = ? ORDER BY created_at, uuid
+"""
+SQL_HISTORY_PAGE = f"""
+    SELECT role, content, uuid, created_at FROM {CHAT_HISTORY_TABLE}
+    WHERE session_id = ? ORDER BY created_at DESC, uuid DESC LIMIT ?
+"""
+SQL_HISTORY_PAGE_BEFORE = f"""
+    SELECT role, content, uuid, created_at FROM {CHAT_HISTORY_TABLE}
+    WHERE session_id = ? AND (created_at, uuid) < (?, ?)
+    ORDER BY created_at DESC, uuid DESC LIMIT ?
+"""
+SQL_DELETE_HISTORY = f"DELETE FROM {CHAT_HISTORY_TABLE} WHERE session_id = ?"
+SQL_USER_CHATS = f"""
+    SELECT session_id, title, first_message_preview, last_interacted_at FROM {USER_CHATS_TABLE}
+    WHERE client_user_id = ? AND embed_id = ?
+    ORDER BY last_interacted_at DESC, session_id DESC LIMIT ? OFFSET ?
+"""
+SQL_USER_CHATS_BEFORE = f"""
+    SELECT session_id, title, first_message_preview, last_interacted_at FROM {USER_CHATS_TABLE}
+    WHERE client_user_id = ? AND embed_id = ? AND (last_interacted_at, session_id) < (?, ?)
+    ORDER BY last_interacted_at DESC, session_id DESC LIMIT ?
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded SQLite backend for local load tests and single-node deployments.
+
+    One connection in WAL mode, driven from a single dedicated thread so
+    queries never block the event loop and never race each other.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._insert_sql: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    def _insert_statement(self, table: str, columns: Tuple[str, ...]) -> str:
+        key = (table, columns)
+        sql = self._insert_sql.get(key)
+        if sql is None:
+            allowed = COLUMNS.get(table)
+            if allowed is None or any(column not in allowed for column in columns):
+                raise ValueError(f"Unsupported insert into {table}: {columns}")
+            placeholders = ", ".join("?" for _ in columns)
+            sql = f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            self._insert_sql[key] = sql
+        return sql
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        columns = tuple(rows[0].keys())
+        sql = self._insert_statement(table, columns)
+        values = [tuple(row[column] for column in columns) for row in rows]
+
+        def work(conn):
+            with conn:
+                conn.executemany(sql, values)
+
+        await self._run(work)
+
+    async def update_message(self, session_id: str, message_uuid: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def work(conn):
+            with conn:
+                conn.execute(SQL_UPDATE_MESSAGE, (data["role"], data["content"], session_id, message_uuid))
+            row = conn.execute(SQL_SELECT_MESSAGE, (session_id, message_uuid)).fetchone()
+            return dict(row) if row else None
+
+        return await self._run(work)
+
+    async def fetch_history(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._run(lambda conn: [dict(row) for row in conn.execute(SQL_HISTORY, (session_id,))])
+
+    async def fetch_history_page(self, session_id: str, limit: int, before: Optional[Keyset] = None) -> List[Dict[str, Any]]:
+        if before:
+            sql, params = SQL_HISTORY_PAGE_BEFORE, (session_id, before[0], before[1], limit)
+        else:
+            sql, params = SQL_HISTORY_PAGE, (session_id, limit)
+        return await self._run(lambda conn: [dict(row) for row in conn.execute(sql, params)])
+
+    async def delete_history(self, session_id: str) -> bool:
+        def work(conn):
+            with conn:
+                return conn.execute(SQL_DELETE_HISTORY, (session_id,)).rowcount > 0
+
+        return await self._run(work)
+
+    async def ensure_user_chat(self, row: Dict[str, Any]) -> None:
+        row = dict(row)
+        row.setdefault("created_at", _now())
+        row.setdefault("last_interacted_at", row["created_at"])
+        await self.insert_rows(USER_CHATS_TABLE, [row])
+
+    async def list_user_chats(
+        self,
+        client_user_id: str,
+        embed_id: str,
+        limit: int,
+        offset: int = 0,
+        before: Optional[Keyset] = None,
+    ) -> List[Dict[str, Any]]:
+        if before:
+            sql, params = SQL_USER_CHATS_BEFORE, (client_user_id, embed_id, before[0], before[1], limit)
+        else:
+            sql, params = SQL_USER_CHATS, (client_user_id, embed_id, limit, offset)
+        return await self._run(lambda conn: [dict(row) for row in conn.execute(sql, params)])
+
+    async def last_messages(self, session_ids: List[str], since: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        if not session_ids:
+            return {}
+        # The (session_id, created_at, uuid) index makes this one seek per session
+        placeholders = ", ".join("?" for _ in session_ids)
+        sql = f"""
+            SELECT session_id, content, role FROM (
+                SELECT session_id, content, role,
+                       ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_at DESC, uuid DESC) AS position
+                FROM {CHAT_HISTORY_TABLE} WHERE session_id IN ({placeholders})
+            ) WHERE position = 1
+        """
+        rows = await self._run(lambda conn: conn.execute(sql, tuple(session_ids)).fetchall())
+        return {row["session_id"]: dict(row) for row in rows}
+
+    async def ping(self) -> None:
+        await self._run(lambda conn: conn.execute("SELECT 1").fetchone())
+
+    async def close(self) -> None:
+        def work(_conn):
+            _conn.close()
+
+        if self._conn is not None:
+            await self._run(work)
+            self._conn = None
+        self._executor.shutdown(wait=True)
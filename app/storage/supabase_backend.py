@@ -0,0 +1,233 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from app.storage.base import (
+    CHAT_HISTORY_TABLE,
+    USER_CHATS_TABLE,
+    Keyset,
+    StorageBackend,
+)
+
+# Connection pool settings for the shared PostgREST HTTP client
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_KEEPALIVE = int(os.getenv("SUPABASE_KEEPALIVE", "10"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+
+# Postgres function returning one row (session_id, content, role) per session;
+# see "Chat list last messages" in README.md
+LAST_MESSAGES_RPC = "last_chat_messages"
+# Without the function: rows the one fallback query may return
+SUPABASE_LAST_MESSAGE_ROWS = int(os.getenv("SUPABASE_LAST_MESSAGE_ROWS", "1000"))
+# last_interacted_at is bumped by a trigger when a message lands, so a session's
+# last message sits within a few moments of it
+LAST_MESSAGE_WINDOW_SLACK = timedelta(minutes=5)
+# PostgREST's "function not found" and Postgres' "undefined function"
+MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+
+def _quote_filter_value(value: str) -> str:
+    """Double-quotes a value for use inside a PostgREST logic filter."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _keyset_filter(order_column: str, order_value: str, tie_column: str, tie_value: str) -> str:
+    """Builds the or_() filter for rows strictly after (order_value, tie_value) in descending order."""
+    order_value = _quote_filter_value(order_value)
+    tie_value = _quote_filter_value(tie_value)
+    return (
+        f"{order_column}.lt.{order_value},"
+        f"and({order_column}.eq.{order_value},{tie_column}.lt.{tie_value})"
+    )
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase (PostgREST) backend over one pooled keep-alive HTTP client."""
+
+    name = "supabase"
+
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
+        url = url or os.getenv("SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+
+        headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+        }
+        http_client = httpx.AsyncClient(
+            base_url=f"{url}/rest/v1",
+            headers=headers,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_SIZE,
+                max_keepalive_connections=SUPABASE_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        )
+        self.client = AsyncPostgrestClient(
+            f"{url}/rest/v1",
+            headers=headers,
+            http_client=http_client,
+        )
+        # None until ping() (at startup) or the first call tells whether LAST_MESSAGES_RPC exists
+        self._has_last_messages_rpc: Optional[bool] = None
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        await self.client.table(table).insert(rows, returning=ReturnMethod.minimal).execute()
+
+    async def update_message(self, session_id: str, message_uuid: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        result = await self.client.table(CHAT_HISTORY_TABLE) \
+            .update(data) \
+            .eq("session_id", session_id) \
+            .eq("uuid", message_uuid) \
+            .execute()
+        return result.data[0] if result.data else None
+
+    async def fetch_history(self, session_id: str) -> List[Dict[str, Any]]:
+        result = await self.client.table(CHAT_HISTORY_TABLE) \
+            .select("role, content, uuid, created_at") \
+            .eq("session_id", session_id) \
+            .order("created_at") \
+            .order("uuid") \
+            .execute()
+        return result.data or []
+
+    async def fetch_history_page(self, session_id: str, limit: int, before: Optional[Keyset] = None) -> List[Dict[str, Any]]:
+        query = self.client.table(CHAT_HISTORY_TABLE) \
+            .select("role, content, uuid, created_at") \
+            .eq("session_id", session_id)
+        if before:
+            query = query.or_(_keyset_filter("created_at", before[0], "uuid", before[1]))
+        result = await query \
+            .order("created_at", desc=True) \
+            .order("uuid", desc=True) \
+            .limit(limit) \
+            .execute()
+        return result.data or []
+
+    async def delete_history(self, session_id: str) -> bool:
+        # First check if there are any messages for this session
+        count_result = await self.client.table(CHAT_HISTORY_TABLE) \
+            .select("id", count="exact") \
+            .eq("session_id", session_id) \
+            .limit(1) \
+            .execute()
+
+        if count_result.count == 0:
+            return False
+
+        await self.client.table(CHAT_HISTORY_TABLE) \
+            .delete() \
+            .eq("session_id", session_id) \
+            .execute()
+        return True
+
+    async def ensure_user_chat(self, row: Dict[str, Any]) -> None:
+        # A single INSERT ... ON CONFLICT DO NOTHING on the (client_user_id, embed_id, session_id)
+        # unique constraint: creates the row once and is a no-op for existing or concurrently created rows.
+        await self.client.table(USER_CHATS_TABLE) \
+            .upsert(
+                row,
+                on_conflict="client_user_id,embed_id,session_id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal,
+            ) \
+            .execute()
+
+    async def list_user_chats(
+        self,
+        client_user_id: str,
+        embed_id: str,
+        limit: int,
+        offset: int = 0,
+        before: Optional[Keyset] = None,
+    ) -> List[Dict[str, Any]]:
+        query = self.client.table(USER_CHATS_TABLE) \
+            .select("session_id, title, first_message_preview, last_interacted_at") \
+            .eq("client_user_id", client_user_id) \
+            .eq("embed_id", embed_id)
+        if before:
+            query = query.or_(_keyset_filter("last_interacted_at", before[0], "session_id", before[1]))
+
+        query = query \
+            .order("last_interacted_at", desc=True) \
+            .order("session_id", desc=True) \
+            .limit(limit)
+        if not before and offset:
+            query = query.offset(offset)
+        result = await query.execute()
+        return result.data or []
+
+    async def last_messages(self, session_ids: List[str], since: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetches the latest message of every session, never more than one row
+        per session.
+
+        Uses the LAST_MESSAGES_RPC function (DISTINCT ON over the
+        (session_id, created_at) index) in one round trip. Without it, one
+        query reads the sessions' messages since the page's oldest
+        last_interacted_at, ordered by session and newest first, capped at
+        SUPABASE_LAST_MESSAGE_ROWS rows; the first row of each session is its
+        last message. Sessions cut off by the cap get no last message.
+        """
+        if not session_ids:
+            return {}
+
+        if self._has_last_messages_rpc is not False:
+            try:
+                response = await self.client.rpc(LAST_MESSAGES_RPC, {"session_ids": session_ids}).execute()
+                self._has_last_messages_rpc = True
+                return {row["session_id"]: row for row in response.data or []}
+            except APIError as e:
+                if e.code not in MISSING_FUNCTION_CODES:
+                    raise
+                self._has_last_messages_rpc = False
+                print(f"⚠️ Supabase function {LAST_MESSAGES_RPC} not found, fetching last messages with a capped query")
+
+        query = self.client.table(CHAT_HISTORY_TABLE) \
+            .select("session_id, content, role") \
+            .in_("session_id", session_ids)
+        if since is not None:
+            query = query.gte("created_at", (since - LAST_MESSAGE_WINDOW_SLACK).isoformat())
+        response = await query \
+            .order("session_id") \
+            .order("created_at", desc=True) \
+            .order("uuid", desc=True) \
+            .limit(SUPABASE_LAST_MESSAGE_ROWS) \
+            .execute()
+
+        last_messages: Dict[str, Dict[str, Any]] = {}
+        for row in response.data or []:
+            last_messages.setdefault(row["session_id"], row)
+        if len(response.data or []) >= SUPABASE_LAST_MESSAGE_ROWS and len(last_messages) < len(session_ids):
+            print(f"⚠️ Last-message query hit SUPABASE_LAST_MESSAGE_ROWS; "
+                  f"{len(session_ids) - len(last_messages)} session(s) shown without one. Install {LAST_MESSAGES_RPC}")
+        return last_messages
+
+    async def _check_last_messages_rpc(self) -> None:
+        try:
+            await self.client.rpc(LAST_MESSAGES_RPC, {"session_ids": []}).execute()
+        except APIError as e:
+            if e.code not in MISSING_FUNCTION_CODES:
+                raise
+            self._has_last_messages_rpc = False
+            print(f"⚠️ Supabase function {LAST_MESSAGES_RPC} is missing; create it as shown in README.md "
+                  f"(\"Chat list last messages\"). Until then the chat list reads last messages with a capped query")
+        else:
+            self._has_last_messages_rpc = True
+            print(f"✅ Supabase function {LAST_MESSAGES_RPC} found")
+
+    async def ping(self) -> None:
+        await self.client.table(CHAT_HISTORY_TABLE).select("id").limit(1).execute()
+        if self._has_last_messages_rpc is None:
+            await self._check_last_messages_rpc()
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -19,6 +19,7 @@ class ChatMessage(BaseModel):
 
 class HistoryResponse(BaseModel):
     history: List[ChatMessage]
+    next_cursor: Optional[str] = None # Pass back as `before` to load older messages
 
 class ChatSessionListItem(BaseModel):
     session_id: str
@@ -34,3 +35,4 @@ class ChatSessionListItem(BaseModel):
 
 class UserChatsResponse(BaseModel):
     chats: List[ChatSessionListItem]
+    next_cursor: Optional[str] = None # Pass back as `cursor` to load the next page
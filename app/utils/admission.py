@@ -0,0 +1,251 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+# Load environment variables
+load_dotenv()
+
+# LLM-backed requests running at once in this worker, overall and per embed
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_PER_EMBED = int(os.getenv("ADMISSION_PER_EMBED", "8"))
+# Requests allowed to wait for a slot, and how long each may wait (seconds)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+# Embeds whose counters are kept; past this the least recently seen idle ones are dropped
+ADMISSION_MAX_TRACKED = int(os.getenv("ADMISSION_MAX_TRACKED", "1000"))
+
+
+class Overloaded(HTTPException):
+    """429 with a Retry-After hint, raised when a request can't be admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Server is busy ({reason}). Please retry shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class EmbedStats:
+    __slots__ = ("active", "waiting", "admitted", "queued", "rejected_full", "rejected_timeout", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.wait_total / self.queued * 1000, 1) if self.queued else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 1),
+        }
+
+
+class Ticket:
+    """An admitted request's slot. `release()` is idempotent."""
+
+    __slots__ = ("_controller", "embed_id", "_started", "_released")
+
+    def __init__(self, controller: "AdmissionController", embed_id: str):
+        self._controller = controller
+        self.embed_id = embed_id
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.embed_id, time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """
+    Caps concurrent LLM-backed requests, overall and per embed_id.
+
+    A request runs straight away when both limits allow it. Otherwise it waits
+    in its embed's queue. When a slot frees up, embeds with waiters are served
+    round-robin, so one busy embed cannot starve the others. At most
+    `max_queue` requests wait in total, and each for at most `max_wait`
+    seconds. Past either limit, `Overloaded` (429 with Retry-After) is raised
+    right away instead of letting latency pile up.
+
+    Event-loop only; not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        per_embed: int = ADMISSION_PER_EMBED,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        max_tracked: int = ADMISSION_MAX_TRACKED,
+    ):
+        self.max_concurrent = max_concurrent
+        self.per_embed = per_embed
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_tracked = max_tracked
+
+        self._active = 0
+        self._waiting = 0
+        # embed_id -> waiting futures; order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # embed_id -> counters, least recently admitted first
+        self._stats: "OrderedDict[str, EmbedStats]" = OrderedDict()
+        self.stats_evicted = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_hold = 1.0
+
+    def _embed(self, embed_id: str) -> EmbedStats:
+        stats = self._stats.get(embed_id)
+        if stats is None:
+            stats = self._stats[embed_id] = EmbedStats()
+            if len(self._stats) > self.max_tracked:
+                self._evict(embed_id)
+        else:
+            self._stats.move_to_end(embed_id)
+        return stats
+
+    def _evict(self, keep: str) -> None:
+        # Embeds with requests in flight keep their counters; there are at most
+        # max_concurrent + max_queue of those
+        for embed_id, stats in list(self._stats.items()):
+            if len(self._stats) <= self.max_tracked:
+                return
+            if embed_id != keep and not stats.active and not stats.waiting:
+                del self._stats[embed_id]
+                self.stats_evicted += 1
+
+    def _can_run(self, stats: EmbedStats) -> bool:
+        return self._active < self.max_concurrent and stats.active < self.per_embed
+
+    def retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a new request."""
+        estimate = self._avg_hold * (self._waiting + 1) / max(self.max_concurrent, 1)
+        return min(60, max(1, math.ceil(estimate)))
+
+    async def admit(self, embed_id: str) -> Ticket:
+        stats = self._embed(embed_id)
+        if self._can_run(stats):
+            self._grant(stats)
+            return Ticket(self, embed_id)
+
+        if self._waiting >= self.max_queue:
+            stats.rejected_full += 1
+            raise Overloaded("queue full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(embed_id, deque()).append(future)
+        self._waiting += 1
+        stats.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # Client went away while waiting; hand back a slot granted meanwhile
+            if future.done() and not future.cancelled():
+                Ticket(self, embed_id).release()
+            else:
+                self._forget(embed_id, future, stats)
+            raise
+
+        if not future.done():
+            self._forget(embed_id, future, stats)
+            stats.rejected_timeout += 1
+            raise Overloaded("timed out waiting for capacity", self.retry_after())
+
+        waited = time.monotonic() - started
+        stats.queued += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        return Ticket(self, embed_id)
+
+    @asynccontextmanager
+    async def slot(self, embed_id: str):
+        ticket = await self.admit(embed_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _grant(self, stats: EmbedStats) -> None:
+        self._active += 1
+        stats.active += 1
+        stats.admitted += 1
+
+    def _forget(self, embed_id: str, future: asyncio.Future, stats: EmbedStats) -> None:
+        future.cancel()
+        queue = self._queues.get(embed_id)
+        if queue is not None:
+            try:
+                queue.remove(future)
+            except ValueError:
+                pass
+            else:
+                self._waiting -= 1
+                stats.waiting -= 1
+            if not queue:
+                del self._queues[embed_id]
+
+    def _release(self, embed_id: str, held: float) -> None:
+        self._active -= 1
+        self._embed(embed_id).active -= 1
+        self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to waiting embeds, one waiter per embed per round."""
+        progressed = True
+        while progressed and self._queues and self._active < self.max_concurrent:
+            progressed = False
+            for embed_id in list(self._queues):
+                if self._active >= self.max_concurrent:
+                    break
+                stats = self._embed(embed_id)
+                if stats.active >= self.per_embed:
+                    continue
+                queue = self._queues[embed_id]
+                future = queue.popleft()
+                self._waiting -= 1
+                stats.waiting -= 1
+                if not queue:
+                    del self._queues[embed_id]
+                else:
+                    # Served this round; go to the back of the line
+                    self._queues.move_to_end(embed_id)
+                self._grant(stats)
+                future.set_result(True)
+                progressed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "per_embed": self.per_embed,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "embeds_evicted": self.stats_evicted,
+            "embeds": {embed_id: stats.as_dict() for embed_id, stats in self._stats.items()},
+        }
+
+
+# Shared controller for /query, /stream-query and /embed/{embed_id}/stream-chat
+admission = AdmissionController()
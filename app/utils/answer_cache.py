@@ -0,0 +1,176 @@
+import asyncio
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.utils.cache import TTLCache
+
+# Load environment variables
+load_dotenv()
+
+# Answers kept (0 disables the cache) and for how long, in seconds
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity above which a different question reuses an answer; 0 disables near-duplicate matching
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Signature of the embedding call: texts -> array of shape (len(texts), dim)
+EmbedFn = Callable[[List[str]], Awaitable[Any]]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """'  What are your Features?? ' and 'what are your features' share a key."""
+    return _WHITESPACE.sub(" ", query).strip().rstrip("?!.").strip().casefold()
+
+
+class CachedAnswer:
+    """An answer as it was streamed, chunk by chunk, plus its query embedding."""
+
+    __slots__ = ("chunks", "vector")
+
+    def __init__(self, chunks: List[str], vector: Optional[np.ndarray]):
+        self.chunks = chunks
+        self.vector = vector
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+class AnswerLookup(NamedTuple):
+    answer: Optional[CachedAnswer]
+    # (scope, normalized query, query mode)
+    key: Tuple[str, str, str]
+    vector: Optional[np.ndarray]
+    generation: int
+
+
+class AnswerCache:
+    """
+    Cache of RAG answers keyed by scope (the embed_id), normalized query text
+    and the query mode that was asked for ("auto" or an explicit mode).
+
+    A lookup first tries the exact normalized query. When that misses and an
+    `embed_fn` is given, the query is embedded and compared against the cached
+    queries of the same scope and mode, and the closest answer with cosine
+    similarity >= `similarity` is reused. The query is only embedded during
+    the lookup when there are cached answers to compare it with; otherwise
+    `store` embeds it in the background, after the answer has been sent. Entries are LRU-evicted past
+    `maxsize` and expire after `ttl` seconds. `invalidate(scope)` drops a scope's answers once its knowledge
+    base changes. An answer that was being generated during an invalidation
+    is not stored.
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.similarity = similarity
+        self._entries = TTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self.enabled = maxsize > 0
+        # scope -> number of invalidations, to spot answers generated across one
+        self._generations: Dict[str, int] = {}
+        # Background embeddings of stored answers, referenced until they finish
+        self._pending = set()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lookup_embeds = 0
+        self.background_embeds = 0
+
+    async def lookup(self, query: str, embed_fn: Optional[EmbedFn] = None, scope: str = "default", mode: str = "auto") -> AnswerLookup:
+        key = (scope, normalize_query(query), mode)
+        generation = self._generations.get(scope, 0)
+        if not self.enabled or not key[1]:
+            return AnswerLookup(None, key, None, generation)
+
+        answer = self._entries.get(key)
+        if answer is not None:
+            self.exact_hits += 1
+            return AnswerLookup(answer, key, answer.vector, generation)
+
+        vector = None
+        candidates = self._candidates(scope, mode) if embed_fn is not None and self.similarity > 0 else []
+        if candidates:
+            try:
+                self.lookup_embeds += 1
+                vector = _unit(np.asarray(await embed_fn([key[1]]), dtype=np.float32)[0])
+                answer = self._closest(candidates, vector)
+            except Exception as e:
+                print(f"⚠️ Answer cache similarity lookup failed: {e}")
+
+        if answer is not None:
+            self.similar_hits += 1
+        else:
+            self.misses += 1
+        return AnswerLookup(answer, key, vector, generation)
+
+    def _candidates(self, scope: str, mode: str) -> List[CachedAnswer]:
+        return [
+            answer for (answer_scope, _, answer_mode), answer in self._entries.items()
+            if answer_scope == scope and answer_mode == mode and answer.vector is not None
+        ]
+
+    def _closest(self, candidates: List[CachedAnswer], vector: np.ndarray) -> Optional[CachedAnswer]:
+        scores = np.stack([answer.vector for answer in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return candidates[best]
+
+    def store(self, lookup: AnswerLookup, chunks: List[str], embed_fn: Optional[EmbedFn] = None) -> None:
+        """Caches the answer produced after a missed `lookup`."""
+        if not self.enabled or not lookup.key[1] or not chunks:
+            return
+        if lookup.generation != self._generations.get(lookup.key[0], 0):
+            # The knowledge base changed while this answer was generated
+            return
+        answer = CachedAnswer(list(chunks), lookup.vector)
+        self._entries.set(lookup.key, answer)
+        if answer.vector is None and embed_fn is not None and self.similarity > 0:
+            task = asyncio.get_running_loop().create_task(self._embed_later(answer, lookup.key[1], embed_fn))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _embed_later(self, answer: CachedAnswer, query: str, embed_fn: EmbedFn) -> None:
+        try:
+            answer.vector = _unit(np.asarray(await embed_fn([query]), dtype=np.float32)[0])
+            self.background_embeds += 1
+        except Exception as e:
+            print(f"⚠️ Answer cache could not embed a stored query: {e}")
+
+    def invalidate(self, scope: str = "default") -> None:
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+        for key, _ in self._entries.items():
+            if key[0] == scope:
+                self._entries.pop(key)
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "similarity": self.similarity,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self._entries.evictions,
+            "invalidations": self.invalidations,
+            "lookup_embeds": self.lookup_embeds,
+            "background_embeds": self.background_embeds,
+        }
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+# Shared cache used by query_rag and stream_query_rag
+answer_cache = AnswerCache()
@@ -0,0 +1,130 @@
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+MANIFEST_FILE = "crawl_manifest.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    lastmod REAL,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingested (
+    embed_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (embed_id, url)
+) WITHOUT ROWID;
+"""
+
+# W3C datetime's year and year-month precisions, which fromisoformat rejects
+_YEAR_MONTH = re.compile(r"\d{4}(-\d{2})?")
+_FRACTION = re.compile(r"\.(\d+)")
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """
+    Sitemap <lastmod> as a timestamp. Accepts every W3C datetime precision
+    (2024, 2024-05, 2024-05-01, 2024-05-01T10:00Z, 2024-05-01T10:00:00.5+02:00);
+    a missing time zone is taken as UTC. Returns None for anything else.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        if _YEAR_MONTH.fullmatch(value):
+            parsed = datetime.strptime(value, "%Y-%m" if "-" in value else "%Y")
+        else:
+            # fromisoformat only takes "Z" and fractions other than 3 or 6 digits from Python 3.11
+            if value[-1:] in ("Z", "z"):
+                value = value[:-1] + "+00:00"
+            value = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), value)
+            parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class PageRecord(NamedTuple):
+    url: str
+    # Sitemap lastmod when the page was last fetched
+    lastmod: Optional[float]
+    # Validators from the last 200, sent back as If-None-Match / If-Modified-Since
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # Hash of the page's extracted text
+    content_hash: Optional[str]
+    fetched_at: float
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CrawlManifest:
+    """
+    What the crawler last saw of each page of a site, in db/<domain>/.
+
+    The crawler uses it to skip pages whose sitemap lastmod hasn't advanced
+    and to make conditional requests for the rest. The `ingested` table
+    records, per knowledge base, which version (content hash) of each page
+    was inserted, so only pages that changed since then are re-ingested,
+    even when several embeds ingest the same site.
+
+    Methods are blocking; call them with asyncio.to_thread.
+    """
+
+    def __init__(self, folder: str):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def get(self, urls: List[str]) -> Dict[str, PageRecord]:
+        """Records of the given pages (those the manifest has); pass a few hundred URLs at a time."""
+        if not urls:
+            return {}
+        placeholders = ", ".join("?" for _ in urls)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT url, lastmod, etag, last_modified, content_hash, fetched_at FROM pages WHERE url IN ({placeholders})",
+                urls,
+            )
+            return {row[0]: PageRecord(*row) for row in rows}
+
+    def save(self, records: Iterable[PageRecord]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pages (url, lastmod, etag, last_modified, content_hash, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                list(records),
+            )
+
+    def ingested(self, embed_id: str) -> Dict[str, str]:
+        """url -> content hash of the version the embed last ingested."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT url, content_hash FROM ingested WHERE embed_id = ?", (embed_id,))
+            return dict(rows.fetchall())
+
+    def mark_ingested(self, embed_id: str, hashes: Dict[str, str]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ingested (embed_id, url, content_hash) VALUES (?, ?, ?)",
+                [(embed_id, url, h) for url, h in hashes.items()],
+            )
+
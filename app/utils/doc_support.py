@@ -1,24 +1,37 @@
-import fitz
-import docx
+import asyncio
 import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+
+# fitz (PyMuPDF) and python-docx are imported on first use to keep startup fast
+
+# Load environment variables
+load_dotenv()
+
+# Processes extracting document text, and PDF pages handed to one of them at a time
+INGEST_EXTRACT_PROCESSES = int(os.getenv("INGEST_EXTRACT_PROCESSES", "2"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
 
 
 # ---------- 📄 Document Processor Functions ----------
 
 def extract_pdf_text(file_bytes: bytes) -> str:
-    text = ""
-    pdf = fitz.open(stream=file_bytes, filetype="pdf")
-    for page in pdf:
-        text += page.get_text()
-    pdf.close()
-    return text
+    import fitz
+
+    with fitz.open(stream=file_bytes, filetype="pdf") as pdf:
+        return "".join(page.get_text() for page in pdf)
 
 def extract_docx_text(file_bytes: bytes) -> str:
-    text = ""
+    import docx
+
     doc = docx.Document(io.BytesIO(file_bytes))
-    for para in doc.paragraphs:
-        text += para.text + "\n"
-    return text
+    return "".join(para.text + "\n" for para in doc.paragraphs)
 
 def extract_txt_text(file_bytes: bytes) -> str:
     return file_bytes.decode(errors='ignore')
@@ -39,4 +52,76 @@ def get_file_type(filename: str, mime_type: str) -> str:
     elif mime_type.startswith('text/'):
         return 'txt'
     else:
-        return 'unsupported'
\ No newline at end of file
+        return 'unsupported'
+
+
+# ---------- 📚 File-based extraction in worker processes ----------
+# These run in the extraction pool and only get a path, so the file's bytes
+# never pass through the server process.
+
+def pdf_page_count(path: str) -> int:
+    import fitz
+
+    with fitz.open(path) as pdf:
+        return pdf.page_count
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> str:
+    import fitz
+
+    with fitz.open(path) as pdf:
+        return "".join(pdf[number].get_text() for number in range(start, stop))
+
+def extract_docx_file(path: str) -> str:
+    import docx
+
+    # One XML document, so it isn't split across processes (each would re-parse all of it)
+    doc = docx.Document(path)
+    return "".join(para.text + "\n" for para in doc.paragraphs)
+
+def extract_txt_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode(errors='ignore')
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        # spawn: forking a server process that runs threads and an event loop isn't safe
+        _extract_pool = ProcessPoolExecutor(
+            max_workers=max(1, INGEST_EXTRACT_PROCESSES),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _extract_pool
+
+def shutdown_extract_pool(wait: bool = False) -> None:
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=wait, cancel_futures=True)
+        _extract_pool = None
+
+
+async def iter_document_text(path: str, file_type: str, pages_per_task: int = PDF_PAGES_PER_TASK) -> AsyncIterator[str]:
+    """
+    Yields a stored document's text in order, as it's extracted.
+
+    PDFs are split into page ranges that the extraction pool works on in
+    parallel. Each range is yielded as soon as it and the ones before it are
+    done, so the caller can write it out while later pages are still being
+    extracted.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extract_pool()
+    if file_type == 'pdf':
+        count = await loop.run_in_executor(pool, pdf_page_count, path)
+        ranges = [(start, min(start + pages_per_task, count)) for start in range(0, count, max(1, pages_per_task))]
+        futures = [loop.run_in_executor(pool, extract_pdf_pages, path, start, stop) for start, stop in ranges]
+        try:
+            for future in futures:
+                yield await future
+        finally:
+            for future in futures:
+                future.cancel()
+    elif file_type == 'docx':
+        yield await loop.run_in_executor(pool, extract_docx_file, path)
+    else:
+        yield await loop.run_in_executor(pool, extract_txt_file, path)
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./db/embedding_cache.sqlite3")
+# Size cap for stored vectors; 0 disables the cache
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# Signature of the remote embedding call: texts -> array of shape (len(texts), dim)
+EmbedFn = Callable[[List[str]], Awaitable[Any]]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+# SQLite's default limit on host parameters is 999 on older builds
+_MAX_PARAMS = 500
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """16-byte digest of (model, text); different models never share vectors."""
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embedding vectors keyed by a hash of (model, text).
+
+    Vectors are stored as float32 blobs in a SQLite file, so re-ingesting an
+    unchanged document or repeating a query costs no remote call. `embed()`
+    looks a whole batch up at once and sends only the misses to the remote
+    embedding function, in a single call. Once the stored vectors exceed
+    `max_bytes`, the least recently used entries are evicted.
+
+    Like SQLiteStorage, the connection lives on one dedicated thread.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = int(EMBEDDING_CACHE_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.remote_calls = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    async def embed(self, model: str, texts: Sequence[str], embed_fn: EmbedFn) -> np.ndarray:
+        """Embeddings for `texts` in order, calling `embed_fn` only for uncached texts."""
+        if not self.enabled or not texts:
+            self.remote_calls += 1
+            return await embed_fn(list(texts))
+
+        keys = [cache_key(model, text) for text in texts]
+        try:
+            found = await self._run(lambda conn: self._lookup(conn, list(dict.fromkeys(keys))))
+        except Exception as e:
+            print(f"⚠️ Embedding cache lookup failed, embedding everything: {e}")
+            found = {}
+
+        # Each distinct missing text is embedded once, even if repeated in the batch
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+
+        if missing:
+            self.remote_calls += 1
+            vectors = np.asarray(await embed_fn(list(missing.values())), dtype=np.float32)
+            fresh = dict(zip(missing.keys(), vectors))
+            found.update(fresh)
+            try:
+                await self._run(lambda conn: self._store(conn, fresh))
+            except Exception as e:
+                print(f"⚠️ Embedding cache write failed: {e}")
+
+        return np.stack([found[key] for key in keys])
+
+    def _lookup(self, conn: sqlite3.Connection, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        for start in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[start:start + _MAX_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def _store(self, conn: sqlite3.Connection, vectors: Dict[bytes, np.ndarray]) -> None:
+        now = time.time()
+        rows = [(key, vector.tobytes(), now) for key, vector in vectors.items()]
+        keys = [key for key, _, _ in rows]
+        # Keys cached meanwhile (e.g. by a concurrent miss) are replaced, not added
+        replaced = 0
+        for start in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[start:start + _MAX_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            replaced += conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchone()[0]
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+        self._bytes += sum(len(blob) for _, blob, _ in rows) - replaced
+        if self._bytes > self.max_bytes:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Trim to 90% of the cap so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+            if self._bytes <= target:
+                break
+            evicted.append((key,))
+            self._bytes -= size
+        with conn:
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "remote_calls": self.remote_calls,
+            "evictions": self.evictions,
+        }
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn = self._conn
+            await self._run(lambda _conn: conn.close())
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+
+# Shared cache used by the LightRAG embedding function
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,84 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from app.types.types import ChatMessage, HistoryResponse
+from app.utils.cache import TTLCache
+
+
+class CachedHistory:
+    """A full, ordered session history plus its serialized HistoryResponse."""
+
+    __slots__ = ("messages", "_json")
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.messages = messages
+        self._json: Optional[bytes] = None
+
+    def json(self) -> bytes:
+        """HistoryResponse body for the full history, rendered once per change."""
+        if self._json is None:
+            response = HistoryResponse(history=[
+                ChatMessage(role=m["role"], content=m["content"], uuid=m.get("uuid"))
+                for m in self.messages
+            ])
+            self._json = response.model_dump_json().encode()
+        return self._json
+
+    def index_of(self, message_uuid: str) -> Optional[int]:
+        for index in range(len(self.messages) - 1, -1, -1):
+            if self.messages[index].get("uuid") == message_uuid:
+                return index
+        return None
+
+
+class HistoryCache:
+    """
+    Read-through cache of whole session histories keyed by session_id.
+
+    Entries are LRU-evicted past `maxsize` and expire after `ttl` seconds.
+    Writes go through `append`/`replace` so cached histories stay current,
+    and `invalidate` drops a session on delete. A freshly loaded history is
+    only cached if the session had no writes in the last `settle` seconds,
+    since those may still be waiting in the write-behind queue and would be
+    missing from what the database returned.
+    """
+
+    def __init__(self, maxsize: int = 2000, ttl: float = 300, settle: float = 5.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._recent_writes = TTLCache(maxsize=maxsize * 4, ttl=settle)
+
+    def get(self, session_id: str) -> Optional[CachedHistory]:
+        return self._entries.get(session_id)
+
+    def fill(self, session_id: str, messages: List[Dict[str, Any]]) -> Optional[CachedHistory]:
+        if session_id in self._recent_writes:
+            return None
+        entry = CachedHistory(messages)
+        self._entries.set(session_id, entry)
+        return entry
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> None:
+        self._recent_writes.set(session_id, time.monotonic())
+        entry = self._entries.peek(session_id)
+        if entry is not None:
+            entry.messages.append(message)
+            entry._json = None
+
+    def replace(self, session_id: str, message: Dict[str, Any]) -> None:
+        self._recent_writes.set(session_id, time.monotonic())
+        entry = self._entries.peek(session_id)
+        if entry is None:
+            return
+        index = entry.index_of(message["uuid"])
+        if index is None:
+            self._entries.pop(session_id)
+            return
+        entry.messages[index] = {**entry.messages[index], **message}
+        entry._json = None
+
+    def invalidate(self, session_id: str) -> None:
+        self._entries.pop(session_id)
+        self._recent_writes.set(session_id, time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        return self._entries.stats()
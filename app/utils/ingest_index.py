@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Documents are split into chunks of roughly this many characters before
+# they go to LightRAG; each chunk is stored (and deduplicated) on its own
+INGEST_CHUNK_MIN_CHARS = int(os.getenv("INGEST_CHUNK_MIN_CHARS", "1500"))
+INGEST_CHUNK_MAX_CHARS = int(os.getenv("INGEST_CHUNK_MAX_CHARS", "4000"))
+
+INDEX_FILE = "ingest_index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS doc_chunks (
+    doc_key TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    PRIMARY KEY (doc_key, chunk_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_doc_chunks_hash ON doc_chunks (chunk_hash);
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def chunk_doc_id(chunk_hash: str) -> str:
+    """LightRAG document id of a chunk. The same text always gets the same id, whichever document it came from."""
+    return f"ingest-{chunk_hash}"
+
+
+def split_chunks(text: str, min_chars: int = INGEST_CHUNK_MIN_CHARS, max_chars: int = INGEST_CHUNK_MAX_CHARS) -> List[str]:
+    """
+    Splits text into chunks at line boundaries chosen by content.
+
+    A chunk ends after a line once it has `min_chars` and the line's hash
+    picks it as a boundary (about one line in four), or once it reaches
+    `max_chars`. Boundaries depend only on nearby lines, so an edit changes
+    the chunks around it and leaves the rest of the document's chunks
+    (and their hashes) as they were.
+    """
+    return list(iter_chunks(text.splitlines(), min_chars, max_chars))
+
+
+def iter_chunks(lines: Iterable[str], min_chars: int = INGEST_CHUNK_MIN_CHARS, max_chars: int = INGEST_CHUNK_MAX_CHARS) -> Iterator[str]:
+    """split_chunks over text given piece by piece (e.g. the lines of an open file)."""
+    current, size = [], 0
+    for piece in lines:
+        for line in piece.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            # Very long lines (no line breaks in the source) are cut into pieces
+            while len(line) > max_chars:
+                if current:
+                    yield "\n".join(current)
+                    current, size = [], 0
+                yield line[:max_chars]
+                line = line[max_chars:]
+            current.append(line)
+            size += len(line) + 1
+            if size >= max_chars or (size >= min_chars and hashlib.blake2b(line.encode("utf-8"), digest_size=1).digest()[0] % 4 == 0):
+                yield "\n".join(current)
+                current, size = [], 0
+    if current:
+        yield "\n".join(current)
+
+
+def iter_file_chunks(path: str) -> Iterator[str]:
+    """The chunks of a UTF-8 text file, read line by line."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_chunks(f)
+
+
+def hash_file(path: str) -> Tuple[str, Dict[str, Optional[str]]]:
+    """
+    content_hash of a text file and its chunk hashes (in document order),
+    without holding its text. Blocking; the chunk texts are left out (None).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    chunks: Dict[str, Optional[str]] = {}
+
+    def lines():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                digest.update(line.encode("utf-8"))
+                yield line
+
+    for chunk in iter_chunks(lines()):
+        chunks.setdefault(content_hash(chunk), None)
+    return digest.hexdigest(), chunks
+
+
+class IngestPlan(NamedTuple):
+    doc_key: str
+    content_hash: str
+    # chunk hash -> text, in document order (None when planned from a file)
+    chunks: Dict[str, Optional[str]]
+    # Chunks to insert into / delete from LightRAG
+    insert: Dict[str, Optional[str]]
+    delete: List[str]
+    new: int
+    unchanged: int
+    removed: int
+
+    def counts(self) -> Dict[str, int]:
+        return {"new": self.new, "unchanged": self.unchanged, "removed": self.removed}
+
+    def without(self, failed: Iterable[str]) -> "IngestPlan":
+        """
+        The part of the plan LightRAG applied when it failed on some of the
+        chunks to insert. Those stay out of the index and the chunks due for
+        deletion stay in it, with a blank content hash, so the next ingest of
+        the document inserts and deletes them again.
+        """
+        failed = set(failed)
+        chunks = {h: text for h, text in self.chunks.items() if h not in failed}
+        for h in self.delete:
+            chunks.setdefault(h, None)
+        insert = {h: text for h, text in self.insert.items() if h not in failed}
+        return self._replace(content_hash="", chunks=chunks, insert=insert, delete=[], new=len(insert), removed=0)
+
+
+class IngestIndex:
+    """
+    Records which content each knowledge base already holds, by hash.
+
+    Every ingested document (keyed by file name or URL) is split into
+    chunks, and the index stores the document's hash and its chunks'
+    hashes in a SQLite file in the tenant's working directory. Ingesting the
+    same content again costs nothing. An edited document only sends its new
+    chunks to LightRAG, and chunks it no longer has are deleted from
+    LightRAG, unless another document still contains them. A chunk shared
+    by many documents (page headers, footers) is stored once.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-index")
+        # working dir -> connection
+        self._conns: Dict[str, sqlite3.Connection] = {}
+
+        self.documents_skipped = 0
+        self.chunks_inserted = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+
+    def _connect(self, working_dir: str) -> sqlite3.Connection:
+        conn = self._conns.get(working_dir)
+        if conn is None:
+            os.makedirs(working_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(working_dir, INDEX_FILE), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conns[working_dir] = conn
+        return conn
+
+    async def _run(self, working_dir: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect(working_dir)))
+
+    async def plan(self, working_dir: str, doc_key: str, text: str) -> IngestPlan:
+        """Works out what LightRAG needs to insert and delete for this version of a document."""
+        digest = content_hash(text)
+        chunks = {}
+        for chunk in split_chunks(text):
+            chunks.setdefault(content_hash(chunk), chunk)
+        return await self._run(working_dir, lambda conn: self._plan(conn, doc_key, digest, chunks))
+
+    async def plan_file(self, working_dir: str, doc_key: str, path: str) -> IngestPlan:
+        """Same as `plan` for a document in a text file; the plan holds chunk hashes only."""
+        digest, chunks = await asyncio.to_thread(hash_file, path)
+        return await self._run(working_dir, lambda conn: self._plan(conn, doc_key, digest, chunks))
+
+    def _plan(self, conn: sqlite3.Connection, doc_key: str, digest: str, chunks: Dict[str, Optional[str]]) -> IngestPlan:
+        row = conn.execute("SELECT content_hash FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        if row is not None and row[0] == digest:
+            return IngestPlan(doc_key, digest, chunks, {}, [], 0, len(chunks), 0)
+
+        old = {h for (h,) in conn.execute("SELECT chunk_hash FROM doc_chunks WHERE doc_key = ?", (doc_key,))}
+        added = [h for h in chunks if h not in old]
+        dropped = [h for h in old if h not in chunks]
+
+        def used_elsewhere(chunk_hash: str) -> bool:
+            return conn.execute(
+                "SELECT 1 FROM doc_chunks WHERE chunk_hash = ? AND doc_key != ? LIMIT 1", (chunk_hash, doc_key)
+            ).fetchone() is not None
+
+        insert = {h: chunks[h] for h in added if not used_elsewhere(h)}
+        delete = [h for h in dropped if not used_elsewhere(h)]
+        return IngestPlan(doc_key, digest, chunks, insert, delete, len(insert), len(chunks) - len(insert), len(dropped))
+
+    async def commit(self, working_dir: str, plan: IngestPlan) -> None:
+        """Records a plan once LightRAG has applied it."""
+        if plan.new == 0 and plan.removed == 0:
+            self.documents_skipped += 1
+        self.chunks_inserted += len(plan.insert)
+        self.chunks_reused += plan.unchanged
+        self.chunks_deleted += len(plan.delete)
+        await self._run(working_dir, lambda conn: self._commit(conn, plan))
+
+    def _commit(self, conn: sqlite3.Connection, plan: IngestPlan) -> None:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_key, content_hash, chunks, updated_at) VALUES (?, ?, ?, ?)",
+                (plan.doc_key, plan.content_hash, len(plan.chunks), time.time()),
+            )
+            conn.execute("DELETE FROM doc_chunks WHERE doc_key = ?", (plan.doc_key,))
+            conn.executemany(
+                "INSERT INTO doc_chunks (doc_key, chunk_hash) VALUES (?, ?)",
+                [(plan.doc_key, h) for h in plan.chunks],
+            )
+
+    async def remove(self, working_dir: str, doc_key: str) -> None:
+        """Drops a document from the index, once LightRAG has deleted its chunks."""
+        await self._run(working_dir, lambda conn: self._remove(conn, doc_key))
+
+    def _remove(self, conn: sqlite3.Connection, doc_key: str) -> None:
+        with conn:
+            conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+            conn.execute("DELETE FROM doc_chunks WHERE doc_key = ?", (doc_key,))
+
+    async def forget(self, working_dir: str) -> None:
+        """Closes a tenant's index, e.g. once its working dir is removed."""
+        conn = self._conns.pop(working_dir, None)
+        if conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, conn.close)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_indexes": len(self._conns),
+            "documents_skipped": self.documents_skipped,
+            "chunks_inserted": self.chunks_inserted,
+            "chunks_reused": self.chunks_reused,
+            "chunks_deleted": self.chunks_deleted,
+        }
+
+    async def close(self) -> None:
+        for working_dir in list(self._conns):
+            await self.forget(working_dir)
+        self._executor.shutdown(wait=True)
+
+
+# Shared index used by insert_data
+ingest_index = IngestIndex()
@@ -0,0 +1,535 @@
+import asyncio
+import inspect
+import json
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.tenants import tenant_workspace
+
+# Load environment variables
+load_dotenv()
+
+INGEST_JOBS_PATH = os.getenv("INGEST_JOBS_PATH", "./db/ingest_jobs.sqlite3")
+# Uploaded files are kept here until their job finishes, so queued jobs survive a restart
+INGEST_UPLOADS_DIR = os.getenv("INGEST_UPLOADS_DIR", "./db/uploads")
+# Jobs running at once. LightRAG inserts are serialized anyway; extra workers overlap scraping and extraction with them
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# How often a running job's progress is written to the job table (seconds)
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "1"))
+# A running job's claim lasts this long (seconds) and is renewed with its progress;
+# once it lapses (the process died) any process may run the job again
+INGEST_JOB_LEASE = float(os.getenv("INGEST_JOB_LEASE", "60"))
+# How often the table is checked for queued jobs and lapsed claims (seconds)
+INGEST_JOB_POLL_INTERVAL = float(os.getenv("INGEST_JOB_POLL_INTERVAL", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id TEXT PRIMARY KEY,
+    embed_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_until REAL,
+    cancel_requested INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_embed ON ingest_jobs (embed_id, created_at);
+"""
+# Tables created before jobs were claimed (and cancelled through the table) lack these
+CLAIM_COLUMNS = {"owner": "TEXT", "lease_until": "REAL", "cancel_requested": "INTEGER"}
+CLAIM_INDEX = "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, created_at)"
+
+# The columns Job.row() / Job.from_row() hold, in order
+COLUMNS = "id, embed_id, kind, source, name, status, progress, result, error, created_at, started_at, finished_at"
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+
+# LightRAG logs one of these per chunk once its entities and relations are extracted
+_CHUNK_DONE = re.compile(r"Chunk (\d+) of (\d+) extracted (\d+) Ent \+ (\d+) Rel")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (e.g. from a scraper thread) once it has been cancelled."""
+
+
+class Job:
+    __slots__ = (
+        "id", "embed_id", "kind", "source", "name", "status", "progress", "result", "error",
+        "created_at", "started_at", "finished_at", "cancel_requested", "_pipeline_seen",
+    )
+
+    def __init__(self, id: str, embed_id: str, kind: str, source: str, name: Optional[str] = None, status: str = QUEUED,
+                 progress: Optional[Dict[str, Any]] = None, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                 created_at: Optional[float] = None, started_at: Optional[float] = None, finished_at: Optional[float] = None):
+        self.id = id
+        self.embed_id = embed_id
+        self.kind = kind
+        self.source = source
+        self.name = name
+        self.status = status
+        self.progress = progress or {"stage": QUEUED}
+        self.result = result
+        self.error = error
+        self.created_at = created_at or time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.cancel_requested = False
+        self._pipeline_seen = 0
+
+    def count(self, **increments: int) -> None:
+        """Adds to progress counters. Safe to call from worker threads."""
+        for key, value in increments.items():
+            self.progress[key] = self.progress.get(key, 0) + value
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "embed_id": self.embed_id,
+            "type": self.kind,
+            "source": self.name or self.source,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def row(self):
+        return (
+            self.id, self.embed_id, self.kind, self.source, self.name, self.status,
+            json.dumps(self.progress), json.dumps(self.result) if self.result is not None else None, self.error,
+            self.created_at, self.started_at, self.finished_at,
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        (id, embed_id, kind, source, name, status, progress, result, error, created_at, started_at, finished_at) = row
+        return cls(id, embed_id, kind, source, name, status, json.loads(progress), json.loads(result) if result else None,
+                   error, created_at, started_at, finished_at)
+
+
+# kind -> coroutine doing the job's work; returns the job result
+JobHandler = Callable[[Job], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class IngestJobManager:
+    """
+    Runs document and website ingestion as background jobs.
+
+    Endpoints `submit()` a job and return its id right away. A bounded pool
+    of worker tasks runs the jobs; blocking steps (scraping, text extraction)
+    go to threads, so chats on this worker stay responsive. Every job is a row
+    in a SQLite table, updated as it makes progress.
+
+    Several processes (e.g. uvicorn workers) can share the table: a worker
+    claims a queued job with one conditional UPDATE, so exactly one process
+    runs it, and holds the claim as a lease of INGEST_JOB_LEASE seconds that
+    is renewed with every progress save. Every INGEST_JOB_POLL_INTERVAL
+    seconds each process queues jobs whose lease lapsed (their process
+    died) and picks up queued jobs, up to its idle workers. Re-running a job
+    is cheap since already ingested content is skipped.
+
+    Cancelling also goes through the table, so any process can cancel any
+    job: a queued job is marked cancelled directly, a running one gets its
+    cancel_requested flag set, which the owning process sees with its next
+    progress save and stops the job.
+
+    The workers live in the serving process rather than a separate one
+    because LightRAG's file-based storages are owned by the process that
+    loaded them.
+    """
+
+    def __init__(self, path: str = INGEST_JOBS_PATH, workers: int = INGEST_WORKERS, progress_interval: float = INGEST_PROGRESS_INTERVAL,
+                 lease: float = INGEST_JOB_LEASE, poll_interval: float = INGEST_JOB_POLL_INTERVAL):
+        self.path = path
+        self.workers = max(1, workers)
+        self.progress_interval = progress_interval
+        self.lease = lease
+        self.poll_interval = poll_interval
+        # Claims in the job table name this process
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-jobs")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Jobs that are queued or running in this process
+        self._active: Dict[str, Job] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        # Running jobs whose lease another process took over
+        self._lost = set()
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.resumed = 0
+        self.claims_lost = 0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+            for column, kind in CLAIM_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} {kind}")
+            conn.execute(CLAIM_INDEX)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    async def _insert(self, job: Job) -> None:
+        row = job.row()
+        await self._run(lambda conn: conn.execute(f"INSERT INTO ingest_jobs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row))
+
+    async def _save(self, job: Job) -> bool:
+        """
+        Writes the job's state, renewing this process' lease while it runs it.
+        Returns False when another process holds the job.
+        """
+        running = job.status == RUNNING
+        values = job.row()[5:] + (
+            self.owner if job.id in self._running and job.status != QUEUED else None,
+            time.time() + self.lease if running else None,
+            job.id, self.owner,
+        )
+        cursor = await self._run(lambda conn: conn.execute(
+            "UPDATE ingest_jobs SET status = ?, progress = ?, result = ?, error = ?, created_at = ?, started_at = ?, finished_at = ?, "
+            "owner = ?, lease_until = ? WHERE id = ? AND (owner IS NULL OR owner = ?)", values
+        ))
+        return cursor.rowcount == 1
+
+    async def _claim(self, job: Job) -> bool:
+        """Atomically takes a queued job for this process; False if another process got it first."""
+        now = time.time()
+        cursor = await self._run(lambda conn: conn.execute(
+            "UPDATE ingest_jobs SET status = ?, owner = ?, lease_until = ?, started_at = ? "
+            "WHERE id = ? AND status = ? AND cancel_requested IS NULL",
+            (RUNNING, self.owner, now + self.lease, now, job.id, QUEUED),
+        ))
+        return cursor.rowcount == 1
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self._recover()
+            except Exception as e:
+                print(f"⚠️ Could not check for ingestion jobs: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _recover(self) -> None:
+        """Queues jobs whose lease lapsed and picks up queued jobs for idle workers."""
+        now = time.time()
+        # Cancelled while queued elsewhere, or while running in a process that died since
+        await self._cancel_where(
+            "cancel_requested = 1 AND (status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?)))",
+            (QUEUED, RUNNING, now),
+        )
+        recovered = await self._run(lambda conn: conn.execute(
+            "UPDATE ingest_jobs SET status = ?, owner = NULL, lease_until = NULL, progress = json_set(progress, '$.stage', ?) "
+            "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+            (QUEUED, QUEUED, RUNNING, now),
+        ).rowcount)
+        if recovered:
+            self.resumed += recovered
+            print(f"✅ Re-queued {recovered} ingestion job(s) left unfinished by a stopped process")
+
+        idle = self.workers - len(self._running) - self._queue.qsize()
+        if idle <= 0:
+            return
+        known = list(self._active)
+        rows = await self._run(lambda conn: conn.execute(
+            f"SELECT {COLUMNS} FROM ingest_jobs WHERE status = ? ORDER BY created_at LIMIT ?",
+            (QUEUED, idle + len(known)),
+        ).fetchall())
+        for row in rows:
+            if idle <= 0:
+                break
+            if row[0] in self._active:
+                continue
+            job = Job.from_row(row)
+            self._active[job.id] = job
+            self._queue.put_nowait(job.id)
+            idle -= 1
+
+    async def submit(self, embed_id: str, kind: str, source: str, name: Optional[str] = None, job_id: Optional[str] = None) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler for ingestion jobs of type {kind}")
+        job = Job(job_id or uuid.uuid4().hex, embed_id, kind, source, name)
+        await self._insert(job)
+        self._active[job.id] = job
+        self.submitted += 1
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._active.get(job_id)
+        if job is not None:
+            return job
+        row = await self._run(lambda conn: conn.execute(f"SELECT {COLUMNS} FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone())
+        return Job.from_row(row) if row else None
+
+    async def list(self, embed_id: str, limit: int = 20) -> List[Job]:
+        rows = await self._run(lambda conn: conn.execute(
+            f"SELECT {COLUMNS} FROM ingest_jobs WHERE embed_id = ? ORDER BY created_at DESC LIMIT ?", (embed_id, limit)
+        ).fetchall())
+        # Active jobs have fresher progress than their last saved row
+        return [self._active.get(row[0]) or Job.from_row(row) for row in rows]
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancels a queued or running job, whichever process holds it. Finished
+        jobs are returned unchanged.
+        """
+        job = self._active.get(job_id)
+        task = self._running.get(job_id)
+        if job is not None and task is not None:
+            job.cancel_requested = True
+            task.cancel()
+            return job
+        if await self._cancel_where("id = ? AND status = ?", (job_id, QUEUED)):
+            return await self.get(job_id)
+        # Running in another process (or being claimed by a worker here): flag it, its heartbeat stops it
+        if job is not None:
+            job.cancel_requested = True
+        await self._run(lambda conn: conn.execute(
+            "UPDATE ingest_jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)", (job_id, QUEUED, RUNNING)
+        ))
+        return await self.get(job_id)
+
+    async def _cancel_where(self, where: str, params: tuple) -> int:
+        """Marks the jobs matching `where` cancelled in the table and drops their uploads."""
+        now = time.time()
+
+        def cancel_rows(conn: sqlite3.Connection) -> List[str]:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in conn.execute(f"SELECT id FROM ingest_jobs WHERE {where}", params)]
+                conn.execute(
+                    "UPDATE ingest_jobs SET status = ?, finished_at = ?, owner = NULL, lease_until = NULL, "
+                    f"progress = json_set(progress, '$.stage', ?) WHERE {where}",
+                    (CANCELLED, now, CANCELLED) + params,
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return ids
+
+        ids = await self._run(cancel_rows)
+        for job_id in ids:
+            # A worker here skips jobs that are no longer active
+            self._active.pop(job_id, None)
+            upload_dir = os.path.join(INGEST_UPLOADS_DIR, job_id)
+            if os.path.isdir(upload_dir):
+                await asyncio.to_thread(shutil.rmtree, upload_dir, True)
+            print(f"Ingestion job {job_id} {CANCELLED}")
+        self.cancelled += len(ids)
+        return len(ids)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._active.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            if not await self._claim(job):
+                # Another process is running it; its progress is read from the table
+                self._active.pop(job.id, None)
+                continue
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # Worker stopped (shutdown): stop the job too, it resumes on the next start
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _execute(self, job: Job) -> None:
+        handler = self._handlers[job.kind]
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.progress["stage"] = "starting"
+        await self._save(job)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        print(f"Ingestion job {job.id} ({job.kind} for embed {job.embed_id}) started")
+        try:
+            job.result = await handler(job)
+        except (asyncio.CancelledError, JobCancelled):
+            if job.id in self._lost:
+                # Another process runs the job now; leave its row alone
+                self._lost.discard(job.id)
+                self._active.pop(job.id, None)
+                return
+            if job.cancel_requested:
+                await self._finish(job, CANCELLED)
+                return
+            # Shutdown: leave the job for the next process
+            job.status = QUEUED
+            job.progress["stage"] = QUEUED
+            await self._save(job)
+            raise
+        except Exception as e:
+            print(f"❌ Ingestion job {job.id} failed: {e}")
+            await self._finish(job, FAILED, str(e))
+        else:
+            if job.progress.get("stage") == "inserting":
+                # Pick up the chunks extracted since the last heartbeat
+                await self._read_pipeline(job)
+            await self._finish(job, SUCCEEDED)
+        finally:
+            heartbeat.cancel()
+
+    async def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.progress["stage"] = status
+        if status == SUCCEEDED:
+            self.succeeded += 1
+        elif status == FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+        self._active.pop(job.id, None)
+        # The upload isn't needed once the job can no longer run
+        upload_dir = os.path.join(INGEST_UPLOADS_DIR, job.id)
+        if os.path.isdir(upload_dir):
+            await asyncio.to_thread(shutil.rmtree, upload_dir, True)
+        await self._save(job)
+        print(f"Ingestion job {job.id} {status}")
+
+    async def _heartbeat(self, job: Job) -> None:
+        """Folds LightRAG's pipeline progress into the job and saves it periodically."""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if job.progress.get("stage") == "inserting":
+                await self._read_pipeline(job)
+            try:
+                saved = await self._save(job)
+                cancelled = saved and await self._cancel_flagged(job)
+            except Exception as e:
+                print(f"⚠️ Could not save progress of ingestion job {job.id}: {e}")
+                continue
+            if cancelled:
+                # cancel() was called in another process
+                job.cancel_requested = True
+                self._running[job.id].cancel()
+                return
+            if not saved:
+                # The lease lapsed (e.g. the event loop was blocked) and another process took the job
+                print(f"⚠️ Ingestion job {job.id} was taken over by another process, stopping it here")
+                self.claims_lost += 1
+                self._lost.add(job.id)
+                self._running[job.id].cancel()
+                return
+
+    async def _cancel_flagged(self, job: Job) -> bool:
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT cancel_requested FROM ingest_jobs WHERE id = ?", (job.id,)
+        ).fetchone())
+        return bool(row and row[0])
+
+    async def _read_pipeline(self, job: Job) -> None:
+        # Inserts are serialized (see insert_data), so the pipeline is working on this job
+        try:
+            from lightrag.kg.shared_storage import get_namespace_data
+
+            # Each tenant's LightRAG has its own pipeline status (see tenant_workspace)
+            if "workspace" in inspect.signature(get_namespace_data).parameters:
+                status = await get_namespace_data("pipeline_status", workspace=tenant_workspace(job.embed_id))
+            else:
+                status = await get_namespace_data("pipeline_status")
+            messages = list(status.get("history_messages", []))
+        except Exception:
+            return
+        if len(messages) < job._pipeline_seen:
+            # LightRAG starts a fresh history for every pipeline run
+            job._pipeline_seen = 0
+        for message in messages[job._pipeline_seen:]:
+            match = _CHUNK_DONE.search(str(message))
+            if match is None:
+                continue
+            done, total, entities, relations = (int(group) for group in match.groups())
+            job.count(chunks_processed=1, entities_extracted=entities, relations_extracted=relations)
+            if done == 1:
+                job.count(chunks_total=total)
+        job._pipeline_seen = len(messages)
+
+    async def stop(self) -> None:
+        """Stops the workers. Running jobs are interrupted and resume on the next start."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn = self._conn
+            await self._run(lambda _conn: conn.close())
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": sum(1 for job in self._active.values() if job.status == QUEUED),
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "resumed": self.resumed,
+            "claims_lost": self.claims_lost,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+# Shared manager; the job types are registered in app/utils/ingestion.py
+ingest_jobs = IngestJobManager()
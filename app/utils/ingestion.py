@@ -0,0 +1,163 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.utils.crawl_manifest import CrawlManifest
+from app.utils.doc_support import iter_document_text
+from app.utils.ingest_jobs import Job, ingest_jobs
+from app.utils.lightrag_init import insert_data, insert_documents, remove_document
+from app.utils.scrape_website import scrape_site_from_sitemap
+from app.utils.tenants import tenants
+
+# Load environment variables
+load_dotenv()
+
+# Website pages sent to LightRAG per insert call (each page is its own document)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "16"))
+# Failed pages reported in a job's result
+MAX_FAILED_PAGES_LISTED = 50
+
+# Background ingestion jobs: what /ingest/file and /ingest/url used to do inside the request
+
+async def _insert(job: Job, file_path: str, doc_key: str):
+    job.progress["stage"] = "inserting"
+    lease = await tenants.acquire(job.embed_id)
+    try:
+        counts = await insert_data(lease.rag, file_path, job.embed_id, doc_key)
+    finally:
+        lease.release()
+    if not counts:
+        raise RuntimeError("LightRAG could not process the document. Check the server logs.")
+    return counts
+
+
+async def ingest_file_job(job: Job):
+    """job.source is the stored upload (upload.<file type>), job.name the original file name."""
+    file_type = job.source.rsplit(".", 1)[-1]
+    job.progress["stage"] = "extracting"
+    job.progress["characters_extracted"] = 0
+
+    documents_dir = f"db/documents/{job.embed_id}"
+    os.makedirs(documents_dir, exist_ok=True)
+    document_path = f"{documents_dir}/{job.name}"
+
+    # Text is written out part by part as the extraction pool produces it
+    has_text = False
+    with open(document_path, "w", encoding="utf-8") as out:
+        async for part in iter_document_text(job.source, file_type):
+            await asyncio.to_thread(out.write, part)
+            has_text = has_text or bool(part.strip())
+            job.count(characters_extracted=len(part))
+            job.check_cancelled()
+    if not has_text:
+        raise ValueError("Extracted text is empty. Cannot process document.")
+
+    # Keyed by file name: uploading a new version of a file replaces the old one's content
+    counts = await _insert(job, document_path, f"file:{job.name}")
+    return {"type": "document", "file_name": job.name, "file_type": file_type, "characters": job.progress["characters_extracted"], "chunks": counts}
+
+
+def _read_pages(pages: List[Tuple[str, str, Optional[str]]]) -> Dict[str, str]:
+    """{url: text} of the scraped pages that have any text."""
+    documents = {}
+    for url, file_path, _ in pages:
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            print(f"⚠️ Could not read {file_path}: {e}")
+            continue
+        if text.strip():
+            documents[url] = text
+    return documents
+
+
+async def _insert_pages(job: Job, rag, documents: Dict[str, str], totals: Dict[str, int]) -> List[str]:
+    """Inserts a batch of pages; if the batch fails, each page is retried on its own. Returns the pages that failed."""
+    try:
+        results = await insert_documents(rag, documents, job.embed_id)
+        failed = []
+    except Exception as e:
+        print(f"⚠️ Batch of {len(documents)} pages failed ({e}), retrying page by page")
+        results, failed = {}, []
+        for url, text in documents.items():
+            job.check_cancelled()
+            try:
+                results.update(await insert_documents(rag, {url: text}, job.embed_id))
+            except Exception as page_error:
+                print(f"❌ Error inserting {url}: {page_error}")
+                failed.append(url)
+
+    for counts in results.values():
+        for key, value in counts.items():
+            totals[key] += value
+        if counts["new"] or counts["removed"]:
+            job.count(pages_inserted=1)
+        else:
+            job.count(pages_unchanged=1)
+    job.count(pages_insert_failed=len(failed))
+    return failed
+
+
+async def ingest_url_job(job: Job):
+    job.progress["stage"] = "scraping"
+    job.progress.update(pages_total=0, pages_scraped=0, pages_failed=0)
+
+    def on_page(done, total, failed):
+        # Called by the crawler after each URL; raising stops the crawl once the job is cancelled
+        job.check_cancelled()
+        job.progress.update(pages_total=total, pages_scraped=done - failed, pages_failed=failed)
+
+    folder, pages = await scrape_site_from_sitemap(job.source, on_page)
+    if not pages:
+        raise RuntimeError(f"No pages could be scraped from {job.source}")
+
+    # Only pages whose text changed since this embed last ingested them go on
+    manifest = CrawlManifest(folder)
+    ingested = await asyncio.to_thread(manifest.ingested, job.embed_id)
+    pending = [page for page in pages if page[2] is None or ingested.get(page[0]) != page[2]]
+
+    # Each page is a document keyed by its URL, so a page that changed is the
+    # only thing re-processed, and one bad page doesn't fail the whole site.
+    # Only one batch of pages is in memory at a time.
+    job.progress["stage"] = "inserting"
+    job.progress.update(pages_inserted=0, pages_unchanged=len(pages) - len(pending), pages_insert_failed=0)
+    totals = {"new": 0, "unchanged": 0, "removed": 0}
+    failed_pages = []
+    batch_size = max(1, INGEST_BATCH_SIZE)
+
+    lease = await tenants.acquire(job.embed_id)
+    try:
+        for start in range(0, len(pending), batch_size):
+            job.check_cancelled()
+            batch = pending[start:start + batch_size]
+            documents = await asyncio.to_thread(_read_pages, batch)
+            failed = await _insert_pages(job, lease.rag, documents, totals) if documents else []
+            failed_pages += failed
+            done = {url: digest for url, _, digest in batch if digest is not None and url not in failed}
+            if done:
+                await asyncio.to_thread(manifest.mark_ingested, job.embed_id, done)
+
+        # Sites used to be stored as one combined document keyed by the site URL
+        if job.source not in {url for url, _, _ in pages}:
+            totals["removed"] += await remove_document(lease.rag, job.source, job.embed_id)
+    finally:
+        lease.release()
+
+    if failed_pages and len(failed_pages) == len(pending):
+        raise RuntimeError("LightRAG could not process any page. Check the server logs.")
+    return {
+        "type": "website",
+        "url": job.source,
+        "pages": len(pages),
+        "pages_inserted": job.progress["pages_inserted"],
+        "pages_unchanged": job.progress["pages_unchanged"],
+        "failed_pages": failed_pages[:MAX_FAILED_PAGES_LISTED],
+        "chunks": totals,
+    }
+
+
+ingest_jobs.register("file", ingest_file_job)
+ingest_jobs.register("url", ingest_url_job)
@@ -1,109 +1,142 @@
 import re
-from typing import List
+from typing import List, NamedTuple, Optional
 
+# Email addresses are distinct enough that no keyword is needed, but a good regex is important.
+EMAIL_PATTERN = r"[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)+"
 
-def _detect_emails(text: str) -> List[str]:
-    """
-    Detects email addresses in a string.
-    Email patterns are usually distinct enough that keyword aiding is less critical,
-    but a good regex is important.
-    """
+# Phone numbers, somewhat generic. Focus on North American for now.
+# \(? \b\d{3}\b \)?      # Optional parens around area code (3 digits)
+# [-.\s]?                # Optional separator
+# \b\d{3}\b              # Exchange code (3 digits)
+# [-.\s]?                # Optional separator
+# \b\d{4}\b              # Subscriber number (4 digits)
+PHONE_PATTERN = r"\(?\b\d{3}\b\)?[-.\s]?\b\d{3}\b[-.\s]?\b\d{4}\b"
 
-    email_regex = r"[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)+"
-    found_emails = re.findall(email_regex, text)
-    return list(set(found_emails))
+# A potential name: 1 to 3 capitalized words
+# \b[A-Z][a-z']+      # First capitalized word (e.g., John, O'Malley)
+# (?:\s+[A-Z][a-z']+){0,2} # 0 to 2 additional capitalized words
+NAME_PATTERN = r"\b[A-Z][a-z']+(?:\s+[A-Z][a-z']+){0,2}\b"
 
-def _detect_phones(text: str) -> List[str]:
-    """
-    Detects phone numbers, prioritizing those mentioned with keywords.
-    For robust international phone number parsing, use the 'phonenumbers' library.
-    (pip install phonenumbers)
-    Example with phonenumbers:
-    import phonenumbers
-    detected_numbers = []
-    for match in phonenumbers.PhoneNumberMatcher(text, "US"): # Specify default region or None
-        detected_numbers.append(phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.E164))
-    if detected_numbers: return list(set(detected_numbers))
-    """
-    
-    # Regex for phone numbers, somewhat generic. Focus on North American for this example.
-    # \(? \b\d{3}\b \)?      # Optional parens around area code (3 digits)
-    # [-.\s]?                # Optional separator
-    # \b\d{3}\b              # Exchange code (3 digits)
-    # [-.\s]?                # Optional separator
-    # \b\d{4}\b              # Subscriber number (4 digits)
-
-    phone_pattern_str = r"\(?\b\d{3}\b\)?[-.\s]?\b\d{3}\b[-.\s]?\b\d{4}\b"
-    
-    # Keywords that might precede a phone number
-    keyword_phone_patterns = [
-        re.compile(r"(?:my\s+phone(?:\s+number)?\s+is|call\s+me\s+at|my\s+number\s+is|contact\s+no\.?\s*(?:is)?)\s*:?\s*(" + phone_pattern_str + r")", re.IGNORECASE),
-        re.compile(r"(\bphone(?:\s+number)?\b|\bcell\b|\bmobile\b)\s*:?\s*(" + phone_pattern_str + r")", re.IGNORECASE), # e.g. "Phone: (123) 456-7890"
-    ]
-
-    found_phones = []
-
-    for pattern in keyword_phone_patterns:
-        matches = pattern.findall(text)
-        for match_group in matches:
-            phone_number = match_group if isinstance(match_group, str) else match_group[-1]
-            found_phones.append(phone_number.strip())
-
-    # If no keyworded phones found, try a general search (higher chance of false positives)
-    if not found_phones:
-        general_matches = re.findall(phone_pattern_str, text)
-        for match in general_matches:
-            found_phones.append(match.strip())
-            
-    # Basic cleanup (remove common separators for consistent storage, though not full normalization)
-    cleaned_phones = [re.sub(r"[-.\s\(\)]", "", phone) for phone in found_phones]
-    return list(set(cleaned_phones)) # Return unique, somewhat cleaned phones
-
-def _detect_names(text: str) -> List[str]:
+# Keyworded alternatives, each capturing its value in a named group.
+# "My phone number is ...", "call me at ...", "contact no. ..."
+_PHONE_AFTER_PHRASE = r"(?:my\s+phone(?:\s+number)?\s+is|call\s+me\s+at|my\s+number\s+is|contact\s+no\.?\s*(?:is)?)\s*:?\s*(?P<phone_phrase>" + PHONE_PATTERN + r")"
+# "Phone: (123) 456-7890", "cell 123.456.7890"
+_PHONE_AFTER_LABEL = r"(?:\bphone(?:\s+number)?\b|\bcell\b|\bmobile\b)\s*:?\s*(?P<phone_label>" + PHONE_PATTERN + r")"
+# "My name is John Doe", "I am John Doe", "I'm John Doe"
+_NAME_AFTER_INTRO = r"(?:my\s+name\s+is|i\s*am|i'm)\s+(?P<name_intro>" + NAME_PATTERN + r")"
+# "You can call me John", "Call me John Doe"
+_NAME_AFTER_CALL_ME = r"(?:call\s+me)\s+(?P<name_call>" + NAME_PATTERN + r")"
+
+# Substrings at least one of which must appear (lowercased) for a keyed pattern to match
+_PHONE_KEYWORDS = ("phone", "call", "number", "contact", "cell", "mobile")
+_NAME_KEYWORDS = ("name", "am", "i'm", "call")
+
+_DIGIT = re.compile(r"\d")
+_PHONE_SEPARATORS = re.compile(r"[-.\s\(\)]")
+
+
+class LeadScan(NamedTuple):
+    emails: List[str]
+    phones: List[str]
+    names: List[str]
+
+    @property
+    def found(self) -> bool:
+        return bool(self.emails or self.phones or self.names)
+
+    def joined(self, field: str) -> Optional[str]:
+        values = getattr(self, field)
+        return ", ".join(values) if values else None
+
+
+class LeadScanner:
     """
-    Detects potential names, prioritizing those mentioned with keywords.
-    This is heuristic and NOT a replacement for proper NER (e.g., spaCy).
-    (pip install spacy; python -m spacy download en_core_web_sm)
-    Example with spaCy:
-    import spacy
-    nlp = spacy.load("en_core_web_sm")
-    doc = nlp(text)
-    names = [ent.text for ent in doc.ents if ent.label_ == "PERSON"]
-    if names: return list(set(names))
+    Detects emails, phone numbers and names in chat messages.
+
+    Patterns are compiled once. Cheap checks run first so most messages never
+    reach a regex: no "@" skips the email scan, fewer than `min_phone_digits`
+    digits skips the phone scans, and no keyword substring skips the keyed
+    scan. Keyed phone and name phrases are matched together in one combined
+    pass. When no keyed phone or name is found, the unkeyed phone pattern and
+    (with `name_fallback`) a run of 2-3 capitalized words are tried. Both are
+    prone to false positives, e.g. "New York City".
+
+    This is heuristic and not a replacement for proper parsing or NER
+    (the 'phonenumbers' library, spaCy's PERSON entities).
     """
-    
-    # Pattern for a potential name: 1 to 3 capitalized words
-    # \b[A-Z][a-z']+      # First capitalized word (e.g., John, O'Malley)
-    # (?:\s+[A-Z][a-z']+){0,2} # 0 to 2 additional capitalized words
-    name_structure_pattern = r"\b[A-Z][a-z']+(?:\s+[A-Z][a-z']+){0,2}\b"
-
-    keyword_name_patterns = [
-        # "My name is John Doe", "I am John Doe", "I'm John Doe"
-        re.compile(r"(?:my\s+name\s+is|i\s*am|i'm)\s+(" + name_structure_pattern + r")", re.IGNORECASE),
-        # "You can call me John", "Call me John Doe"
-        re.compile(r"(?:call\s+me)\s+(" + name_structure_pattern + r")", re.IGNORECASE),
-        # "The user's name is John" (less likely for self-reporting but an example)
-        # re.compile(r"(?:user(?:\s*name)?\s+is)\s+(" + name_structure_pattern + r")", re.IGNORECASE),
-    ]
-
-    found_names = []
-    # First, try to find names mentioned with keywords
-    for pattern in keyword_name_patterns:
-        matches = pattern.findall(text)
-        for match_group in matches:
-            name_candidate = match_group if isinstance(match_group, str) else match_group[-1]
-            # Basic filter: avoid single-letter "names" unless it's like "A. B. Smith" (which this regex doesn't handle well)
-            if len(name_candidate.replace(" ", "")) > 1: 
-                found_names.append(name_candidate.strip())
-
-    # Fallback: If no keyworded names, try to find any sequence of 2-3 capitalized words
-    # This is very prone to false positives (e.g., "New York City", "Customer Support Team")
-    # Use with caution or add more sophisticated filtering if this fallback is enabled.
-    
-    if not found_names:
-        general_name_candidates = re.findall(r"(\b[A-Z][a-z']+\s+[A-Z][a-z']+(?:\s+[A-Z][a-z']+)?)", text)
-        for candidate in general_name_candidates:
-            if len(candidate.replace(" ", "")) > 2:
-                found_names.append(candidate.strip())
-
-    return list(set(found_names))
\ No newline at end of file
+
+    def __init__(self, min_phone_digits: int = 7, name_fallback: bool = True):
+        self.min_phone_digits = min_phone_digits
+        self.name_fallback = name_fallback
+
+        self._email = re.compile(EMAIL_PATTERN)
+        self._phone = re.compile(PHONE_PATTERN)
+        # Same as \b[A-Z]..., but starting on the character class lets the regex
+        # engine skip straight to uppercase letters instead of trying every position
+        self._fallback_name = re.compile(r"([A-Z](?<!\w[A-Z])[a-z']+\s+[A-Z][a-z']+(?:\s+[A-Z][a-z']+)?)")
+        self._keyed_all = re.compile(
+            "|".join((_PHONE_AFTER_PHRASE, _PHONE_AFTER_LABEL, _NAME_AFTER_INTRO, _NAME_AFTER_CALL_ME)),
+            re.IGNORECASE,
+        )
+        self._keyed_phones = re.compile("|".join((_PHONE_AFTER_PHRASE, _PHONE_AFTER_LABEL)), re.IGNORECASE)
+        self._keyed_names = re.compile("|".join((_NAME_AFTER_INTRO, _NAME_AFTER_CALL_ME)), re.IGNORECASE)
+
+    def scan(self, text: str) -> LeadScan:
+        if not text:
+            return LeadScan([], [], [])
+
+        emails: List[str] = []
+        phones: List[str] = []
+        names: List[str] = []
+
+        if "@" in text:
+            emails = self._email.findall(text)
+
+        maybe_phone = len(_DIGIT.findall(text)) >= self.min_phone_digits
+        lowered = text.lower()
+        phone_keyed = maybe_phone and any(keyword in lowered for keyword in _PHONE_KEYWORDS)
+        name_keyed = any(keyword in lowered for keyword in _NAME_KEYWORDS)
+
+        keyed = None
+        if phone_keyed and name_keyed:
+            keyed = self._keyed_all
+        elif phone_keyed:
+            keyed = self._keyed_phones
+        elif name_keyed:
+            keyed = self._keyed_names
+
+        if keyed is not None:
+            for match in keyed.finditer(text):
+                groups = match.groupdict()
+                phone = groups.get("phone_phrase") or groups.get("phone_label")
+                if phone:
+                    phones.append(phone.strip())
+                    continue
+                name = groups.get("name_intro") or groups.get("name_call")
+                # Avoid single-letter "names"
+                if name and len(name.replace(" ", "")) > 1:
+                    names.append(name.strip())
+
+        # If no keyworded phones were found, try a general search (higher chance of false positives)
+        if maybe_phone and not phones:
+            phones = [match.strip() for match in self._phone.findall(text)]
+
+        if self.name_fallback and not names and not text.islower():
+            names = [
+                candidate.strip()
+                for candidate in self._fallback_name.findall(text)
+                if len(candidate.replace(" ", "")) > 2
+            ]
+
+        # Remove common separators for consistent storage (not full normalization)
+        phones = [_PHONE_SEPARATORS.sub("", phone) for phone in phones]
+
+        return LeadScan(_unique(emails), _unique(phones), _unique(names))
+
+
+def _unique(values: List[str]) -> List[str]:
+    return list(dict.fromkeys(values))
+
+
+# Shared scanner used by save_message
+lead_scanner = LeadScanner()
@@ -0,0 +1,190 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.utils.cache import TTLCache
+from app.utils.lead_capture import LeadScanner, lead_scanner
+
+# Signature of the sink that stores one lead:
+# (session_id, message_uuid, name, email, phone, original_content) -> None
+LeadSink = Callable[[str, str, Optional[str], Optional[str], Optional[str], str], Awaitable[None]]
+
+# (session_id, message_uuid, content)
+LeadJob = Tuple[str, str, str]
+
+_STOP = object()
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def normalize_phone(phone: str) -> str:
+    digits = _NON_DIGITS.sub("", phone)
+    # 1-555-... and 555-... are the same North American number
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+
+class LeadCaptureWorkers:
+    """
+    Scans user messages for lead info on a small pool of background tasks.
+
+    `submit()` never waits: jobs go into a bounded queue and are dropped
+    (and counted) when it is full, so chat requests never pay for lead
+    capture. Each worker takes up to `batch_size` queued messages at a time,
+    scans them and hands the leads to `sink`. Emails, phones and names already
+    captured for a session (after normalization) are filtered out, and a
+    message that only repeats known values produces no row at all. Values
+    count as captured once the sink call succeeds, so a failed write doesn't
+    suppress them in the session's later messages.
+    `stop()` processes everything that was accepted before returning.
+    """
+
+    def __init__(
+        self,
+        sink: LeadSink,
+        scanner: LeadScanner = lead_scanner,
+        workers: int = 2,
+        max_pending: int = 1000,
+        batch_size: int = 50,
+        dedupe_sessions: int = 50000,
+        dedupe_ttl: Optional[float] = 86400,
+    ):
+        self._sink = sink
+        self.scanner = scanner
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+        # session_id -> set of ("email" | "phone" | "name", normalized value)
+        self._seen = TTLCache(maxsize=dedupe_sessions, ttl=dedupe_ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.processed = 0
+        self.leads_found = 0
+        self.leads_saved = 0
+        self.duplicates_skipped = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Process everything still queued and stop the workers."""
+        if not self.running:
+            return
+        # One marker per worker; each exits after taking its own
+        for _ in self._tasks:
+            await self._queue.put(_STOP)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, session_id: str, message_uuid: str, content: str) -> None:
+        """
+        Queues a user message for lead capture without waiting.
+        Without running workers (scripts, tests) it is processed straight away.
+        """
+        if not content:
+            return
+        self.submitted += 1
+        if not self.running:
+            await self._process([(session_id, message_uuid, content)])
+            return
+        try:
+            self._queue.put_nowait((session_id, message_uuid, content))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "pending": self._queue.qsize() if self._queue else 0,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "leads_found": self.leads_found,
+            "leads_saved": self.leads_saved,
+            "duplicates_skipped": self.duplicates_skipped,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "sessions_tracked": len(self._seen),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch: List[LeadJob] = [item]
+            stopping = False
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._process(batch)
+            if stopping:
+                return
+
+    async def _process(self, batch: List[LeadJob]) -> None:
+        for session_id, message_uuid, content in batch:
+            self.processed += 1
+            try:
+                scan = self.scanner.scan(content)
+                if not scan.found:
+                    continue
+                self.leads_found += 1
+
+                keys = set()
+                emails = self._unseen(session_id, "email", scan.emails, normalize_email, keys)
+                phones = self._unseen(session_id, "phone", scan.phones, normalize_phone, keys)
+                names = self._unseen(session_id, "name", scan.names, str.casefold, keys)
+                if not (emails or phones or names):
+                    self.duplicates_skipped += 1
+                    continue
+
+                detected_name = ", ".join(names) or None
+                detected_email = ", ".join(emails) or None
+                detected_phone = ", ".join(phones) or None
+                print(f"Lead info found in message {message_uuid}: Name='{detected_name}', Email='{detected_email}', Phone='{detected_phone}'")
+                await self._sink(session_id, message_uuid, detected_name, detected_email, detected_phone, content)
+                self._remember(session_id, keys)
+                self.leads_saved += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Error during lead capture for message UUID {message_uuid}: {e}")
+
+    def _unseen(self, session_id: str, kind: str, values: List[str], normalize: Callable[[str], str], keys: Set[Tuple[str, str]]) -> List[str]:
+        """Returns the values not yet captured for the session, adding their keys to `keys` (see _remember)."""
+        if not values:
+            return []
+        seen = self._seen.get(session_id) or set()
+        fresh = []
+        for value in values:
+            key = (kind, normalize(value))
+            if key not in seen and key not in keys:
+                keys.add(key)
+                fresh.append(value)
+        return fresh
+
+    def _remember(self, session_id: str, keys: Set[Tuple[str, str]]) -> None:
+        """Marks values as captured for the session, once their lead was written."""
+        seen = self._seen.get(session_id)
+        if seen is None:
+            seen = set()
+            self._seen.set(session_id, seen)
+        seen.update(keys)
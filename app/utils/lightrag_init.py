@@ -1,21 +1,108 @@
-from lightrag import LightRAG, QueryParam
-from lightrag.llm.llama_index_impl import llama_index_complete_if_cache, llama_index_embed
-from llama_index.llms.google_genai import GoogleGenAI
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from lightrag.utils import EmbeddingFunc
-from lightrag.kg.shared_storage import initialize_pipeline_status
+# lightrag, llama_index and google-genai take seconds to import, so they are
+# imported on first use (or by preload_rag_modules during startup), not here.
+from app.utils.embedding_cache import embedding_cache
+from app.utils.answer_cache import answer_cache
+from app.utils.ingest_index import chunk_doc_id, content_hash, ingest_index, iter_file_chunks
+from app.utils.query_router import QueryTrace, query_router
+from app.utils.tenants import tenant_dir, tenants
 
 import asyncio
+import dataclasses
+import importlib
+import inspect
 import os
 import logging
-import nest_asyncio
+import weakref
+from dotenv import load_dotenv
 
-nest_asyncio.apply()
+# Load environment variables
+load_dotenv()
 
 # Set up logger
 logger = logging.getLogger(__name__)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Model settings
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+
+# Concurrency limits LightRAG applies to model calls, and texts per embedding request
+LLM_MAX_ASYNC = int(os.getenv("LLM_MAX_ASYNC", "4"))
+EMBEDDING_MAX_ASYNC = int(os.getenv("EMBEDDING_MAX_ASYNC", "16"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Documents LightRAG extracts at once within one insert call
+INGEST_MAX_PARALLEL_INSERT = int(os.getenv("INGEST_MAX_PARALLEL_INSERT", "4"))
+# Chunks of a file document read back and sent to LightRAG per insert call
+INGEST_FILE_BATCH_CHUNKS = int(os.getenv("INGEST_FILE_BATCH_CHUNKS", "64"))
+
+# One LLM and one embedding client per event loop. The async transports inside
+# them are bound to the loop that first used them, and scripts that call
+# asyncio.run() more than once would otherwise reuse a closed loop's client.
+_llm_clients = weakref.WeakKeyDictionary()
+_embed_clients = weakref.WeakKeyDictionary()
+
+# Heavy modules used by this file, in import order
+HEAVY_MODULES = (
+    "lightrag",
+    "lightrag.utils",
+    "lightrag.kg.shared_storage",
+    "lightrag.llm.llama_index_impl",
+    "llama_index.llms.google_genai",
+    "llama_index.embeddings.google_genai",
+)
+
+def preload_rag_modules() -> None:
+    """Imports the LightRAG/LLM stack. Blocking; run it in a thread at startup."""
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+def _current_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.get_event_loop()
+
+def get_llm():
+    """Shared GoogleGenAI client, so calls reuse its keep-alive connections."""
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    loop = _current_loop()
+    llm = _llm_clients.get(loop)
+    if llm is None:
+        llm = GoogleGenAI(
+            model=LLM_MODEL,
+            api_key=GEMINI_API_KEY,
+            temperature=LLM_TEMPERATURE,
+        )
+        _llm_clients[loop] = llm
+    return llm
+
+def get_embed_model():
+    """Shared GoogleGenAIEmbedding client; a LightRAG batch is sent as one request."""
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+
+    loop = _current_loop()
+    embed_model = _embed_clients.get(loop)
+    if embed_model is None:
+        embed_model = GoogleGenAIEmbedding(
+            model_name=EMBEDDING_MODEL,
+            api_key=GEMINI_API_KEY,
+            embed_batch_size=EMBEDDING_BATCH_SIZE,
+        )
+        _embed_clients[loop] = embed_model
+    return embed_model
+
+async def _remote_embed(texts):
+    from lightrag.llm.llama_index_impl import llama_index_embed
+
+    return await llama_index_embed(texts, embed_model=get_embed_model())
+
+async def embedding_func(texts):
+    # Chunks and queries embedded before are served from the on-disk cache
+    return await embedding_cache.embed(f"{EMBEDDING_MODEL}:{EMBEDDING_DIM}", texts, _remote_embed)
+
 system_prompt_text = """
     You are a highly intelligent, exceptionally friendly, and engaging sales lead capture assistant. 
     Your core mission is to provide outstanding value to users through helpful and concise interactions.
@@ -39,15 +126,12 @@ system_prompt_text = """
 
 # Initialize with Google Gemini using the unified SDK
 async def llm_model_func(prompt, system_prompt=None, history_messages=[], **kwargs):
+    from lightrag.llm.llama_index_impl import llama_index_complete_if_cache
+
     try:
-        # Initialize GoogleGenerativeAI if not in kwargs
+        # Use the pooled client unless one is passed in kwargs
         if 'llm_instance' not in kwargs:
-            llm_instance = GoogleGenAI(
-                model="gemini-1.5-flash",  # or "gemini-2.0-flash" if available
-                api_key=GEMINI_API_KEY,
-                temperature=0.7,
-            )
-            kwargs['llm_instance'] = llm_instance
+            kwargs['llm_instance'] = get_llm()
 
         # Handle the completion synchronously to avoid the await issue
         response = await llama_index_complete_if_cache(
@@ -62,124 +146,351 @@ async def llm_model_func(prompt, system_prompt=None, history_messages=[], **kwar
         logger.error(f"LLM request failed: {str(e)}")
         raise
 
-async def initialize_rag():
+async def initialize_rag(working_dir=None, workspace=""):
+    """
+    Builds a LightRAG whose files live in `working_dir`.
+
+    With a `workspace` (one per tenant, see tenants.tenant_workspace) the
+    instance's storages and pipeline status are kept apart from every other
+    instance in the process.
+    """
+    from lightrag import LightRAG
+    from lightrag.utils import EmbeddingFunc
+    from lightrag.kg.shared_storage import initialize_pipeline_status
+
     # Ensure the working directory exists
-    import os
-    working_dir = os.environ.get("RAG_WORKING_DIR", "./rag_data")
+    working_dir = working_dir or os.environ.get("RAG_WORKING_DIR", "./rag_data")
     os.makedirs(working_dir, exist_ok=True)
+
+    # max_parallel_insert and workspace only exist in newer releases
+    fields = {field.name for field in dataclasses.fields(LightRAG)}
+    options = {}
+    if "max_parallel_insert" in fields:
+        options["max_parallel_insert"] = INGEST_MAX_PARALLEL_INSERT
+    rag_dir = working_dir
+    if workspace and "workspace" in fields:
+        # File storages keep a workspace's files in <working_dir>/<workspace>,
+        # so the parent is passed and the files stay where they've always been
+        rag_dir = os.path.dirname(os.path.normpath(working_dir))
+        if os.path.basename(os.path.normpath(working_dir)) != workspace:
+            raise ValueError(f"Working dir {working_dir} doesn't end in workspace {workspace}")
+        options["workspace"] = workspace
     
     rag = LightRAG(
-        working_dir=working_dir,
+        working_dir=rag_dir,
         llm_model_func=llm_model_func,
+        llm_model_max_async=LLM_MAX_ASYNC,
         embedding_func=EmbeddingFunc(
             # Google embeddings dimension
-            embedding_dim=768,
+            embedding_dim=EMBEDDING_DIM,
             max_token_size=8192,
-            func=lambda texts: llama_index_embed(
-                texts,
-                embed_model=GoogleGenAIEmbedding(
-                    model_name="text-embedding-004",
-                    api_key=GEMINI_API_KEY
-                )
-            ),
+            func=embedding_func,
         ),
+        embedding_func_max_async=EMBEDDING_MAX_ASYNC,
+        embedding_batch_num=EMBEDDING_BATCH_SIZE,
+        **options,
     )
 
     # Initialize storages
     await rag.initialize_storages()
-    await initialize_pipeline_status()
+    if "workspace" in inspect.signature(initialize_pipeline_status).parameters:
+        await initialize_pipeline_status(workspace=getattr(rag, "workspace", workspace))
+    else:
+        await initialize_pipeline_status()
 
     # rag.chunk_entity_relation_graph.embedding_func = rag.embedding_func
 
     return rag
 
 # Function to process files with proper error handling
-def insert_data(rag, file_path):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            print(f"Processing file")
-            content = f.read()
-            
-            # Check if content is empty
-            if not content or content.strip() == "":
-                print("Error: Document content is empty")
-                return False
-                
-            # Print content length for debugging
-            print(f"Document content length: {len(content)} characters")
-            
-            # Add a try-except block specifically for the insert operation
+# Inserts are serialized: releases without workspaces share one pipeline status
+# across tenants (so overlapping inserts would skip each other's documents), and
+# ingestion jobs read the pipeline's progress as their own
+_insert_lock = asyncio.Lock()
+
+async def _ainsert(rag, texts, ids, doc_keys):
+    # file_paths (source shown in LightRAG's references) only exists in newer releases
+    if "file_paths" in inspect.signature(rag.ainsert).parameters:
+        await rag.ainsert(texts, ids=ids, file_paths=doc_keys)
+    else:
+        await rag.ainsert(texts, ids=ids)
+
+async def _adelete(rag, doc_id):
+    # Newer releases return a DeletionResult instead of raising; older ones return None
+    result = await rag.adelete_by_doc_id(doc_id)
+    status = getattr(result, "status", None)
+    if result is not None and status not in ("success", "not_found"):
+        raise RuntimeError(f"LightRAG couldn't delete {doc_id} ({status}): {getattr(result, 'message', '')}")
+
+async def _unprocessed(rag, hashes):
+    """
+    The chunks (by hash) LightRAG didn't get to PROCESSED: ainsert logs a
+    document's failure and marks it FAILED in doc_status instead of raising.
+    """
+    doc_status = getattr(rag, "doc_status", None)
+    if doc_status is None or not hashes:
+        return set()
+    hashes = list(hashes)
+    rows = await doc_status.get_by_ids([chunk_doc_id(h) for h in hashes])
+    failed = set()
+    for h, row in zip(hashes, rows):
+        status = row.get("status") if isinstance(row, dict) else getattr(row, "status", None)
+        # DocStatus is a str enum in newer releases and a plain string in older ones
+        if str(getattr(status, "value", status)).lower() != "processed":
+            failed.add(h)
+    return failed
+
+def _failed_chunks_error(failed, doc_keys):
+    return RuntimeError(f"LightRAG failed to process {len(failed)} chunk(s) of {', '.join(doc_keys)}")
+
+async def insert_documents(rag, documents, embed_id="default"):
+    """
+    Adds (or updates) a batch of documents ({doc_key: content}) in the embed's
+    knowledge base with a single LightRAG insert.
+
+    Content already in the knowledge base is skipped: only chunks the ingest
+    index hasn't seen are sent to LightRAG, and chunks the previous version of
+    a document had but this one doesn't are deleted. Returns each document's
+    chunk counts ({"new", "unchanged", "removed"}), keyed by doc_key.
+
+    Raises if LightRAG failed on any chunk, once the rest of the batch is
+    recorded; documents with failed chunks are retried by the next ingest.
+    """
+    working_dir = tenant_dir(embed_id)
+    async with _insert_lock:
+        plans = [await ingest_index.plan(working_dir, doc_key, content) for doc_key, content in documents.items()]
+
+        # Documents in one batch can share chunks: each is inserted once, and a
+        # chunk one document dropped but another one in the batch has is kept
+        insert, sources = {}, {}
+        for plan in plans:
+            for h, text in plan.insert.items():
+                if h not in insert:
+                    insert[h] = text
+                    sources[h] = plan.doc_key
+        kept = {h for plan in plans for h in plan.chunks}
+        delete = {h for plan in plans for h in plan.delete if h not in kept}
+
+        try:
+            failed = set()
+            if insert:
+                await _ainsert(rag, list(insert.values()), [chunk_doc_id(h) for h in insert], list(sources.values()))
+                failed = await _unprocessed(rag, insert)
+            partial = {plan.doc_key for plan in plans if failed.intersection(plan.insert)}
+            # A document LightRAG failed on keeps its old chunks until it goes in
+            delete.difference_update(h for plan in plans if plan.doc_key in partial for h in plan.delete)
+            # A failed delete leaves the index uncommitted, so the next ingest retries it
+            for h in delete:
+                await _adelete(rag, chunk_doc_id(h))
+            for plan in plans:
+                await ingest_index.commit(working_dir, plan.without(failed) if plan.doc_key in partial else plan)
+            if partial:
+                raise _failed_chunks_error(failed, partial)
+        finally:
+            if insert or delete:
+                # Cached answers for this embed may be outdated now
+                answer_cache.invalidate(embed_id)
+                tenants.refresh_size(embed_id)
+    return {plan.doc_key: plan.counts() for plan in plans}
+
+async def insert_document(rag, content, embed_id="default", doc_key=None):
+    """Adds (or updates) one document; see insert_documents. Returns its chunk counts."""
+    doc_key = doc_key or content_hash(content)
+    counts = await insert_documents(rag, {doc_key: content}, embed_id)
+    return counts[doc_key]
+
+async def remove_document(rag, doc_key, embed_id="default"):
+    """Deletes a document's chunks (those no other document has) and forgets it. Returns the chunks removed."""
+    working_dir = tenant_dir(embed_id)
+    async with _insert_lock:
+        plan = await ingest_index.plan(working_dir, doc_key, "")
+        try:
+            # The document stays in the index until all of its chunks are gone
+            for h in plan.delete:
+                await _adelete(rag, chunk_doc_id(h))
+            await ingest_index.remove(working_dir, doc_key)
+        finally:
+            if plan.delete:
+                answer_cache.invalidate(embed_id)
+                tenants.refresh_size(embed_id)
+    return plan.removed
+
+def _next_file_batch(chunks, wanted, size):
+    """Reads on to the next `size` chunks LightRAG still needs ({hash: text}); blocking."""
+    batch = {}
+    for chunk in chunks:
+        h = content_hash(chunk)
+        if h in wanted:
+            wanted.discard(h)
+            batch[h] = chunk
+            if len(batch) >= size:
+                break
+    return batch
+
+async def insert_file(rag, file_path, embed_id="default", doc_key=None):
+    """
+    Same as insert_document for a document stored in a text file, without
+    holding its text in memory: the file is read once to hash it and its
+    chunks, then again to send the chunks LightRAG doesn't have, in batches
+    of INGEST_FILE_BATCH_CHUNKS. Returns its chunk counts.
+    """
+    working_dir = tenant_dir(embed_id)
+    doc_key = doc_key or file_path
+    async with _insert_lock:
+        plan = await ingest_index.plan_file(working_dir, doc_key, file_path)
+        if not plan.chunks:
+            raise ValueError("Document content is empty")
+        try:
+            wanted = set(plan.insert)
+            failed = set()
+            chunks = iter_file_chunks(file_path)
             try:
-                rag.insert(content)
-                print(f"Successfully processed")
-                return True
-            except ValueError as ve:
-                print(f"ValueError during RAG insert: {str(ve)}")
-                # This is likely the 'Set of Tasks/Futures is empty' error
-                if "Set of Tasks/Futures is empty" in str(ve):
-                    print("This error typically occurs when the entity extraction process can't find any content to process.")
-                    print("Check that your document has meaningful text that can be processed.")
-                return False
-            except Exception as insert_error:
-                print(f"Error during RAG insert: {str(insert_error)}")
-                return False
+                while wanted:
+                    batch = await asyncio.to_thread(_next_file_batch, chunks, wanted, max(1, INGEST_FILE_BATCH_CHUNKS))
+                    if not batch:
+                        raise RuntimeError(f"{file_path} changed while it was being inserted")
+                    await _ainsert(rag, list(batch.values()), [chunk_doc_id(h) for h in batch], [doc_key] * len(batch))
+                    failed |= await _unprocessed(rag, batch)
+            finally:
+                chunks.close()
+            if failed:
+                # Record the chunks that went in; the old ones are deleted once the rest does too
+                await ingest_index.commit(working_dir, plan.without(failed))
+                raise _failed_chunks_error(failed, [doc_key])
+            for h in plan.delete:
+                await _adelete(rag, chunk_doc_id(h))
+            await ingest_index.commit(working_dir, plan)
+        finally:
+            if plan.insert or plan.delete:
+                answer_cache.invalidate(embed_id)
+                tenants.refresh_size(embed_id)
+    return plan.counts()
+
+async def insert_data(rag, file_path, embed_id="default", doc_key=None):
+    try:
+        print(f"Processing file")
+        # Print content length for debugging
+        print(f"Document size: {os.path.getsize(file_path)} bytes")
+
+        # Add a try-except block specifically for the insert operation
+        try:
+            # The file is streamed into LightRAG in batches of chunks, never read whole
+            counts = await insert_file(rag, file_path, embed_id, doc_key)
+            print(f"Successfully processed: {counts['new']} new, {counts['unchanged']} unchanged, {counts['removed']} removed chunks")
+            return counts
+        except ValueError as ve:
+            print(f"ValueError during RAG insert: {str(ve)}")
+            # This is likely the 'Set of Tasks/Futures is empty' error
+            if "Set of Tasks/Futures is empty" in str(ve):
+                print("This error typically occurs when the entity extraction process can't find any content to process.")
+                print("Check that your document has meaningful text that can be processed.")
+            return False
+        except Exception as insert_error:
+            print(f"Error during RAG insert: {str(insert_error)}")
+            return False
     except Exception as e:
         print(f"Error processing file: {str(e)}")
         return False
 
+def _cacheable(trace):
+    # Downgraded answers (a cheaper mode to meet the latency budget) and ones
+    # made without retrieval shouldn't be replayed for the next hour
+    return not trace.downgrades and trace.mode != "bypass"
+
 # Function to query the RAG system
-def query_rag(rag, query_text):
+async def query_rag(rag, query_text, embed_id="default", mode="auto", trace=None):
+    # The router picks the LightRAG mode; pass a QueryTrace to get the chosen mode and stage timings back
+    trace = trace or QueryTrace()
+
+    # Repeated and near-duplicate questions are answered from the answer cache
+    cached = await answer_cache.lookup(query_text, embed_fn=embedding_func, scope=embed_id, mode=mode)
+    trace.stage("cache")
+    if cached.answer is not None:
+        trace.mode = "cache"
+        query_router.record(trace)
+        return cached.answer.text
+
     try:
         query = f"Please answer the following query according to the given system prompt: {query_text}"
-        return rag.query(
-            query, 
+        plan = query_router.plan(query_text, mode)
+        trace.stage("route")
+        response = await query_router.aquery(
+            rag,
+            query,
+            plan,
+            stream=False,
+            trace=trace,
             system_prompt=system_prompt_text,
-            param=QueryParam(stream=True)
             )
+        trace.stage("rag")
+        if isinstance(response, str) and _cacheable(trace):
+            answer_cache.store(cached, [response], embedding_func)
+        return response
     except Exception as e:
         print(f"Error querying RAG: {str(e)}")
         return f"Error processing your query: {str(e)}"
+    finally:
+        query_router.record(trace)
 
 # Function to stream query results from the RAG system
-async def stream_query_rag(rag, query_text):
+async def stream_query_rag(rag, query_text, embed_id="default", mode="auto", trace=None):
     """
     Stream query results from the RAG system
     
     Args:
         rag: The LightRAG instance
         query_text: The query text
+        embed_id: The embed (tenant) the instance belongs to, for the answer cache
+        mode: "auto" to let the query router choose, or a LightRAG query mode
+        trace: Optional QueryTrace that receives the chosen mode and stage timings
         
     Yields:
         Chunks of the response as they are generated
     """
+    trace = trace or QueryTrace()
+
+    # A cached answer is replayed chunk by chunk, exactly as it was first streamed
+    cached = await answer_cache.lookup(query_text, embed_fn=embedding_func, scope=embed_id, mode=mode)
+    trace.stage("cache")
+    if cached.answer is not None:
+        trace.mode = "cache"
+        query_router.record(trace)
+        for chunk in cached.answer.chunks:
+            yield chunk
+        return
 
     query = f"Please answer the following query according to the given system prompt: {query_text}"
+    chunks = []
 
     try:
-        print("Using QueryParam(stream=True) for streaming")
-        # Use the query method with stream=True parameter
-        result = rag.query(
+        plan = query_router.plan(query_text, mode)
+        trace.stage("route")
+        # The latency budget covers the time until LightRAG starts streaming
+        result = await query_router.aquery(
+            rag,
             query,
-            param=QueryParam(stream=True),
+            plan,
+            stream=True,
+            trace=trace,
             system_prompt=system_prompt_text
         )
-        
-        # If it's not an async generator, it might be a synchronous iterable
-        # or just a regular result
-        if hasattr(result, '__iter__'):
-            print("Contains __iter__")
-            for chunk in result:
-                yield chunk
-                await asyncio.sleep(0.005)  # Small delay between chunks
+        trace.stage("rag")
+
+        if isinstance(result, str):
+            # LightRAG answers without streaming in some cases (cache hits, "no context" replies)
+            chunks.append(result)
+            yield result
         else:
-            # If it's a regular result, simulate streaming by words
-            print("Fallback to simulated streaming by words")
-            result_str = str(result)
-            words = result_str.split()
-            
-            for word in words:
-                yield word + " "
-                await asyncio.sleep(0.005)  # Simulate streaming with small delay
+            # Chunks are forwarded as soon as the LLM emits them
+            async for chunk in result:
+                chunks.append(chunk)
+                yield chunk
+        trace.stage("stream")
+
+        if _cacheable(trace):
+            answer_cache.store(cached, chunks, embedding_func)
     except Exception as e:
         print(f"Error streaming query from RAG: {str(e)}")
         yield f"Error processing your query: {str(e)}"
+    finally:
+        query_router.record(trace)
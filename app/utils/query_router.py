@@ -0,0 +1,283 @@
+import asyncio
+import dataclasses
+import os
+import re
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+# Load environment variables
+load_dotenv()
+
+# Turn off to send every query through QUERY_DEFAULT_MODE, as before routing existed
+QUERY_ROUTING = os.getenv("QUERY_ROUTING", "true").lower() == "true"
+QUERY_DEFAULT_MODE = os.getenv("QUERY_DEFAULT_MODE", "hybrid")
+# Latency budget per query: the whole answer for /query, the first token for streams. 0 disables downgrades
+QUERY_LATENCY_BUDGET_MS = float(os.getenv("QUERY_LATENCY_BUDGET_MS", "8000"))
+
+# Retrieval sizes and context token budgets for naive lookups and graph (local/global/hybrid/mix) queries
+QUERY_NAIVE_TOP_K = int(os.getenv("QUERY_NAIVE_TOP_K", "10"))
+QUERY_NAIVE_MAX_TOKENS = int(os.getenv("QUERY_NAIVE_MAX_TOKENS", "6000"))
+QUERY_GRAPH_TOP_K = int(os.getenv("QUERY_GRAPH_TOP_K", "40"))
+QUERY_GRAPH_MAX_TOKENS = int(os.getenv("QUERY_GRAPH_MAX_TOKENS", "16000"))
+
+MODES = ("bypass", "naive", "local", "global", "hybrid", "mix")
+
+# Cheaper mode to fall back to when a mode would miss the budget. Graph modes
+# spend an extra LLM call on keyword extraction, which naive skips. naive has
+# no fallback: answering without the knowledge base is never a downgrade.
+DOWNGRADE = {
+    "mix": "naive",
+    "hybrid": "naive",
+    "global": "naive",
+    "local": "naive",
+}
+
+_WORD = re.compile(r"[\w'@.-]+")
+# Whole messages made only of greetings / thanks / acknowledgements ("hi there!",
+# "ok thanks, bye"); "hi, what is your pricing?" is a question, not small talk
+_SMALL_TALK = re.compile(
+    r"(?:(?:hi|hello|hey|hiya|howdy|yo|greetings|good (?:morning|afternoon|evening|day)|"
+    r"how are you|how's it going|what's up|sup|thanks|thank you|thx|ty|cheers|"
+    r"ok|okay|cool|great|nice|awesome|perfect|bye|goodbye|see you|have a nice day)"
+    r"(?: (?:there|all|everyone|so much|a lot|again|very much))?[\s!?.,:;)(-]*)+",
+    re.IGNORECASE,
+)
+_THEMATIC = re.compile(
+    r"\b(overview|summari[sz]e|summary|in general|overall|main (themes|topics|features|points)|"
+    r"big picture|everything|all (your|the) (products|services|features|plans))\b",
+    re.IGNORECASE,
+)
+_RELATIONAL = re.compile(
+    r"\b(compare|comparison|difference|differ|versus|vs\.?|pros and cons|relationship|"
+    r"related|depend|impact|affect|why|explain|trade-?offs?)\b",
+    re.IGNORECASE,
+)
+
+# Queries up to this many words that only do small talk skip retrieval
+SMALL_TALK_MAX_WORDS = 6
+# Queries over this many words (or with several questions) get graph retrieval
+COMPLEX_MIN_WORDS = 16
+# A mode's latency estimate halves for every this many seconds it goes unmeasured,
+# so a mode that was skipped after a slow spell gets tried again
+LATENCY_HALF_LIFE = 60.0
+
+
+def validate_mode(mode: str) -> str:
+    """'auto' lets the router decide; anything else must be a LightRAG mode."""
+    if mode != "auto" and mode not in MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid mode. Use 'auto' or one of: {', '.join(MODES)}.",
+        )
+    return mode
+
+
+class QueryPlan(NamedTuple):
+    mode: str
+    reason: str
+    top_k: int
+    max_tokens: int
+
+
+class QueryTrace:
+    """Mode decisions and per-stage timings of one query."""
+
+    __slots__ = ("planned", "mode", "reason", "downgrades", "timings", "_started", "_mark")
+
+    def __init__(self):
+        self.planned: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.reason: Optional[str] = None
+        self.downgrades = []
+        self.timings: Dict[str, float] = {}
+        self._started = self._mark = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def stage(self, name: str) -> None:
+        """Records the time since the previous stage ended under `name` (accumulating)."""
+        now = time.monotonic()
+        self.timings[name] = self.timings.get(name, 0.0) + (now - self._mark)
+        self._mark = now
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "planned_mode": self.planned,
+            "reason": self.reason,
+            "downgrades": self.downgrades,
+            "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+            "total_ms": round(self.elapsed * 1000, 1),
+        }
+
+
+class QueryRouter:
+    """
+    Picks a LightRAG query mode per request and keeps it within a latency budget.
+
+    Small talk is answered by the LLM directly ("bypass"), short factual
+    questions use plain chunk retrieval ("naive"), and longer or multi-part
+    questions use graph retrieval: "global" for broad overviews, "hybrid" for
+    comparisons and explanations, "local" for the rest. Each mode has its own
+    top_k and context token budget.
+
+    The router keeps a moving average of how long each mode takes, which
+    fades while the mode goes unmeasured. A mode that is expected to miss the
+    budget, or that runs past the point where its fallback could still answer
+    in time, is abandoned for the cheaper mode in DOWNGRADE. For streams the budget covers the time until LightRAG starts
+    streaming, so an answer that is already flowing is never cut off.
+    """
+
+    def __init__(self, budget_ms: float = QUERY_LATENCY_BUDGET_MS, enabled: bool = QUERY_ROUTING, default_mode: str = QUERY_DEFAULT_MODE):
+        self.budget = budget_ms / 1000
+        self.enabled = enabled
+        self.default_mode = default_mode if default_mode in MODES else "hybrid"
+        # (mode, stream) -> (moving average of seconds taken, when it was last updated)
+        self._latency: Dict[tuple, tuple] = {}
+        self._param_fields = None
+
+        self.routed = {mode: 0 for mode in MODES}
+        self.answered = {mode: 0 for mode in MODES + ("cache",)}
+        self.predicted_downgrades = 0
+        self.deadline_downgrades = 0
+        # stage -> [queries that went through it, total seconds]
+        self._stages: Dict[str, list] = {}
+
+    def plan(self, query: str, mode: str = "auto") -> QueryPlan:
+        if mode == "auto":
+            mode, reason = self._classify(query) if self.enabled else (self.default_mode, "default")
+        else:
+            reason = "requested"
+        return self._plan(mode, reason)
+
+    def _plan(self, mode: str, reason: str) -> QueryPlan:
+        if mode == "bypass":
+            return QueryPlan(mode, reason, 0, 0)
+        if mode == "naive":
+            return QueryPlan(mode, reason, QUERY_NAIVE_TOP_K, QUERY_NAIVE_MAX_TOKENS)
+        return QueryPlan(mode, reason, QUERY_GRAPH_TOP_K, QUERY_GRAPH_MAX_TOKENS)
+
+    def _classify(self, query: str):
+        words = _WORD.findall(query)
+        if not words:
+            return "bypass", "empty"
+        if len(words) <= SMALL_TALK_MAX_WORDS and _SMALL_TALK.fullmatch(query.strip()):
+            return "bypass", "small talk"
+        if _THEMATIC.search(query):
+            return "global", "broad question"
+        complex_query = len(words) >= COMPLEX_MIN_WORDS or query.count("?") > 1
+        if _RELATIONAL.search(query):
+            return "hybrid", "comparison or explanation"
+        if complex_query:
+            return "local", "detailed question"
+        return "naive", "short lookup"
+
+    def param(self, plan: QueryPlan, stream: bool):
+        """QueryParam for a plan, with only the fields this LightRAG version knows."""
+        from lightrag import QueryParam
+
+        if self._param_fields is None:
+            self._param_fields = {field.name for field in dataclasses.fields(QueryParam)}
+        wanted = {"mode": plan.mode, "stream": stream}
+        if plan.top_k:
+            # Newer LightRAG names first, then the ones older releases used
+            wanted.update(
+                top_k=plan.top_k,
+                chunk_top_k=max(1, plan.top_k // 4),
+                max_total_tokens=plan.max_tokens,
+                max_entity_tokens=plan.max_tokens // 3,
+                max_relation_tokens=plan.max_tokens // 3,
+                max_token_for_text_unit=plan.max_tokens // 2,
+                max_token_for_local_context=plan.max_tokens // 4,
+                max_token_for_global_context=plan.max_tokens // 4,
+            )
+        return QueryParam(**{key: value for key, value in wanted.items() if key in self._param_fields})
+
+    def _estimate(self, mode: str, stream: bool) -> Optional[float]:
+        entry = self._latency.get((mode, stream))
+        if entry is None:
+            return None
+        seconds, updated = entry
+        return seconds * 0.5 ** ((time.monotonic() - updated) / LATENCY_HALF_LIFE)
+
+    def _observe(self, mode: str, stream: bool, seconds: float) -> None:
+        previous = self._estimate(mode, stream)
+        average = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        self._latency[(mode, stream)] = (average, time.monotonic())
+
+    async def aquery(self, rag, query: str, plan: QueryPlan, stream: bool, trace: QueryTrace, **kwargs):
+        """Runs `rag.aquery` in the plan's mode, downgrading when the budget is at risk."""
+        trace.planned = plan.mode
+        trace.reason = plan.reason
+        self.routed[plan.mode] += 1
+
+        while True:
+            fallback = DOWNGRADE.get(plan.mode) if self.budget > 0 else None
+            timeout = None
+            if fallback is not None:
+                # Leave the fallback enough time to answer within the budget
+                # (a fifth of what's left until its latency has been measured)
+                remaining = self.budget - trace.elapsed
+                reserve = self._estimate(fallback, stream)
+                timeout = remaining - (remaining * 0.2 if reserve is None else reserve)
+                expected = self._estimate(plan.mode, stream)
+                if timeout <= 0 or (expected is not None and expected > timeout):
+                    self.predicted_downgrades += 1
+                    plan = self._downgrade(plan, fallback, "predicted", trace)
+                    continue
+
+            started = time.monotonic()
+            try:
+                if timeout is None:
+                    result = await rag.aquery(query, param=self.param(plan, stream), **kwargs)
+                else:
+                    result = await asyncio.wait_for(rag.aquery(query, param=self.param(plan, stream), **kwargs), timeout)
+            except asyncio.TimeoutError:
+                # It would have taken longer than this. Count it as a full budget
+                # (not more), which fades within a few minutes if it was a blip
+                self._observe(plan.mode, stream, max(time.monotonic() - started, self.budget))
+                self.deadline_downgrades += 1
+                plan = self._downgrade(plan, fallback, "deadline", trace)
+                continue
+
+            self._observe(plan.mode, stream, time.monotonic() - started)
+            trace.mode = plan.mode
+            return result
+
+    def _downgrade(self, plan: QueryPlan, fallback: str, why: str, trace: QueryTrace) -> QueryPlan:
+        trace.stage(f"{plan.mode}_abandoned")
+        trace.downgrades.append({"from": plan.mode, "to": fallback, "why": why})
+        return self._plan(fallback, plan.reason)
+
+    def record(self, trace: QueryTrace) -> None:
+        """Adds a finished query to the stats."""
+        if trace.mode is not None:
+            self.answered[trace.mode] += 1
+        for name, seconds in trace.timings.items():
+            totals = self._stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "budget_ms": round(self.budget * 1000),
+            "routed": self.routed,
+            "answered": self.answered,
+            "predicted_downgrades": self.predicted_downgrades,
+            "deadline_downgrades": self.deadline_downgrades,
+            "avg_latency_ms": {
+                f"{mode}{' (stream)' if stream else ''}": round(seconds * 1000, 1)
+                for (mode, stream), (seconds, _) in self._latency.items()
+            },
+            "avg_stage_ms": {name: round(total / count * 1000, 1) for name, (count, total) in self._stages.items()},
+        }
+
+
+# Shared router used by query_rag and stream_query_rag
+query_router = QueryRouter()
@@ -1,18 +1,216 @@
-# !pip install requests beautifulsoup4 lxml tqdm
+# !pip install httpx[http2] beautifulsoup4 lxml tqdm
 
+import asyncio
+import heapq
 import os
-import requests
-from bs4 import BeautifulSoup
+import random
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+import httpx
+from dotenv import load_dotenv
 from tqdm import tqdm
 
-# --------- Helper Functions ----------
-def get_sitemap_urls(sitemap_url):
-    res = requests.get(sitemap_url)
-    soup = BeautifulSoup(res.content, 'xml')
-    return [loc.text for loc in soup.find_all('loc')]
+from app.utils.crawl_manifest import CrawlManifest, PageRecord, parse_lastmod
+from app.utils.ingest_index import content_hash
+
+# Load environment variables
+load_dotenv()
+
+# Pages fetched at once overall and from any one host
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "8"))
+# Polite rate limit: requests per second started against one host (0 = no limit)
+CRAWL_HOST_RPS = float(os.getenv("CRAWL_HOST_RPS", "20"))
+# Retries for connection errors, 429 and 5xx, with exponential backoff from CRAWL_BACKOFF seconds
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "2"))
+CRAWL_BACKOFF = float(os.getenv("CRAWL_BACKOFF", "0.5"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "10"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "LeadCaptureBot/1.0 (+knowledge base ingestion)")
+
+# Child sitemaps of a sitemap index read at once, and how deep indexes may nest
+SITEMAP_CONCURRENCY = int(os.getenv("SITEMAP_CONCURRENCY", "4"))
+SITEMAP_MAX_DEPTH = int(os.getenv("SITEMAP_MAX_DEPTH", "3"))
+# Entries buffered between the sitemap readers and the consumer
+SITEMAP_QUEUE_SIZE = 1000
+# Sitemap entries held back so the most important of them are crawled first;
+# the sitemap is crawled as it streams, so this bounds the crawl's memory
+CRAWL_PRIORITY_WINDOW = int(os.getenv("CRAWL_PRIORITY_WINDOW", "1000"))
+# Crawl manifest rows read and written at once
+MANIFEST_BATCH_SIZE = 500
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest Retry-After the crawler honours, in seconds
+MAX_RETRY_AFTER = 30.0
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2 = os.getenv("CRAWL_HTTP2", "true").lower() == "true"
+except ImportError:
+    HTTP2 = False
+
+
+# --------- Sitemaps ----------
+GZIP_MAGIC = b"\x1f\x8b"
+# Most XML handed to the parser at once; gzipped sitemaps inflate ~20x per chunk
+FEED_SIZE = 64 * 1024
+
 
+class SitemapEntry(NamedTuple):
+    url: str
+    # As written in the sitemap (W3C datetime); see crawl_manifest.parse_lastmod
+    lastmod: Optional[str]
+    priority: Optional[float]
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _read_entries(parser: ElementTree.XMLPullParser, state: Dict) -> Iterator[Tuple[str, SitemapEntry]]:
+    """("url" | "sitemap", entry) for every <url> / <sitemap> the parser has finished."""
+    for event, elem in parser.read_events():
+        if event == "start":
+            state.setdefault("root", elem)
+            continue
+        kind = _local_name(elem.tag)
+        if kind not in ("url", "sitemap"):
+            continue
+        fields = {_local_name(child.tag): (child.text or "").strip() for child in elem}
+        # Drop finished entries so memory stays flat however long the sitemap is
+        state["root"].clear()
+        if not fields.get("loc"):
+            continue
+        try:
+            priority = float(fields["priority"]) if fields.get("priority") else None
+        except ValueError:
+            priority = None
+        yield kind, SitemapEntry(fields["loc"], fields.get("lastmod") or None, priority)
+
+async def _stream_sitemap(client: httpx.AsyncClient, sitemap_url: str) -> AsyncIterator[Tuple[str, SitemapEntry]]:
+    """Parses one sitemap (or sitemap index), plain or gzipped, as it downloads."""
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    state = {}
+    async with client.stream("GET", sitemap_url) as response:
+        response.raise_for_status()
+        decompress = None
+        head = b""
+        async for chunk in response.aiter_bytes():
+            if head is not None:
+                # .xml.gz files served as-is (not Content-Encoding) reach us still
+                # compressed; only the magic bytes tell, since a server may also
+                # have decoded a .gz URL already
+                head += chunk
+                if len(head) < len(GZIP_MAGIC):
+                    continue
+                chunk, head = head, None
+                if chunk.startswith(GZIP_MAGIC):
+                    decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if decompress is None:
+                parser.feed(chunk)
+                for item in _read_entries(parser, state):
+                    yield item
+                continue
+            while chunk:
+                parser.feed(decompress.decompress(chunk, FEED_SIZE))
+                chunk = decompress.unconsumed_tail
+                for item in _read_entries(parser, state):
+                    yield item
+    if head:
+        parser.feed(head)
+    parser.close()
+    for item in _read_entries(parser, state):
+        yield item
+
+async def iter_sitemap(client: httpx.AsyncClient, sitemap_url: str, concurrency: int = SITEMAP_CONCURRENCY,
+                       max_depth: int = SITEMAP_MAX_DEPTH) -> AsyncIterator[SitemapEntry]:
+    """
+    Yields the page entries of a sitemap, each URL once, as they're parsed.
+
+    Sitemap indexes are followed: up to `concurrency` child sitemaps are
+    downloaded and parsed at once, nested up to `max_depth` levels. A child
+    sitemap that fails is skipped with a warning; if the top-level one fails
+    the error is raised. Only the set of URLs seen so far grows with the
+    sitemap's size.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SITEMAP_QUEUE_SIZE)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    seen_sitemaps = {sitemap_url}
+    seen_urls = set()
+    tasks = set()
+    # Readers started but not finished; a reader starts its children before it finishes
+    pending = 0
+    done = object()
+
+    async def read(url, depth):
+        try:
+            async with semaphore:
+                async for kind, entry in _stream_sitemap(client, url):
+                    if kind == "url":
+                        await queue.put(entry)
+                    elif depth < max_depth and entry.url not in seen_sitemaps:
+                        seen_sitemaps.add(entry.url)
+                        spawn(entry.url, depth + 1)
+        except Exception as e:
+            if depth == 0:
+                await queue.put(e)
+            else:
+                print(f"⚠️ Skipping sitemap {url}: {e!r}")
+        finally:
+            await queue.put(done)
+
+    def spawn(url, depth):
+        nonlocal pending
+        pending += 1
+        task = asyncio.create_task(read(url, depth))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    spawn(sitemap_url, 0)
+    try:
+        while pending:
+            item = await queue.get()
+            if item is done:
+                pending -= 1
+            elif isinstance(item, Exception):
+                raise item
+            elif item.url not in seen_urls:
+                seen_urls.add(item.url)
+                yield item
+    finally:
+        for task in list(tasks):
+            task.cancel()
+
+def _crawl_order(entry: SitemapEntry) -> Tuple[float, float]:
+    # Most important (sitemap priority, 0.5 when missing), then most recently modified first
+    priority = entry.priority if entry.priority is not None else 0.5
+    return -priority, -(parse_lastmod(entry.lastmod) or 0)
+
+async def prioritized(entries: AsyncIterable[SitemapEntry], window: int = CRAWL_PRIORITY_WINDOW) -> AsyncIterator[SitemapEntry]:
+    """
+    Re-orders streamed sitemap entries by crawl priority within a sliding
+    window of `window` entries: only that many are ever held, so the order is
+    exact for sitemaps up to that size and roughly document order beyond.
+    """
+    heap = []
+    position = 0
+    async for entry in entries:
+        heapq.heappush(heap, (_crawl_order(entry), position, entry))
+        position += 1
+        if len(heap) > window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+# --------- Helper Functions ----------
+# bs4 is imported on first use to keep startup fast
 def clean_text(html_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     for script in soup(['script', 'style', 'noscript']):
         script.decompose()
@@ -27,70 +225,318 @@ def save_text_to_file(filename, text):
     with open(filename, 'w', encoding='utf-8') as f:
         f.write(text)
 
-def create_combined_file(folder):
-    combined_path = os.path.join(folder, "combined.txt")
-    with open(combined_path, 'w', encoding='utf-8') as outfile:
-        for filename in sorted(os.listdir(folder)):
-            if filename.endswith(".txt") and filename != "combined.txt":
-                file_path = os.path.join(folder, filename)
-                with open(file_path, 'r', encoding='utf-8') as infile:
-                    outfile.write(f"\n\n--- {filename} ---\n\n")
-                    outfile.write(infile.read())
+def save_page(filename, html_content, previous_hash=None):
+    """Extracts a page's text and writes it out unless it's unchanged. Returns the text's hash."""
+    text = clean_text(html_content)
+    digest = content_hash(text)
+    if digest != previous_hash or not os.path.exists(filename):
+        save_text_to_file(filename, text)
+    return digest
+
+def make_client() -> httpx.AsyncClient:
+    """One pooled keep-alive client per crawl; HTTP/2 multiplexes the requests to a host over one connection."""
+    return httpx.AsyncClient(
+        http2=HTTP2,
+        follow_redirects=True,
+        headers={"User-Agent": CRAWL_USER_AGENT},
+        limits=httpx.Limits(
+            max_connections=CRAWL_CONCURRENCY,
+            max_keepalive_connections=CRAWL_CONCURRENCY,
+        ),
+        timeout=httpx.Timeout(CRAWL_TIMEOUT),
+    )
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class HostLimiter:
+    """Caps the requests in flight to one host and spaces out when they start."""
+
+    def __init__(self, concurrency: int, rps: float):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self.next_at = 0.0
 
-    print(f"\n📚 Combined all text into: {combined_path}")
+    async def wait_turn(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        # Each caller books the next free slot before sleeping, so slots are never shared
+        slot = max(now, self.next_at)
+        self.next_at = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def back_off(self, seconds: float) -> None:
+        """Holds every request to this host for `seconds` (429 / Retry-After)."""
+        self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+class Crawler:
+    """
+    Fetches a list of URLs concurrently over one pooled client.
+
+    CRAWL_CONCURRENCY workers pull URLs from a queue; each request also holds
+    its host's slot (CRAWL_PER_HOST in flight, CRAWL_HOST_RPS started per
+    second). Connection errors, 429 and 5xx are retried with exponential
+    backoff and jitter, honouring Retry-After.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, concurrency: int = CRAWL_CONCURRENCY, per_host: int = CRAWL_PER_HOST,
+                 host_rps: float = CRAWL_HOST_RPS, retries: int = CRAWL_RETRIES, backoff: float = CRAWL_BACKOFF):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.per_host = per_host
+        self.host_rps = host_rps
+        self.retries = retries
+        self.backoff = backoff
+        self.hosts: Dict[str, HostLimiter] = {}
+        self.retried = 0
+
+    def _host(self, url: str) -> HostLimiter:
+        host = urlparse(url).netloc
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            limiter = self.hosts[host] = HostLimiter(self.per_host, self.host_rps)
+        return limiter
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """GETs a URL, retrying transient failures. Raises the last error once retries run out."""
+        limiter = self._host(url)
+        attempt = 0
+        while True:
+            async with limiter.semaphore:
+                await limiter.wait_turn()
+                try:
+                    response = await self.client.get(url, headers=headers)
+                    error = None
+                except httpx.TransportError as e:
+                    response, error = None, e
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt >= self.retries:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            if response is not None:
+                wait = retry_after(response)
+                if wait is not None:
+                    delay = max(delay, wait)
+                if response.status_code == 429:
+                    # The whole host is asking us to slow down, not just this URL
+                    limiter.back_off(delay)
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    async def run(self, urls: Union[Iterable[str], AsyncIterable[str]], handle: Callable,
+                  headers_for: Optional[Callable] = None) -> None:
+        """
+        Calls `await handle(url, response_or_exception)` for every URL, as
+        fetches complete. `headers_for(url)` gives extra request headers.
+
+        `urls` may be an async iterator: URLs are only pulled from it as
+        workers free up, so a streamed sitemap is never held in memory. An
+        exception it raises stops the crawl.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        stop = object()
+
+        async def feed():
+            if hasattr(urls, "__aiter__"):
+                async for url in urls:
+                    await queue.put(url)
+            else:
+                for url in urls:
+                    await queue.put(url)
+            for _ in range(self.concurrency):
+                await queue.put(stop)
+
+        async def worker():
+            while True:
+                url = await queue.get()
+                if url is stop:
+                    return
+                try:
+                    result = await self.fetch(url, headers_for(url) if headers_for else None)
+                except httpx.HTTPError as e:
+                    result = e
+                await handle(url, result)
+
+        tasks = [asyncio.create_task(feed())] + [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # One task failing (e.g. the job was cancelled) stops the rest
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 # --------- Main Scraper -------------
-def scrape_site_from_sitemap(base_url: str):
+async def scrape_site_from_sitemap(base_url: str, progress=None) -> Tuple[str, List[Tuple[str, str, Optional[str]]]]:
+    """
+    Scrapes the pages listed in the site's sitemap into db/<domain>/, one
+    text file per page.
+
+    Pages are crawled while the sitemap is still streaming in, the most
+    important first within a window of CRAWL_PRIORITY_WINDOW entries (see
+    `prioritized`), so only that window and the pages in flight are held,
+    however large the sitemap.
+
+    Re-crawls are incremental: a page the crawl manifest has seen is skipped
+    when its sitemap lastmod hasn't advanced, and otherwise fetched with
+    If-None-Match / If-Modified-Since, so unchanged pages cost a 304 (or
+    at most a re-download whose text hashes the same).
+
+    `progress(done, total, failed)` is called after each URL, with the
+    number of URLs found so far as `total`; it may raise to stop scraping
+    (e.g. when an ingestion job is cancelled).
+
+    Returns the folder and every page on disk as (url, file path, content
+    hash) triples; the hash tells callers which pages changed since they
+    last used them (see CrawlManifest.ingested).
+    """
     parsed_url = urlparse(base_url)
     domain_folder = f'db/{parsed_url.netloc.replace(":", "_")}'
 
     os.makedirs(domain_folder, exist_ok=True)
-    urls = []
-
-    sitemap_url = f"{base_url.rstrip('/')}/sitemap.xml"
-    try:
-        urls = get_sitemap_urls(sitemap_url)
-    except:
-        print("⚠️ Unable to fetch sitemap.")
-
-    if not urls:
-        urls = [base_url]
+    manifest = CrawlManifest(domain_folder)
+    # url -> (sitemap lastmod, manifest record) of pages waiting for or being fetched
+    inflight: Dict[str, Tuple[Optional[float], Optional[PageRecord]]] = {}
+    # Records to write back, saved every MANIFEST_BATCH_SIZE pages
+    updated: Dict[str, PageRecord] = {}
+    pages = []
 
-    total_urls = len(urls)
-    already_scraped = 0
-    newly_scraped = 0
+    total_urls = 0
+    skipped = 0
+    not_modified = 0
+    unchanged = 0
+    changed = 0
     failed = 0
+    started = time.perf_counter()
+    bar = tqdm(total=0, desc="Scraping pages")
 
-    print(f"📦 Found {total_urls} URLs in sitemap, {urls}")
+    def report():
+        bar.update(1)
+        if progress is not None:
+            progress(skipped + not_modified + unchanged + changed + failed, total_urls, failed)
 
-    for url in tqdm(urls, desc="Scraping pages"):
-        file_path = get_filename_from_url(domain_folder, url)
+    async def save_updated():
+        if updated:
+            batch = list(updated.values())
+            updated.clear()
+            await asyncio.to_thread(manifest.save, batch)
 
-        if os.path.exists(file_path):
-            already_scraped += 1
-            continue 
+    async def pages_to_fetch(entries: List[SitemapEntry]) -> AsyncIterator[str]:
+        nonlocal total_urls, skipped
+        total_urls += len(entries)
+        bar.total = total_urls
+        bar.refresh()
+        records = await asyncio.to_thread(manifest.get, [entry.url for entry in entries])
+        for entry in entries:
+            lastmod = parse_lastmod(entry.lastmod)
+            record = records.get(entry.url)
+            file_path = get_filename_from_url(domain_folder, entry.url)
+            if (record is not None and record.lastmod is not None and lastmod is not None
+                    and lastmod <= record.lastmod and os.path.exists(file_path)):
+                skipped += 1
+                pages.append((entry.url, file_path, record.content_hash))
+                report()
+            else:
+                inflight[entry.url] = (lastmod, record)
+                yield entry.url
 
+    async def sitemap_urls(client: httpx.AsyncClient) -> AsyncIterator[str]:
+        sitemap_url = f"{base_url.rstrip('/')}/sitemap.xml"
+        batch = []
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                text = clean_text(response.text)
-                save_text_to_file(file_path, text)
-                newly_scraped += 1
-            else:
-                failed += 1
+            async for entry in prioritized(iter_sitemap(client, sitemap_url)):
+                batch.append(entry)
+                if len(batch) >= MANIFEST_BATCH_SIZE:
+                    async for url in pages_to_fetch(batch):
+                        yield url
+                    batch = []
         except Exception as e:
-            print(f"❌ Error scraping {url}: {e}")
+            print(f"⚠️ Unable to fetch sitemap: {e!r}")
+        if not total_urls and not batch:
+            batch = [SitemapEntry(base_url, None, None)]
+        async for url in pages_to_fetch(batch):
+            yield url
+
+    def headers_for(url):
+        record = inflight[url][1]
+        if record is None or not os.path.exists(get_filename_from_url(domain_folder, url)):
+            return None
+        return record.conditional_headers()
+
+    async def handle(url, result):
+        nonlocal not_modified, unchanged, changed, failed
+        lastmod, record = inflight.pop(url)
+        file_path = get_filename_from_url(domain_folder, url)
+        previous_hash = record.content_hash if record is not None else None
+        if isinstance(result, httpx.Response) and result.status_code == 304 and record is not None:
+            not_modified += 1
+            updated[url] = record._replace(lastmod=lastmod or record.lastmod, fetched_at=time.time())
+            pages.append((url, file_path, previous_hash))
+        elif isinstance(result, httpx.Response) and result.status_code == 200:
+            try:
+                # HTML parsing is CPU work; keep it off the event loop
+                digest = await asyncio.to_thread(save_page, file_path, result.text, previous_hash)
+                if digest == previous_hash:
+                    unchanged += 1
+                else:
+                    changed += 1
+                updated[url] = PageRecord(
+                    url, lastmod, result.headers.get("ETag"), result.headers.get("Last-Modified"), digest, time.time()
+                )
+                pages.append((url, file_path, digest))
+            except Exception as e:
+                print(f"❌ Error saving {url}: {e}")
+                failed += 1
+        else:
+            if isinstance(result, Exception):
+                print(f"❌ Error scraping {url}: {result!r}")
             failed += 1
+            # The copy from an earlier crawl is still better than nothing
+            if os.path.exists(file_path):
+                pages.append((url, file_path, previous_hash))
+        if len(updated) >= MANIFEST_BATCH_SIZE:
+            await save_updated()
+        report()
+
+    async with make_client() as client:
+        crawler = Crawler(client)
+        try:
+            await crawler.run(sitemap_urls(client), handle, headers_for)
+        finally:
+            bar.close()
+            await save_updated()
+
+    elapsed = time.perf_counter() - started
 
     # --------- Show Stats -------------
     print("\n✅ Scraping Complete:")
     print(f"🔢 Total URLs in Sitemap: {total_urls}")
-    print(f"📁 Already Scraped:        {already_scraped}")
-    print(f"🆕 Newly Scraped:          {newly_scraped}")
+    print(f"📅 Skipped (lastmod):      {skipped}")
+    print(f"📁 Not Modified (304):     {not_modified}")
+    print(f"♻️ Unchanged Content:      {unchanged}")
+    print(f"🆕 New or Changed:         {changed}")
     print(f"⚠️ Failed to Scrape:       {failed}")
+    print(f"🔁 Retried Requests:       {crawler.retried}")
+    print(f"⏱️ Took {elapsed:.1f}s (HTTP/2 {'on' if HTTP2 else 'off'}, {crawler.concurrency} concurrent, {CRAWL_PER_HOST} per host)")
 
-    # --------- Combine into one file -------------
-    create_combined_file(domain_folder)
-
-    return domain_folder
-
+    return domain_folder, pages
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterable, AsyncIterator
+
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces equivalent JSON, just slower
+    orjson = None
+
+# Load environment variables
+load_dotenv()
+
+# Chunks arriving within this window (ms), up to this many characters, share one SSE frame. 0 sends every chunk as is
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "20"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+
+_TEXT = "__TEXT__"
+
+
+def dumps_text(text: str) -> str:
+    """JSON string literal for `text`."""
+    if orjson is not None:
+        return orjson.dumps(text).decode()
+    return json.dumps(text)
+
+
+class SSEWriter:
+    """
+    Renders the widget's `textResponseChunk` events for one answer.
+
+    The envelope (uuid, type, sources, close, error) is the same in every
+    chunk, so it's rendered once and only the text is serialized per frame.
+    `frames()` also coalesces the answer's chunks: the first chunk goes out
+    right away (time to first token), later ones are buffered until
+    `max_bytes` characters have accumulated or `max_delay` seconds have
+    passed since the first buffered chunk. The events are the same ones
+    `format_sse_chunk` produced, just with longer `textResponse` pieces.
+    """
+
+    def __init__(self, message_uuid: str, max_delay: float = SSE_COALESCE_MS / 1000, max_bytes: int = SSE_COALESCE_BYTES):
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self._envelopes = {}
+        for error in (False, True):
+            event = json.dumps({
+                "uuid": message_uuid,
+                "type": "textResponseChunk",
+                "textResponse": _TEXT,
+                "sources": [],
+                "close": False,
+                "error": error,
+            })
+            prefix, suffix = event.split(json.dumps(_TEXT))
+            self._envelopes[error] = ("data: " + prefix, suffix + "\n\n")
+
+        self.chunks = 0
+        self.frames_sent = 0
+
+    def frame(self, text: str, error: bool = False) -> str:
+        prefix, suffix = self._envelopes[error]
+        self.frames_sent += 1
+        return prefix + dumps_text(text) + suffix
+
+    async def frames(self, chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+        """SSE frames for a stream of text chunks, coalesced by size and time."""
+        if self.max_delay <= 0 or self.max_bytes <= 1:
+            async for text in chunks:
+                if text:
+                    self.chunks += 1
+                    yield self.frame(text)
+            return
+
+        # A pump task reads the chunks into a buffer; this generator only wakes
+        # up when a frame is due, so buffering a chunk costs next to nothing
+        loop = asyncio.get_running_loop()
+        batch = _Batch(loop, self.max_bytes)
+        pump = asyncio.ensure_future(batch.pump(chunks))
+        first = True
+        try:
+            while True:
+                if not batch.parts and not batch.done:
+                    await batch.wait(None)
+                    continue
+                if not first and not batch.done and batch.size < self.max_bytes:
+                    await batch.wait(batch.since + self.max_delay - loop.time())
+
+                if batch.parts:
+                    first = False
+                    self.chunks += len(batch.parts)
+                    yield self.frame(batch.take())
+                elif batch.done:
+                    break
+            if batch.error is not None:
+                raise batch.error
+        finally:
+            pump.cancel()
+
+
+class _Batch:
+    """Text buffered by `SSEWriter.frames` between two frames."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_bytes: int):
+        self._loop = loop
+        self._max_bytes = max_bytes
+        self._wakeup = None
+        self.parts = []
+        self.size = 0
+        self.since = 0.0
+        self.done = False
+        self.error = None
+
+    async def pump(self, chunks: AsyncIterable[str]) -> None:
+        try:
+            async for text in chunks:
+                if not text:
+                    continue
+                if not self.parts:
+                    self.since = self._loop.time()
+                    self._wake()
+                self.parts.append(text)
+                self.size += len(text)
+                if self.size >= self._max_bytes:
+                    self._wake()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    async def wait(self, timeout) -> None:
+        if timeout is not None and timeout <= 0:
+            return
+        self._wakeup = self._loop.create_future()
+        try:
+            await asyncio.wait({self._wakeup}, timeout=timeout)
+        finally:
+            self._wakeup = None
+
+    def take(self) -> str:
+        text = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return text
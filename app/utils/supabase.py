@@ -1,43 +1,90 @@
 import os
-from typing import Dict, List, Any, Optional
-from supabase import create_client, Client
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
-from app.utils.lead_capture import _detect_emails, _detect_phones, _detect_names
+from app.storage import (
+    CHAT_HISTORY_TABLE,
+    LEAD_CAPTURE_TABLE,
+    USER_CHATS_TABLE,
+    get_storage,
+)
+from app.utils.lead_worker import LeadCaptureWorkers
+from app.utils.write_behind import WriteBehindQueue
+from app.utils.cache import TTLCache
+from app.utils.history_cache import CachedHistory, HistoryCache
+from app.types.types import ChatMessage, HistoryResponse
 from fastapi import HTTPException, status
-from typing import List, Optional, Dict, Any
 
 # Load environment variables
 load_dotenv()
 
-# Supabase configuration
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
+# Page size used when a history cursor is passed without an explicit limit
+HISTORY_PAGE_SIZE = 50
 
-if not supabase_url or not supabase_key:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+# (client_user_id, embed_id, session_id) triples known to exist in user_chats
+known_user_chats = TTLCache(
+    maxsize=int(os.getenv("USER_CHAT_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("USER_CHAT_CACHE_TTL", "3600")),
+)
 
-# # Global client instance for synchronous operations
-# supabase: Client = create_client(supabase_url, supabase_key)
+# Whole session histories served by GET /embed/{embed_id}/{session_id}
+history_cache = HistoryCache(
+    maxsize=int(os.getenv("HISTORY_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("HISTORY_CACHE_TTL", "300")),
+)
 
-# Table names
-CHAT_HISTORY_TABLE = "chat_histories"
-LEAD_CAPTURE_TABLE = "lead_capture_form"
-USER_CHATS_TABLE = "user_chats" # Define the new table name
+async def _bulk_insert(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Inserts a batch of rows into `table` with a single request."""
+    await get_storage().insert_rows(table, rows)
 
-supabase: Client = create_client(supabase_url, supabase_key)
+# Batches chat_histories and lead_capture_form inserts across requests
+write_queue = WriteBehindQueue(
+    _bulk_insert,
+    batch_size=int(os.getenv("PERSIST_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "50")) / 1000,
+    max_pending=int(os.getenv("PERSIST_MAX_PENDING", "10000")),
+    max_retries=int(os.getenv("PERSIST_MAX_RETRIES", "3")),
+)
 
-async def get_supabase_client() -> Client:
-    """
-    Get a Supabase client instance for async operations.
+async def _save_detected_lead_info(
+    session_id: str,
+    message_uuid: str,
+    detected_name: Optional[str],
+    detected_email: Optional[str],
+    detected_phone: Optional[str],
+    original_content: str
+) -> None:
+    """Queues detected lead information for the lead_capture_form table."""
     
-    Returns:
-        A Supabase client instance
-    """
-    return create_client(supabase_url, supabase_key)
+    if not (detected_name or detected_email or detected_phone):
+        # print(f"No lead info detected for message {message_uuid}")
+        return 
+
+    lead_data = {
+        "chat_message_uuid": message_uuid,
+        "session_id": session_id,
+        "detected_name": detected_name,
+        "detected_email": detected_email,
+        "detected_phone": detected_phone,
+        "original_message_content": original_content,
+    }
+
+    await write_queue.put(LEAD_CAPTURE_TABLE, lead_data)
+
+# Lead capture for user messages; rows end up in write_queue like chat messages
+lead_workers = LeadCaptureWorkers(
+    _save_detected_lead_info,
+    workers=int(os.getenv("LEAD_WORKERS", "2")),
+    max_pending=int(os.getenv("LEAD_QUEUE_SIZE", "1000")),
+    dedupe_sessions=int(os.getenv("LEAD_DEDUPE_SESSIONS", "50000")),
+    dedupe_ttl=float(os.getenv("LEAD_DEDUPE_TTL", "86400")),
+)
 
 async def save_message(session_id: str, message: Dict[str, Any], update: bool = False) -> Dict[str, Any]:
     """
-    Save a message to the chat history in Supabase
+    Save a message to the chat history
     
     Args:
         session_id: The session ID
@@ -45,7 +92,8 @@ async def save_message(session_id: str, message: Dict[str, Any], update: bool =
         update: If True, update an existing message instead of inserting a new one
         
     Returns:
-        The saved message with Supabase metadata
+        The saved message. Inserts are written behind, so the row is returned
+        as queued (including its created_at) rather than as echoed by the database.
     """
     
     data = {
@@ -57,50 +105,33 @@ async def save_message(session_id: str, message: Dict[str, Any], update: bool =
 
     if update:
         # Update the existing message with the same UUID
-        result = supabase.table(CHAT_HISTORY_TABLE)\
-            .update(data)\
-            .eq("session_id", session_id)\
-            .eq("uuid", message["uuid"])\
-            .execute()
+        saved = await get_storage().update_message(session_id, message["uuid"], data)
+
+        if not saved:
+            error_msg = f"Failed to save/update message. UUID: {message.get('uuid')}, Session: {session_id}."
+            print(error_msg) # Log the error
+            raise Exception(error_msg) # Raise an exception to be handled by the caller
+        history_cache.replace(session_id, {"role": data["role"], "content": data["content"], "uuid": data["uuid"]})
     else:
-        # Insert a new message
-        result = supabase.table(CHAT_HISTORY_TABLE).insert(data).execute()
+        # Insert a new message through the write-behind queue. created_at is
+        # stamped here so ordering and the returned row don't depend on the flush.
+        data["created_at"] = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+        await write_queue.put(CHAT_HISTORY_TABLE, data, key=session_id)
+        history_cache.append(session_id, {
+            "role": data["role"],
+            "content": data["content"],
+            "uuid": data["uuid"],
+            "created_at": data["created_at"],
+        })
+        saved = data
     
-    if not result.data or len(result.data) == 0:
-        error_msg = f"Failed to save/update message to Supabase. UUID: {message.get('uuid')}, Session: {session_id}."
-        if hasattr(result, 'error') and result.error:
-            error_msg += f" Supabase Error: {result.error.message} (Code: {result.error.code})"
-        print(error_msg) # Log the error
-        raise Exception(error_msg) # Raise an exception to be handled by the caller
-      
     
     # --- Lead Capture Logic ---
     if message["role"] == "user" and message.get("content"): # Only process user messages with content
-        user_content = str(message["content"])
-
-        emails = _detect_emails(user_content)
-        phones = _detect_phones(user_content)
-        names = _detect_names(user_content)
-
-        detected_email = ", ".join(emails) if emails else None
-        detected_phone = ", ".join(phones) if phones else None
-        detected_name = ", ".join(names) if names else None 
-        
-        if detected_email or detected_phone or detected_name:
-            print(f"Lead info found in message {message['uuid']}: Name='{detected_name}', Email='{detected_email}', Phone='{detected_phone}'")
-            try:
-                await _save_detected_lead_info(
-                    session_id,
-                    message["uuid"],
-                    detected_name,
-                    detected_email,
-                    detected_phone,
-                    user_content
-                )
-            except Exception as e_lead_capture:
-                print(f"Error during lead capture for message UUID {message['uuid']}: {e_lead_capture}")
+        # Scanned and saved by the background lead workers, off the response path
+        await lead_workers.submit(session_id, message["uuid"], str(message["content"]))
     
-    return result.data[0]
+    return saved
 
 
 async def ensure_user_chat_record(
@@ -113,27 +144,15 @@ async def ensure_user_chat_record(
     """
     Ensures a record exists in user_chats for the given user, embed, and session.
     If it doesn't exist, it creates one.
-    This should ideally be called when the first user message of a session is processed.
+    Triples that were already ensured are remembered in `known_user_chats`, so
+    every turn after the first one skips the database entirely.
     """
-    print(f"Ensuring user_chat record for client_user_id: {client_user_id}, embed_id: {embed_id}, session_id: {session_id}")
-
-    # Check if a record already exists to avoid unnecessary ON CONFLICT write attempts
-    # and to handle the logic more explicitly.
-    existing_check_result = supabase.table(USER_CHATS_TABLE) \
-        .select("id") \
-        .eq("client_user_id", client_user_id) \
-        .eq("embed_id", embed_id) \
-        .eq("session_id", session_id) \
-        .limit(1) \
-        .execute()
-
-    if existing_check_result.data:
-        print(f"User_chat record already exists for session_id {session_id} (client: {client_user_id}, embed: {embed_id}).")
-        # The trigger on chat_histories will update last_interacted_at.
+    cache_key = (client_user_id, embed_id, session_id)
+    if known_user_chats.get(cache_key):
+        # Already ensured by an earlier turn; the trigger on chat_histories keeps last_interacted_at fresh.
         return
 
-    # If no record, create it
-    print(f"Creating new user_chat record for session_id {session_id} (client: {client_user_id}, embed: {embed_id}).")
+    print(f"Ensuring user_chat record for client_user_id: {client_user_id}, embed_id: {embed_id}, session_id: {session_id}")
     
     preview = None
     if first_message_content:
@@ -152,81 +171,88 @@ async def ensure_user_chat_record(
         insert_data["created_at"] = message_timestamp
         insert_data["last_interacted_at"] = message_timestamp
     
+    # Insert-or-ignore on the (client_user_id, embed_id, session_id) unique constraint:
+    # creates the row once and is a no-op for existing or concurrently created rows.
+    await get_storage().ensure_user_chat(insert_data)
+
+    known_user_chats.set(cache_key, True)
+
+def _encode_cursor(timestamp: str, tiebreaker: str) -> str:
+    """Packs a (timestamp, id) keyset position into an opaque URL-safe cursor."""
+    raw = json.dumps([timestamp, tiebreaker], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Unpacks a cursor made by _encode_cursor, rejecting anything malformed with a 400."""
     try:
-        # The unique constraint on (client_user_id, embed_id, session_id) will prevent duplicates.
-        result = supabase.table(USER_CHATS_TABLE).insert(insert_data).execute()
-
-        if result.data and len(result.data) > 0:
-            print(f"Successfully created user_chat record with ID: {result.data[0].get('id')}")
-        elif hasattr(result, 'error') and result.error:
-            # Check if the error is due to a unique constraint violation (code '23505' for PostgreSQL)
-            if hasattr(result.error, 'code') and result.error.code == '23505':
-                print(f"User_chat record for session_id {session_id} likely created by a concurrent request (unique constraint violation). Assuming it exists.")
-            else:
-                print(f"Error creating user_chat record for session_id {session_id}: {result.error.message} (Code: {result.error.code if hasattr(result.error, 'code') else 'N/A'})")
-                # Optionally re-raise or handle other errors specifically
-        else:
-            print(f"Unknown issue creating user_chat record for session_id {session_id}. No data returned and no explicit error.")
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, tiebreaker = json.loads(raw)
+        return str(timestamp), str(tiebreaker)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor."
+        )
 
-    except Exception as e:
-        # Catch any other exceptions during the insert operation
-        print(f"Exception during user_chat insert for session_id {session_id}: {str(e)}")
-        # Check if it's a known unique violation from a different driver or ORM exception type
-        if "unique constraint" in str(e).lower(): # Generic check for unique constraint error text
-            print(f"User_chat record for session_id {session_id} likely created by a concurrent request (caught generic unique constraint exception). Assuming it exists.")
-        else:
-            raise # Re-raise other unexpected errors
+def _oldest_timestamp(timestamps) -> Optional[datetime]:
+    """Returns the oldest ISO timestamp, or None if any of them is missing or unparseable."""
+    oldest = None
+    for value in timestamps:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if oldest is None or parsed < oldest:
+            oldest = parsed
+    return oldest
 
 async def fetch_user_chat_sessions(
     client_user_id: str,
     embed_id: str,
     limit: int = 20, # Default limit for pagination
-    offset: int = 0  # Default offset for pagination
-) -> List[Dict[str, Any]]:
+    offset: int = 0,  # Legacy offset pagination, ignored when a cursor is given
+    before: Optional[str] = None  # Keyset cursor from a previous page's next_cursor
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
     Fetches chat sessions for a given user and embed, ordered by last interaction.
     Includes the content and role of the last message in each session.
+    Returns the sessions and the cursor for the next page (None on the last page).
     """
+    keyset = _decode_cursor(before) if before else None
+
     try:
-        user_chats_response = supabase.table(USER_CHATS_TABLE) \
-            .select("session_id, title, first_message_preview, last_interacted_at") \
-            .eq("client_user_id", client_user_id) \
-            .eq("embed_id", embed_id) \
-            .order("last_interacted_at", desc=True) \
-            .limit(limit) \
-            .offset(offset) \
-            .execute()
-
-        if user_chats_response.data is None:
+        storage = get_storage()
+        # One extra row tells us whether another page follows
+        chats = await storage.list_user_chats(client_user_id, embed_id, limit + 1, offset=offset, before=keyset)
+
+        if not chats:
             print(f"No user_chats data found for client {client_user_id}, embed {embed_id}")
-            return []
+            return [], None
+
+        next_cursor = None
+        if len(chats) > limit:
+            chats = chats[:limit]
+            next_cursor = _encode_cursor(chats[-1]["last_interacted_at"], chats[-1]["session_id"])
+
+        last_messages = await storage.last_messages(
+            [chat["session_id"] for chat in chats],
+            since=_oldest_timestamp(chat["last_interacted_at"] for chat in chats),
+        )
 
         sessions_data = []
-        for chat in user_chats_response.data:
-            last_message_response = supabase.table("chat_histories") \
-                .select("content, role") \
-                .eq("session_id", chat["session_id"]) \
-                .order("created_at", desc=True) \
-                .limit(1) \
-                .execute()
-            
-            last_message_content = None
-            last_message_sender = None
-            if last_message_response.data:
-                last_message_content = last_message_response.data[0]["content"]
-                last_message_sender = last_message_response.data[0]["role"]
-            
+        for chat in chats:
+            last_message = last_messages.get(chat["session_id"]) or {}
             sessions_data.append({
                 "session_id": chat["session_id"],
                 "title": chat["title"],
                 "first_message_preview": chat["first_message_preview"],
                 "last_interacted_at": chat["last_interacted_at"],
-                "last_message_content": last_message_content,
-                "last_message_sender": last_message_sender
+                "last_message_content": last_message.get("content"),
+                "last_message_sender": last_message.get("role")
             })
         
         print(f"Fetched {len(sessions_data)} chat sessions for client_user_id: {client_user_id}, embed_id: {embed_id}")
-        return sessions_data
+        return sessions_data, next_cursor
 
     except Exception as e:
         print(f"Error fetching user chat sessions for client {client_user_id}, embed {embed_id}: {str(e)}")
@@ -239,37 +265,132 @@ async def fetch_user_chat_sessions(
         )
 
 
-async def get_session_history(session_id: str) -> List[Dict[str, Any]]:
+async def get_session_history(
+    session_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Get all messages for a session from Supabase
+    Get messages for a session, from the history cache when possible
     
     Args:
         session_id: The session ID
+        limit: If set, only the most recent `limit` messages (older than `before`) are returned
+        before: Cursor returned as next_cursor by a previous call
         
     Returns:
-        List of messages for the session
+        List of messages for the session (oldest first) and the cursor for the
+        next older page, or None when there is nothing older
     """
+    full_history = limit is None and before is None
 
-    result = supabase.table(CHAT_HISTORY_TABLE) \
-        .select("*") \
-        .eq("session_id", session_id) \
-        .order("created_at") \
-        .execute()
-        
-    # Transform the data to match the expected format
-    messages = []
-    for item in result.data:
-        messages.append({
-            "role": item["role"],
-            "content": item["content"],
-            "uuid": item["uuid"]
-        })
-        
-    return messages
+    entry = history_cache.get(session_id)
+    if entry is None and full_history:
+        entry = await _load_full_history(session_id)
+
+    if entry is not None:
+        if full_history:
+            return [_public_message(m) for m in entry.messages], None
+        page = _history_page_from_cache(entry, limit or HISTORY_PAGE_SIZE, before)
+        if page is not None:
+            return page
+
+    return await _fetch_history_page(session_id, limit or HISTORY_PAGE_SIZE, before)
+
+async def get_session_history_json(
+    session_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None
+) -> bytes:
+    """
+    Same as get_session_history, rendered as a HistoryResponse JSON body.
+    A cached full history is returned pre-serialized, without building models.
+    """
+    if limit is None and before is None:
+        entry = history_cache.get(session_id) or await _load_full_history(session_id)
+        if entry is not None:
+            return entry.json()
+
+    messages, next_cursor = await get_session_history(session_id, limit=limit, before=before)
+    return HistoryResponse(
+        history=[ChatMessage(**msg) for msg in messages],
+        next_cursor=next_cursor
+    ).model_dump_json().encode()
+
+def _public_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {"role": message["role"], "content": message["content"], "uuid": message["uuid"]}
+
+def _unwritten(rows: List[Dict[str, Any]], pending: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The session's messages from the write-behind queue that `rows` (read from
+    the database) lack, oldest first. `pending` is taken before the read, so a
+    row flushed in between is in both and kept once. The queue writes in
+    order, so these are newer than every row the database returned.
+    """
+    stored = {row["uuid"] for row in rows}
+    return [
+        {"role": row["role"], "content": row["content"], "uuid": row["uuid"], "created_at": row["created_at"]}
+        for row in pending if row["uuid"] not in stored
+    ]
+
+async def _load_full_history(session_id: str) -> Optional[CachedHistory]:
+    """Reads a whole session and caches it unless it was written to moments ago."""
+    pending = write_queue.pending(CHAT_HISTORY_TABLE, session_id)
+    # created_at is kept so cached histories can also serve cursor pages
+    messages = await get_storage().fetch_history(session_id)
+    messages = messages + _unwritten(messages, pending)
+    entry = history_cache.fill(session_id, messages)
+    if entry is None:
+        # Recently written session, not cached yet; still answer from what was read
+        return CachedHistory(messages)
+    return entry
+
+def _history_page_from_cache(
+    entry: CachedHistory,
+    limit: int,
+    before: Optional[str]
+) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """Slices a cursor page out of a cached history, or None if the cursor isn't in it."""
+    end = len(entry.messages)
+    if before:
+        _, message_uuid = _decode_cursor(before)
+        end = entry.index_of(message_uuid)
+        if end is None:
+            return None
+
+    start = max(0, end - limit)
+    page = entry.messages[start:end]
+    next_cursor = None
+    if start > 0 and page:
+        next_cursor = _encode_cursor(page[0]["created_at"], page[0]["uuid"])
+    return [_public_message(m) for m in page], next_cursor
+
+async def _fetch_history_page(
+    session_id: str,
+    limit: int,
+    before: Optional[str]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Keyset-paginated read of the newest `limit` messages older than `before`."""
+    keyset = _decode_cursor(before) if before else None
+    pending = write_queue.pending(CHAT_HISTORY_TABLE, session_id)
+    if keyset:
+        # Only pages after the first can start below a queued message
+        pending = pending[:next((i for i, row in enumerate(pending) if row["uuid"] == keyset[1]), 0)]
+    # Newest first so the limit keeps the tail; one extra row tells us if more remain
+    rows = await get_storage().fetch_history_page(session_id, limit + 1, before=keyset)
+    if pending:
+        rows = (list(reversed(_unwritten(rows, pending))) + rows)[:limit + 1]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["uuid"])
+
+    return [_public_message(row) for row in reversed(rows)], next_cursor
 
 async def delete_session_history(session_id: str) -> bool:
     """
-    Delete all messages for a session from Supabase
+    Delete all messages for a session
     
     Args:
         session_id: The session ID
@@ -278,52 +399,8 @@ async def delete_session_history(session_id: str) -> bool:
         True if messages were deleted, False if no messages were found
     """
 
-    # First check if there are any messages for this session
-    count_result = supabase.table(CHAT_HISTORY_TABLE) \
-        .select("*", count="exact") \
-        .eq("session_id", session_id) \
-        .execute()
-        
-    if count_result.count == 0:
-        return False
-        
-    # Delete all messages for the session
-    supabase.table(CHAT_HISTORY_TABLE) \
-        .delete() \
-        .eq("session_id", session_id) \
-        .execute()
-        
-    return True
-
-async def _save_detected_lead_info(
-    session_id: str,
-    message_uuid: str,
-    detected_name: Optional[str],
-    detected_email: Optional[str],
-    detected_phone: Optional[str],
-    original_content: str
-) -> None:
-    """Saves detected lead information to the Supabase lead_capture_form table."""
-    
-    if not (detected_name or detected_email or detected_phone):
-        # print(f"No lead info detected for message {message_uuid}")
-        return 
-
-    lead_data = {
-        "chat_message_uuid": message_uuid,
-        "session_id": session_id,
-        "detected_name": detected_name,
-        "detected_email": detected_email,
-        "detected_phone": detected_phone,
-        "original_message_content": original_content,
-    }
-
-    try:
-        result = supabase.table(LEAD_CAPTURE_TABLE).insert(lead_data).execute()
-        if result.data and len(result.data) > 0:
-            print(f"Successfully saved lead with ID: {result.data[0].get('id')} for message {message_uuid}")
-    except Exception as e:
-        if "unique constraint" in str(e).lower() or (hasattr(e, 'code') and e.code == '23505'): # PostgreSQL unique violation
-            print(f"Lead for message UUID {message_uuid} already exists. Skipping insert.")
-        else:
-            print(f"An error occurred while saving lead information for message {message_uuid}: {e}")
\ No newline at end of file
+    history_cache.invalidate(session_id)
+    # Messages still in the write-behind queue would otherwise land after the delete
+    dropped = await write_queue.discard(CHAT_HISTORY_TABLE, session_id)
+    deleted = await get_storage().delete_history(session_id)
+    return deleted or dropped > 0
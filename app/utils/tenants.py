@@ -0,0 +1,208 @@
+import asyncio
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+# Load environment variables
+load_dotenv()
+
+# Root of all knowledge bases. The "default" embed uses it directly so
+# existing single-tenant data keeps working; others get tenants/<embed_id>.
+RAG_WORKING_DIR = os.environ.get("RAG_WORKING_DIR", "./rag_data")
+DEFAULT_EMBED_ID = "default"
+
+# Budget for loaded tenants (approximated by their on-disk size) and a hard cap on their number
+TENANT_MEMORY_BUDGET_MB = float(os.getenv("TENANT_MEMORY_BUDGET_MB", "2048"))
+TENANT_MAX_LOADED = int(os.getenv("TENANT_MAX_LOADED", "32"))
+
+_EMBED_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def validate_embed_id(embed_id: str) -> str:
+    """embed_id becomes a directory name, so only plain identifiers are accepted."""
+    if not embed_id or not _EMBED_ID.match(embed_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid embed_id.")
+    return embed_id
+
+
+def tenant_dir(embed_id: str) -> str:
+    if embed_id == DEFAULT_EMBED_ID:
+        return RAG_WORKING_DIR
+    return os.path.join(RAG_WORKING_DIR, "tenants", embed_id)
+
+
+def tenant_workspace(embed_id: str) -> str:
+    """
+    LightRAG workspace of a tenant. LightRAG keeps loaded storage data by
+    (namespace, workspace), so every tenant needs its own or they'd share one
+    in-memory store. The default embed keeps the unnamed workspace.
+    """
+    return "" if embed_id == DEFAULT_EMBED_ID else embed_id
+
+
+def _dir_size(path: str) -> int:
+    """Bytes of the files LightRAG keeps directly in a working dir (tenant subdirs excluded)."""
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+
+class Tenant:
+    __slots__ = ("embed_id", "rag", "size", "leases")
+
+    def __init__(self, embed_id: str, rag: Any, size: int):
+        self.embed_id = embed_id
+        self.rag = rag
+        self.size = size
+        self.leases = 0
+
+
+class Lease:
+    """A tenant's LightRAG held for one request. `release()` is idempotent."""
+
+    __slots__ = ("_registry", "_tenant", "rag")
+
+    def __init__(self, registry: "TenantRegistry", tenant: Tenant):
+        self._registry = registry
+        self._tenant = tenant
+        self.rag = tenant.rag
+
+    def release(self) -> None:
+        if self._tenant is not None:
+            self._registry._release(self._tenant)
+            self._tenant = None
+
+
+class TenantRegistry:
+    """
+    One LightRAG instance per embed_id, each over its own working directory.
+
+    Instances are loaded on first use. Concurrent first requests for the same
+    tenant share one load (single-flight). Loaded tenants are kept in LRU
+    order, and idle ones are finalized and dropped once the loaded set goes
+    over `budget_bytes` (measured by the tenants' on-disk size) or
+    `max_loaded`. A tenant that is serving a request is never evicted, so
+    the budget can be exceeded briefly under load.
+    """
+
+    def __init__(self, budget_bytes: int = int(TENANT_MEMORY_BUDGET_MB * 1024 * 1024), max_loaded: int = TENANT_MAX_LOADED):
+        self.budget_bytes = budget_bytes
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.shared_loads = 0
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(tenant.size for tenant in self._loaded.values())
+
+    async def acquire(self, embed_id: str) -> Lease:
+        """Leases the tenant's LightRAG, loading it first if needed."""
+        validate_embed_id(embed_id)
+        while True:
+            tenant = await self._get(embed_id)
+            # Another tenant's load may have evicted this one before we resumed
+            if self._loaded.get(embed_id) is tenant:
+                break
+        tenant.leases += 1
+        return Lease(self, tenant)
+
+    async def rag(self, embed_id: str) -> Any:
+        """Loads (or touches) a tenant without leasing it, e.g. to warm it up."""
+        return (await self._get(validate_embed_id(embed_id))).rag
+
+    async def _get(self, embed_id: str) -> Tenant:
+        tenant = self._loaded.get(embed_id)
+        if tenant is not None:
+            self._loaded.move_to_end(embed_id)
+            return tenant
+
+        task = self._loading.get(embed_id)
+        if task is None:
+            task = asyncio.create_task(self._load(embed_id))
+            self._loading[embed_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(embed_id, None))
+        else:
+            self.shared_loads += 1
+        # Shielded so one cancelled request doesn't abort a load others wait on
+        return await asyncio.shield(task)
+
+    async def _load(self, embed_id: str) -> Tenant:
+        from app.utils.lightrag_init import initialize_rag
+
+        working_dir = tenant_dir(embed_id)
+        print(f"Loading LightRAG for embed {embed_id} from {working_dir}")
+        try:
+            rag = await initialize_rag(working_dir, workspace=tenant_workspace(embed_id))
+        except Exception:
+            self.load_failures += 1
+            raise
+        self.loads += 1
+        tenant = Tenant(embed_id, rag, _dir_size(working_dir))
+        self._loaded[embed_id] = tenant
+        await self._evict()
+        return tenant
+
+    def _release(self, tenant: Tenant) -> None:
+        tenant.leases -= 1
+
+    def refresh_size(self, embed_id: str) -> None:
+        """Re-measures a tenant after ingestion grew its knowledge base."""
+        tenant = self._loaded.get(embed_id)
+        if tenant is not None:
+            tenant.size = _dir_size(tenant_dir(embed_id))
+
+    async def _evict(self) -> None:
+        while len(self._loaded) > 1 and (len(self._loaded) > self.max_loaded or self.loaded_bytes > self.budget_bytes):
+            # Oldest idle tenant, never the most recently used one
+            victim = next((t for t in list(self._loaded.values())[:-1] if t.leases == 0), None)
+            if victim is None:
+                return
+            del self._loaded[victim.embed_id]
+            self.evictions += 1
+            print(f"Evicting LightRAG for embed {victim.embed_id} ({victim.size / 1024 / 1024:.1f} MB)")
+            try:
+                await victim.rag.finalize_storages()
+            except Exception as e:
+                print(f"❌ Error finalizing LightRAG for embed {victim.embed_id}: {e}")
+
+    async def close(self) -> None:
+        """Finalizes every loaded tenant, flushing their storages to disk."""
+        for task in list(self._loading.values()):
+            task.cancel()
+        tenants, self._loaded = list(self._loaded.values()), OrderedDict()
+        for tenant in tenants:
+            try:
+                await tenant.rag.finalize_storages()
+            except Exception as e:
+                print(f"❌ Error finalizing LightRAG for embed {tenant.embed_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": len(self._loaded),
+            "loading": len(self._loading),
+            "loaded_bytes": self.loaded_bytes,
+            "budget_bytes": self.budget_bytes,
+            "max_loaded": self.max_loaded,
+            "loads": self.loads,
+            "shared_loads": self.shared_loads,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "tenants": {
+                embed_id: {"bytes": tenant.size, "leases": tenant.leases}
+                for embed_id, tenant in self._loaded.items()
+            },
+        }
+
+
+# Shared registry used by the query, chat and ingestion routes
+tenants = TenantRegistry()
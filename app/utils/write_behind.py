@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Signature of the sink that performs one bulk insert: (table, rows) -> None
+FlushFn = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Buffers rows from many concurrent requests and writes them in bulk.
+
+    Rows are flushed per table once `batch_size` rows are pending or
+    `flush_interval` seconds have passed since the first row of the batch,
+    whichever comes first. The buffer holds at most `max_pending` rows, after
+    which `put()` waits (backpressure) instead of growing memory. Failed
+    batches are retried with exponential backoff and, as a last resort,
+    row by row so a single bad row cannot drop the rest. `stop()` drains
+    everything that was accepted before returning.
+
+    Rows queued with a `key` (e.g. their session) can be read back with
+    `pending(table, key)` until their write finishes, so readers can merge
+    rows the database doesn't have yet, and dropped with `discard(table, key)`
+    before a delete, so they aren't written after it.
+    """
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.2,
+    ):
+        self._flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # (table, key) -> rows queued or being written under that key
+        self._pending: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        # id(row) -> row for discarded rows not yet taken off the queue; they're skipped when written
+        self._discarded: Dict[int, Dict[str, Any]] = {}
+        # Held while the sink writes, so discard() can wait out a write already in flight
+        self._write_lock = asyncio.Lock()
+
+        self.rows_enqueued = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches_written = 0
+        self.retries = 0
+        self.rows_discarded = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered and stop the background writer."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def put(self, table: str, row: Dict[str, Any], key: Optional[str] = None) -> None:
+        """
+        Queues a row for insertion into `table`, readable through
+        `pending(table, key)` until written when a `key` is given.
+        Waits while the buffer is full. Without a running writer (scripts,
+        tests) the row is written straight away.
+        """
+        self.rows_enqueued += 1
+        if not self.running:
+            await self._write(table, [row])
+            return
+        if key is not None:
+            self._pending.setdefault((table, key), []).append(row)
+        await self._queue.put((table, row, key))
+
+    def pending(self, table: str, key: str) -> List[Dict[str, Any]]:
+        """Rows put under `key` that aren't written yet (or are being written), oldest first."""
+        return list(self._pending.get((table, key), ()))
+
+    async def discard(self, table: str, key: str) -> int:
+        """
+        Drops the rows put under `key` that aren't written yet, wherever they
+        are (buffered, waiting for room, or between retries), and waits for a
+        write already in flight to finish. Returns the number of rows dropped.
+        """
+        rows = self._pending.pop((table, key), [])
+        for row in rows:
+            self._discarded[id(row)] = row
+        self.rows_discarded += len(rows)
+        if rows:
+            async with self._write_lock:
+                pass
+        return len(rows)
+
+    def _forget(self, batch: List[Tuple[str, Dict[str, Any], Optional[str]]]) -> None:
+        for table, row, key in batch:
+            self._discarded.pop(id(row), None)
+            if key is None:
+                continue
+            rows = self._pending.get((table, key))
+            if rows is None:
+                continue
+            for index, pending in enumerate(rows):
+                if pending is row:
+                    del rows[index]
+                    break
+            if not rows:
+                del self._pending[(table, key)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "max_pending": self.max_pending,
+            "rows_enqueued": self.rows_enqueued,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "batches_written": self.batches_written,
+            "retries": self.retries,
+            "rows_discarded": self.rows_discarded,
+        }
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch: List[Tuple[str, Dict[str, Any], Optional[str]]] = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Drain whatever was accepted before stop() was called
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any], Optional[str]]]) -> None:
+        by_table: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for table, row, _ in batch:
+            by_table[table].append(row)
+        try:
+            for table, rows in by_table.items():
+                try:
+                    await self._write_with_retry(table, rows)
+                except Exception as e:
+                    # Never let one broken batch kill the writer task
+                    print(f"❌ Write-behind flush to {table} failed unexpectedly: {e}")
+                    self.rows_failed += len(rows)
+        finally:
+            # Written or given up on: either way no longer pending
+            self._forget(batch)
+
+    async def _write_with_retry(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._write(table, rows)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"❌ Bulk insert of {len(rows)} rows into {table} failed after {attempt + 1} attempts: {e}")
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+        if len(rows) == 1:
+            self.rows_failed += 1
+            return
+
+        # Isolate the offending row(s) so the rest of the batch still lands
+        for row in rows:
+            try:
+                await self._write(table, [row])
+            except Exception as e:
+                self.rows_failed += 1
+                print(f"❌ Dropping row for {table}: {e}")
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        async with self._write_lock:
+            if self._discarded:
+                rows = [row for row in rows if id(row) not in self._discarded]
+                if not rows:
+                    return
+            await self._flush_fn(table, rows)
+        self.rows_written += len(rows)
+        self.batches_written += 1
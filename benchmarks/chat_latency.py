@@ -0,0 +1,82 @@
+# Load test for the chat endpoint: fires concurrent stream-chat requests and
+# reports latency percentiles. Run it against a build before and after a change.
+#
+#   python benchmarks/chat_latency.py --base-url http://localhost:8000 \
+#       --embed-id bench --concurrency 50 --requests 500
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def one_chat(client, url, message):
+    body = json.dumps({
+        "sessionId": f"bench-{uuid.uuid4()}",
+        "clientUserId": "bench-user",
+        "message": message,
+    })
+    start = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", url, content=body, headers={"Content-Type": "application/json"}) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte or 0.0, time.perf_counter() - start
+
+
+async def run(args):
+    url = f"{args.base_url.rstrip('/')}/embed/{args.embed_id}/stream-chat"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    ttfb, totals, errors = [], [], 0
+
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        async def worker(i):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    first, total = await one_chat(client, url, args.message)
+                    ttfb.append(first)
+                    totals.append(total)
+                except Exception as e:
+                    errors += 1
+                    if errors <= 5:
+                        print(f"❌ Request {i} failed: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    print(f"\n📊 {len(totals)} ok / {errors} failed in {elapsed:.2f}s ({len(totals) / elapsed:.1f} req/s) at concurrency {args.concurrency}")
+    for label, values in (("time to first byte", ttfb), ("total latency", totals)):
+        if not values:
+            continue
+        print(f"{label:>20}: mean {statistics.mean(values) * 1000:8.1f} ms | "
+              f"p50 {percentile(values, 50) * 1000:8.1f} ms | "
+              f"p95 {percentile(values, 95) * 1000:8.1f} ms | "
+              f"p99 {percentile(values, 99) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent stream-chat latency benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--embed-id", default="bench")
+    parser.add_argument("--message", default="What are your features?")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
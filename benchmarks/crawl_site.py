@@ -0,0 +1,208 @@
+# Website crawl benchmark for /ingest/url: the old scraper (blocking
+# requests.get per page, a new connection each time) vs the async crawler in
+# app/utils/scrape_website.py, against a local stub server that serves a
+# synthetic site (sitemap.xml plus --pages HTML pages, each answered after
+# --latency-ms, with --error-rate of responses being a 503 to exercise retries).
+#
+#   python benchmarks/crawl_site.py --pages 5000 --latency-ms 20
+#   python benchmarks/crawl_site.py --pages 5000 --concurrency 32 --per-host 32 --host-rps 0
+#
+# The old scraper only crawls --legacy-pages pages; its time for the whole
+# site is extrapolated. The stub is plain HTTP, so the crawler uses HTTP/1.1
+# keep-alive here (HTTP/2 is negotiated over TLS only).
+#
+# After the first crawl --changed of the pages are edited and the site is
+# crawled again, to measure an incremental refresh: pages carry ETags (304 on
+# If-None-Match) and the sitemap has <lastmod>, unless --no-lastmod.
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARAGRAPH = "Our platform helps teams capture leads and answer visitor questions about pricing and onboarding. "
+
+
+def make_app(pages, latency, error_rate, lastmod=True):
+    versions = [0] * pages
+    stats = {"requests": 0, "bytes": 0}
+
+    def render_sitemap(base):
+        rows = []
+        for n, version in enumerate(versions):
+            modified = f"<lastmod>2024-01-{1 + version:02d}</lastmod>" if lastmod else ""
+            rows.append(f"<url><loc>{base}/docs/page-{n}</loc>{modified}</url>\n")
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            + "".join(rows) + "</urlset>\n"
+        )
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        path = scope["path"]
+        request_headers = dict(scope["headers"])
+        host = request_headers.get(b"host", b"").decode()
+        headers = []
+        if path == "/sitemap.xml":
+            status, body, kind = 200, render_sitemap(f"http://{host}").encode(), b"application/xml"
+        elif path == "/__bump":
+            # Edits a fraction of the pages and resets the counters
+            fraction = float(scope["query_string"].decode().split("=")[-1] or 0)
+            for n in random.sample(range(pages), int(pages * fraction)):
+                versions[n] += 1
+            stats.update(requests=0, bytes=0)
+            status, body, kind = 200, b"ok", b"text/plain"
+        elif path == "/__stats":
+            status, body, kind = 200, json.dumps(stats).encode(), b"application/json"
+        elif path.startswith("/docs/page-"):
+            await asyncio.sleep(latency)
+            number = int(path.rsplit("-", 1)[-1])
+            etag = f'"{number}-{versions[number]}"'.encode()
+            if random.random() < error_rate:
+                status, body, kind = 503, b"busy", b"text/plain"
+            elif request_headers.get(b"if-none-match") == etag:
+                status, body, kind = 304, b"", b"text/html"
+            else:
+                paragraphs = "".join(f"<p>{number}.{i} v{versions[number]} {PARAGRAPH}</p>" for i in range(20))
+                body = f"<html><head><style>p{{}}</style></head><body><h1>Page {number}</h1>{paragraphs}</body></html>".encode()
+                status, kind = 200, b"text/html"
+            headers.append((b"etag", etag))
+            stats["requests"] += 1
+        else:
+            status, body, kind = 404, b"", b"text/plain"
+        if not path.startswith("/__"):
+            stats["bytes"] += len(body)
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", kind)] + headers})
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def serve(port, pages, latency, error_rate, lastmod):
+    import uvicorn
+
+    uvicorn.run(make_app(pages, latency, error_rate, lastmod), host="127.0.0.1", port=port, log_level="error",
+                limit_concurrency=None, backlog=4096)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("stub server didn't start")
+
+
+def legacy(base_url, limit):
+    """The old scrape loop: one blocking request (and connection) per page."""
+    import requests
+    from bs4 import BeautifulSoup
+
+    from app.utils.scrape_website import clean_text
+
+    res = requests.get(f"{base_url}/sitemap.xml")
+    urls = [loc.text for loc in BeautifulSoup(res.content, "xml").find_all("loc")]
+    total = len(urls)
+    ok = 0
+    started = time.perf_counter()
+    for url in urls[:limit]:
+        try:
+            response = requests.get(url, timeout=10)
+            if response.status_code == 200:
+                clean_text(response.text)
+                ok += 1
+        except Exception:
+            pass
+    return time.perf_counter() - started, min(limit, total), ok, total
+
+
+async def crawl(base_url):
+    from app.utils.scrape_website import scrape_site_from_sitemap
+
+    started = time.perf_counter()
+    _, pages = await scrape_site_from_sitemap(base_url)
+    return time.perf_counter() - started, len(pages)
+
+
+def stub(base_url, path):
+    import requests
+
+    return requests.get(f"{base_url}{path}").json() if path == "/__stats" else requests.get(f"{base_url}{path}")
+
+
+def main(args):
+    os.environ.update(
+        CRAWL_CONCURRENCY=str(args.concurrency),
+        CRAWL_PER_HOST=str(args.per_host),
+        CRAWL_HOST_RPS=str(args.host_rps),
+        CRAWL_BACKOFF="0.05",
+    )
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(port, args.pages, args.latency_ms / 1000, args.error_rate, not args.no_lastmod), daemon=True
+    )
+    server.start()
+    try:
+        wait_for(port)
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"🌐 Stub site: {args.pages} pages, {args.latency_ms} ms per page, {args.error_rate:.0%} 503s")
+
+        elapsed, tried, ok, total = legacy(base_url, args.legacy_pages)
+        legacy_rate = tried / elapsed
+        print(f"  legacy: {tried} pages in {elapsed:.1f}s ({ok} ok) = {legacy_rate:6.1f} pages/s "
+              f"-> ~{total / legacy_rate:.0f}s for the whole site")
+
+        # The crawler writes db/<host>/ into the working directory
+        with tempfile.TemporaryDirectory(prefix="crawl-bench-") as tmp:
+            os.chdir(tmp)
+            stub(base_url, "/__bump?fraction=0")
+            elapsed, scraped = asyncio.run(crawl(base_url))
+            first = stub(base_url, "/__stats")
+
+            stub(base_url, f"/__bump?fraction={args.changed}")
+            again, _ = asyncio.run(crawl(base_url))
+            refresh = stub(base_url, "/__stats")
+            os.chdir(ROOT)
+        rate = scraped / elapsed
+        print(f" crawler: {scraped} pages in {elapsed:.1f}s = {rate:6.1f} pages/s "
+              f"({args.concurrency} concurrent, {args.per_host} per host, {args.host_rps or 'no'} req/s limit)")
+        print(f"\n📊 {rate / legacy_rate:.1f}x the old scraper's throughput")
+        print(f"🔄 Re-crawl with {args.changed:.0%} of pages changed ({'no ' if args.no_lastmod else ''}sitemap lastmod): "
+              f"{again:.1f}s, {refresh['requests']} page requests, {refresh['bytes'] / 1024:.0f} KB "
+              f"(first crawl: {elapsed:.1f}s, {first['requests']} requests, {first['bytes'] / 1024:.0f} KB)")
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Website crawl benchmark")
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--legacy-pages", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--per-host", type=int, default=32)
+    parser.add_argument("--host-rps", type=float, default=0)
+    parser.add_argument("--changed", type=float, default=0.05)
+    parser.add_argument("--no-lastmod", action="store_true")
+    main(parser.parse_args())
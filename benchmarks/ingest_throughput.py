@@ -0,0 +1,94 @@
+# Ingestion benchmark: inserts one document into a fresh LightRAG working dir
+# and reports entity-extraction throughput (LLM calls/sec) and embedding
+# requests. Needs GEMINI_API_KEY; every run makes real model calls.
+#
+#   python benchmarks/ingest_throughput.py --file ./db/www.alphabase.co/combined.txt
+#   python benchmarks/ingest_throughput.py --file ./db/www.alphabase.co/combined.txt --per-call-clients
+#
+# Run it twice on the same file to see the embedding cache at work: the second
+# run's embedding requests should be nearly all cache hits.
+#
+# --per-call-clients builds a new GoogleGenAI / GoogleGenAIEmbedding for every
+# call, which is how lightrag_init worked before the clients were pooled.
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import lightrag_init
+from app.utils.embedding_cache import embedding_cache
+
+counters = {"llm_calls": 0, "llm_seconds": 0.0, "embedding_calls": 0, "texts_embedded": 0}
+
+
+def count_calls():
+    llm_model_func = lightrag_init.llm_model_func
+    embedding_func = lightrag_init.embedding_func
+
+    async def counted_llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+        started = time.perf_counter()
+        try:
+            return await llm_model_func(prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs)
+        finally:
+            counters["llm_calls"] += 1
+            counters["llm_seconds"] += time.perf_counter() - started
+
+    async def counted_embedding(texts):
+        counters["embedding_calls"] += 1
+        counters["texts_embedded"] += len(texts)
+        return await embedding_func(texts)
+
+    lightrag_init.llm_model_func = counted_llm
+    lightrag_init.embedding_func = counted_embedding
+
+
+def use_per_call_clients():
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    lightrag_init.get_llm = lambda: GoogleGenAI(
+        model=lightrag_init.LLM_MODEL,
+        api_key=lightrag_init.GEMINI_API_KEY,
+        temperature=lightrag_init.LLM_TEMPERATURE,
+    )
+    lightrag_init.get_embed_model = lambda: GoogleGenAIEmbedding(
+        model_name=lightrag_init.EMBEDDING_MODEL,
+        api_key=lightrag_init.GEMINI_API_KEY,
+    )
+
+
+async def ingest(file_path):
+    rag = await lightrag_init.initialize_rag()
+    started = time.perf_counter()
+    ok = await lightrag_init.insert_data(rag, file_path)
+    return ok, time.perf_counter() - started
+
+
+def main(args):
+    if args.per_call_clients:
+        use_per_call_clients()
+    count_calls()
+
+    with tempfile.TemporaryDirectory(prefix="ingest-bench-") as working_dir:
+        # A fresh working dir means an empty LLM cache, so every chunk is extracted
+        os.environ["RAG_WORKING_DIR"] = working_dir
+        ok, elapsed = asyncio.run(ingest(args.file))
+
+    calls = counters["llm_calls"]
+    print(f"\n📊 Mode: {'per-call clients' if args.per_call_clients else 'pooled clients'} | insert {'ok' if ok else 'FAILED'} in {elapsed:.1f}s")
+    print(f"LLM calls:        {calls:8d} ({calls / elapsed:.2f}/s, avg {counters['llm_seconds'] / max(calls, 1) * 1000:.0f} ms)")
+    print(f"Embedding calls:  {counters['embedding_calls']:8d} ({counters['texts_embedded']} texts)")
+    cache = embedding_cache.stats()
+    print(f"Embedding cache:  {cache['remote_calls']:8d} remote calls, hit ratio {cache['hit_ratio']:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LightRAG ingestion throughput benchmark")
+    parser.add_argument("--file", required=True, help="Text file to insert")
+    parser.add_argument("--per-call-clients", action="store_true", help="New model clients per call (baseline)")
+    main(parser.parse_args())
@@ -0,0 +1,134 @@
+# Microbenchmark for lead detection: per-message cost of LeadScanner.scan over
+# a realistic mix of widget chat messages, next to the previous three-pass
+# detectors (_detect_emails/_detect_phones/_detect_names) as a baseline.
+#
+#   python benchmarks/lead_scanner.py --messages 50000
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.lead_capture import LeadScanner
+
+CORPUS = [
+    "hi",
+    "Hello! How are you?",
+    "What are your features?",
+    "pricing?",
+    "How much does the pro plan cost per month?",
+    "Can you tell me more about the API rate limits and how billing works for overages?",
+    "do you integrate with slack and hubspot",
+    "Tell me about Alphabase",
+    "What's new?",
+    "Is there a free trial available for teams of 10 or more?",
+    "I am interested in the enterprise plan",
+    "We are a team of 25 people based in New York City",
+    "thanks, that helps a lot",
+    "Can I export my data to CSV?",
+    "what happens after the 14 day trial ends",
+    "My name is Sarah Connor and I'd like a demo",
+    "I'm John, can someone reach out?",
+    "You can call me Alex",
+    "my email is jane.doe@example.com",
+    "Please send the brochure to mark+sales@acme-corp.io",
+    "My phone number is (415) 555-0134",
+    "call me at 212.555.0199 tomorrow morning",
+    "Phone: 646-555-0123, email: ops@startup.dev",
+    "I'm Priya Patel, priya@globex.com, mobile 917 555 0142",
+    "order #12345678 didn't arrive",
+    "Our budget is around 5000 USD for Q3 2025",
+    "The Customer Support Team told me to ask here",
+    "Does the widget support right-to-left languages like Arabic?",
+    "how do I reset my password",
+    "ok",
+]
+
+
+# --- Previous implementation, kept here as the baseline ---------------------------------------
+
+def legacy_detect_emails(text):
+    email_regex = r"[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)+"
+    return list(set(re.findall(email_regex, text)))
+
+
+def legacy_detect_phones(text):
+    phone_pattern_str = r"\(?\b\d{3}\b\)?[-.\s]?\b\d{3}\b[-.\s]?\b\d{4}\b"
+    keyword_phone_patterns = [
+        re.compile(r"(?:my\s+phone(?:\s+number)?\s+is|call\s+me\s+at|my\s+number\s+is|contact\s+no\.?\s*(?:is)?)\s*:?\s*(" + phone_pattern_str + r")", re.IGNORECASE),
+        re.compile(r"(\bphone(?:\s+number)?\b|\bcell\b|\bmobile\b)\s*:?\s*(" + phone_pattern_str + r")", re.IGNORECASE),
+    ]
+    found_phones = []
+    for pattern in keyword_phone_patterns:
+        for match_group in pattern.findall(text):
+            phone_number = match_group if isinstance(match_group, str) else match_group[-1]
+            found_phones.append(phone_number.strip())
+    if not found_phones:
+        for match in re.findall(phone_pattern_str, text):
+            found_phones.append(match.strip())
+    return list(set(re.sub(r"[-.\s\(\)]", "", phone) for phone in found_phones))
+
+
+def legacy_detect_names(text):
+    name_structure_pattern = r"\b[A-Z][a-z']+(?:\s+[A-Z][a-z']+){0,2}\b"
+    keyword_name_patterns = [
+        re.compile(r"(?:my\s+name\s+is|i\s*am|i'm)\s+(" + name_structure_pattern + r")", re.IGNORECASE),
+        re.compile(r"(?:call\s+me)\s+(" + name_structure_pattern + r")", re.IGNORECASE),
+    ]
+    found_names = []
+    for pattern in keyword_name_patterns:
+        for match_group in pattern.findall(text):
+            name_candidate = match_group if isinstance(match_group, str) else match_group[-1]
+            if len(name_candidate.replace(" ", "")) > 1:
+                found_names.append(name_candidate.strip())
+    if not found_names:
+        for candidate in re.findall(r"(\b[A-Z][a-z']+\s+[A-Z][a-z']+(?:\s+[A-Z][a-z']+)?)", text):
+            if len(candidate.replace(" ", "")) > 2:
+                found_names.append(candidate.strip())
+    return list(set(found_names))
+
+
+def legacy_scan(text):
+    return legacy_detect_emails(text), legacy_detect_phones(text), legacy_detect_names(text)
+
+
+# ---------------------------------------------------------------------------------------------
+
+def timed(fn, messages):
+    start = time.perf_counter()
+    for message in messages:
+        fn(message)
+    return time.perf_counter() - start
+
+
+def main(args):
+    random.seed(args.seed)
+    messages = [random.choice(CORPUS) for _ in range(args.messages)]
+    scanner = LeadScanner()
+
+    # Results should agree on the corpus (modulo ordering)
+    mismatches = 0
+    for text in CORPUS:
+        legacy = tuple(sorted(values) for values in legacy_scan(text))
+        current = tuple(sorted(values) for values in scanner.scan(text))
+        if legacy != current:
+            mismatches += 1
+            print(f"≠ {text!r}\n   legacy:  {legacy}\n   scanner: {current}")
+
+    legacy_time = timed(legacy_scan, messages)
+    scanner_time = timed(scanner.scan, messages)
+
+    print(f"\n📊 {args.messages} messages ({len(CORPUS)} distinct), {mismatches} result differences")
+    print(f"legacy detectors: {legacy_time / args.messages * 1e6:8.2f} µs/message")
+    print(f"LeadScanner:      {scanner_time / args.messages * 1e6:8.2f} µs/message ({legacy_time / scanner_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lead detection microbenchmark")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+# Document extraction benchmark for /ingest/file: wall time and peak RSS to
+# turn a large PDF into text, the old way (whole file in memory, one page at a
+# time on the server process, `text +=`) vs the extraction pool (page ranges
+# extracted in parallel processes and written out as they complete).
+#
+#   python benchmarks/pdf_extract.py --pages 500
+#   python benchmarks/pdf_extract.py --pdf ./some.pdf --processes 4
+#
+# Without --pdf a synthetic PDF with --pages text-heavy pages is generated.
+# Each variant runs in a fresh interpreter so peak RSS isn't shared.
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LINE = "Lead capture assistant answers questions about pricing, onboarding and integrations. "
+
+
+def make_pdf(path, pages):
+    import fitz
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(f"{number:04d}.{line:02d} {LINE}" for line in range(48))
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def legacy(pdf_path, out_path):
+    import fitz
+
+    with open(pdf_path, "rb") as f:
+        file_bytes = f.read()
+    text = ""
+    pdf = fitz.open(stream=file_bytes, filetype="pdf")
+    for page in pdf:
+        text += page.get_text()
+    pdf.close()
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return len(text)
+
+
+async def pooled(pdf_path, out_path):
+    from app.utils.doc_support import iter_document_text, shutdown_extract_pool
+
+    characters = 0
+    try:
+        with open(out_path, "w", encoding="utf-8") as out:
+            async for part in iter_document_text(pdf_path, "pdf"):
+                await asyncio.to_thread(out.write, part)
+                characters += len(part)
+    finally:
+        # Waits for the workers to exit, so their peak RSS is counted
+        shutdown_extract_pool(wait=True)
+    return characters
+
+
+def run_variant(mode, pdf_path):
+    """Runs in a child interpreter; prints characters, seconds, own and children's peak RSS (KB)."""
+    with tempfile.NamedTemporaryFile(suffix=".txt") as out:
+        started = time.perf_counter()
+        if mode == "legacy":
+            characters = legacy(pdf_path, out.name)
+        else:
+            characters = asyncio.run(pooled(pdf_path, out.name))
+        elapsed = time.perf_counter() - started
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(characters, elapsed, own, children)
+
+
+def measure(mode, pdf_path, processes):
+    env = dict(os.environ, INGEST_EXTRACT_PROCESSES=str(processes))
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--variant", mode, "--pdf", pdf_path],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    characters, elapsed, own, children = output.stdout.split()[-4:]
+    return int(characters), float(elapsed), int(own) / 1024, int(children) / 1024
+
+
+def main(args):
+    with tempfile.TemporaryDirectory(prefix="pdf-bench-") as tmp:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp, "synthetic.pdf")
+            make_pdf(pdf_path, args.pages)
+        print(f"📄 {pdf_path} ({os.path.getsize(pdf_path) / 1024 / 1024:.1f} MB), {args.processes} extraction processes, best of {args.runs}")
+
+        for mode in ("legacy", "pooled"):
+            runs = [measure(mode, pdf_path, args.processes) for _ in range(args.runs)]
+            characters, elapsed, own, children = min(runs, key=lambda run: run[1])
+            print(f"{mode:>8}: {elapsed:6.2f} s | server process peak RSS {own:7.1f} MB | "
+                  f"largest worker peak RSS {children:7.1f} MB | {characters} characters")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF extraction benchmark")
+    parser.add_argument("--pdf", default=None)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--variant", choices=["legacy", "pooled"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        run_variant(args.variant, args.pdf)
+    else:
+        main(args)
@@ -0,0 +1,55 @@
+# Throughput benchmark for chat persistence. Simulates N concurrent sessions,
+# each saving a user and an assistant message per turn, and reports turns/sec
+# (what the request path sees) and rows/sec (what actually reached the table).
+#
+#   python benchmarks/persistence_throughput.py --sessions 200 --turns 5
+#   python benchmarks/persistence_throughput.py --sessions 200 --turns 5 --direct
+#
+# --direct skips the write-behind writer so every message is its own INSERT.
+# Set STORAGE_BACKEND=sqlite to benchmark locally without a network dependency.
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import close_storage
+from app.utils.supabase import save_message, write_queue
+
+
+async def session(session_id, turns):
+    for turn in range(turns):
+        await save_message(session_id, {"role": "user", "content": f"benchmark question {turn}", "uuid": str(uuid.uuid4())})
+        await save_message(session_id, {"role": "assistant", "content": f"benchmark answer {turn}", "uuid": str(uuid.uuid4())})
+
+
+async def run(args):
+    if not args.direct:
+        await write_queue.start()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(f"bench-{uuid.uuid4()}", args.turns) for _ in range(args.sessions)))
+    request_elapsed = time.perf_counter() - started
+
+    await write_queue.stop()
+    total_elapsed = time.perf_counter() - started
+    await close_storage()
+
+    stats = write_queue.stats()
+    turns = args.sessions * args.turns
+    print(f"\n📊 Mode: {'direct inserts' if args.direct else 'write-behind'} | {args.sessions} sessions x {args.turns} turns")
+    print(f"Turns/sec (request path): {turns / request_elapsed:10.1f}")
+    print(f"Rows/sec  (persisted):    {stats['rows_written'] / total_elapsed:10.1f}")
+    print(f"Rows written / failed:    {stats['rows_written']} / {stats['rows_failed']} in {stats['batches_written']} requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat persistence throughput benchmark")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--direct", action="store_true", help="Write each row immediately (baseline)")
+    asyncio.run(run(parser.parse_args()))
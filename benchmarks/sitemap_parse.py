@@ -0,0 +1,149 @@
+# Sitemap reading benchmark for /ingest/url: the old reader (whole
+# sitemap.xml downloaded, then parsed by BeautifulSoup's XML parser) vs
+# iter_sitemap (streamed through an incremental XML parser), on a local stub
+# server. Reports wall time and peak RSS for a flat sitemap with --urls
+# entries, and for iter_sitemap also a sitemap index of gzipped parts of
+# --part-size entries each (which the old reader can't follow).
+#
+#   python benchmarks/sitemap_parse.py --urls 200000
+#
+# Each variant runs in a fresh interpreter so peak RSS isn't shared.
+
+import argparse
+import asyncio
+import gzip
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+CHUNK = 64 * 1024
+
+
+def urlset(base, start, stop):
+    rows = "".join(
+        f"<url><loc>{base}/docs/section-{n // 100}/page-{n}</loc><lastmod>2024-0{1 + n % 9}-15</lastmod>"
+        f"<priority>0.{n % 10}</priority></url>\n"
+        for n in range(start, stop)
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset {NS}>\n{rows}</urlset>\n'.encode()
+
+
+def make_app(urls, part_size):
+    files = {}
+
+    def body(path, base):
+        if path not in files:
+            if path == "/sitemap.xml":
+                files[path] = urlset(base, 0, urls)
+            elif path == "/index.xml":
+                parts = "".join(
+                    f"<sitemap><loc>{base}/part-{i}.xml.gz</loc></sitemap>\n" for i in range(0, urls, part_size)
+                )
+                files[path] = f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex {NS}>\n{parts}</sitemapindex>\n'.encode()
+            elif path.startswith("/part-"):
+                start = int(path[len("/part-"):].split(".")[0])
+                files[path] = gzip.compress(urlset(base, start, min(start + part_size, urls)))
+            else:
+                return None
+        return files[path]
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        host = dict(scope["headers"]).get(b"host", b"").decode()
+        content = body(scope["path"], f"http://{host}")
+        if content is None:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/xml")]})
+        for offset in range(0, len(content), CHUNK):
+            await send({"type": "http.response.body", "body": content[offset:offset + CHUNK], "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+def serve(port, urls, part_size):
+    import uvicorn
+
+    uvicorn.run(make_app(urls, part_size), host="127.0.0.1", port=port, log_level="error")
+
+
+def old_reader(url):
+    import requests
+    from bs4 import BeautifulSoup
+
+    res = requests.get(url)
+    soup = BeautifulSoup(res.content, "xml")
+    return len([loc.text for loc in soup.find_all("loc")])
+
+
+async def streaming(url):
+    from app.utils.scrape_website import iter_sitemap, make_client
+
+    count = 0
+    async with make_client() as client:
+        async for _ in iter_sitemap(client, url):
+            count += 1
+    return count
+
+
+def run_variant(mode, url):
+    """Runs in a child interpreter; prints URLs found, seconds and peak RSS (KB)."""
+    started = time.perf_counter()
+    count = old_reader(url) if mode == "old" else asyncio.run(streaming(url))
+    elapsed = time.perf_counter() - started
+    print(count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def measure(mode, url):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--variant", mode, "--url", url],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    count, elapsed, rss = output.stdout.split()[-3:]
+    return int(count), float(elapsed), int(rss) / 1024
+
+
+def main(args):
+    from crawl_site import free_port, wait_for
+
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(target=serve, args=(port, args.urls, args.part_size), daemon=True)
+    server.start()
+    try:
+        wait_for(port)
+        base = f"http://127.0.0.1:{port}"
+        print(f"🗺️ {args.urls} URLs; index of {-(-args.urls // args.part_size)} gzipped parts of {args.part_size}")
+        for label, mode, path in (
+            ("old, flat", "old", "/sitemap.xml"),
+            ("streaming, flat", "streaming", "/sitemap.xml"),
+            ("streaming, index", "streaming", "/index.xml"),
+        ):
+            count, elapsed, rss = measure(mode, base + path)
+            print(f"{label:>17}: {count:7d} URLs in {elapsed:5.2f}s | peak RSS {rss:7.1f} MB")
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sitemap reading benchmark")
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.add_argument("--part-size", type=int, default=50000)
+    parser.add_argument("--variant", choices=["old", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        run_variant(args.variant, args.url)
+    else:
+        main(args)
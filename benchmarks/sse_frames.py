@@ -0,0 +1,100 @@
+# SSE framing benchmark for /embed/{embed_id}/stream-chat: one frame per LLM
+# chunk via format_sse_chunk (before) vs SSEWriter, which renders the envelope
+# once and coalesces chunks. Reports frames and bytes per answer, CPU per
+# answer and render throughput.
+#
+#   python benchmarks/sse_frames.py --answers 200 --chunks 400 --chunk-chars 4 --gap-ms 2
+#
+# --gap-ms simulates the time between LLM chunks; with 0 the source still
+# yields to the event loop between chunks (as a network stream does), so the
+# writer's first-chunk path runs and time to first frame is measured. Each
+# frame is also one ASGI send (and usually one socket write) in the server,
+# which this doesn't count.
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.sse import SSEWriter, orjson  # noqa: E402
+from app.utils.utils import format_sse_chunk  # noqa: E402
+
+WORDS = "Our platform helps teams capture leads and answer questions with “smart” replies. ".split(" ")
+
+
+async def llm_chunks(count, chars, gap):
+    text = " ".join(WORDS)
+    for i in range(count):
+        start = (i * chars) % (len(text) - chars)
+        yield text[start:start + chars]
+        # sleep(0) still hands control back to the loop, like a socket read would
+        await asyncio.sleep(gap)
+
+
+async def per_chunk(message_uuid, chunks):
+    async for chunk in chunks:
+        yield format_sse_chunk({
+            "uuid": message_uuid,
+            "type": "textResponseChunk",
+            "textResponse": chunk,
+            "sources": [],
+            "close": False,
+            "error": False,
+        })
+
+
+async def coalesced(message_uuid, chunks, max_delay, max_bytes):
+    writer = SSEWriter(message_uuid, max_delay=max_delay, max_bytes=max_bytes)
+    async for frame in writer.frames(chunks):
+        yield frame
+
+
+async def measure(name, make_stream, args):
+    frames = size = 0
+    first_frame = 0.0
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(args.answers):
+        message_uuid = str(uuid.uuid4())
+        answer_started = time.perf_counter()
+        first = True
+        async for frame in make_stream(message_uuid, llm_chunks(args.chunks, args.chunk_chars, args.gap_ms / 1000)):
+            if first:
+                first = False
+                first_frame += time.perf_counter() - answer_started
+            frames += 1
+            size += len(frame.encode())
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    print(f"{name:>12}: {frames / args.answers:7.1f} frames/answer | {size / args.answers / 1024:6.1f} KB/answer | "
+          f"{cpu / args.answers * 1000:7.2f} ms CPU/answer | {first_frame / args.answers * 1000:6.3f} ms to first frame | "
+          f"{frames / elapsed:9.0f} frames/s")
+    return cpu
+
+
+async def run(args):
+    print(f"{args.answers} answers x {args.chunks} chunks of {args.chunk_chars} chars, {args.gap_ms} ms apart "
+          f"(orjson {'on' if orjson is not None else 'off'})")
+    before = await measure("per chunk", per_chunk, args)
+    after = await measure(
+        "coalesced",
+        lambda message_uuid, chunks: coalesced(message_uuid, chunks, args.window_ms / 1000, args.window_bytes),
+        args,
+    )
+    print(f"\n📊 CPU per answer: {before / max(after, 1e-9):.1f}x less with coalescing "
+          f"({args.window_ms:.0f} ms / {args.window_bytes} chars window)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE framing benchmark")
+    parser.add_argument("--answers", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--chunk-chars", type=int, default=4)
+    parser.add_argument("--gap-ms", type=float, default=0.0)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--window-bytes", type=int, default=256)
+    asyncio.run(run(parser.parse_args()))
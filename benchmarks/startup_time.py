@@ -0,0 +1,90 @@
+# Cold start benchmark: how long `import app.main` takes in a fresh
+# interpreter, and how long a fresh uvicorn process takes until /healthz
+# answers (live) and until /readyz returns 200 (LightRAG loaded).
+#
+#   python benchmarks/startup_time.py --runs 3
+#
+# Runs against the real .env, so time to ready includes loading RAG storage
+# and probing the storage backend.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def import_time():
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url, started, timeout, process):
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def server_times(port, timeout):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = wait_for(f"http://127.0.0.1:{port}/healthz", started, timeout, process)
+        ready = wait_for(f"http://127.0.0.1:{port}/readyz", started, timeout, process) if live is not None else None
+        return live, ready
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.0f} ms"
+
+
+def summary(label, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"{label:>16}: never reached"
+    return f"{label:>16}: mean {statistics.mean(values) * 1000:8.0f} ms | min {min(values) * 1000:8.0f} ms | max {max(values) * 1000:8.0f} ms"
+
+
+def main(args):
+    imports, lives, readies = [], [], []
+    for run in range(args.runs):
+        imports.append(import_time())
+        live, ready = server_times(args.port, args.timeout)
+        lives.append(live)
+        readies.append(ready)
+        print(f"run {run + 1}: import {ms(imports[-1])} | live {ms(live)} | ready {ms(ready)}")
+
+    print(f"\n📊 {args.runs} cold starts")
+    print(summary("import app.main", imports))
+    print(summary("time to live", lives))
+    print(summary("time to ready", readies))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+# Streaming benchmark for /stream-query: time to first token (first non-empty
+# body chunk) and full-answer latency at increasing concurrency, to find how
+# many concurrent streams one worker sustains before TTFT degrades.
+#
+#   python benchmarks/stream_ttft.py --base-url http://localhost:8000 --token $JWT \
+#       --levels 1,5,10,25,50 --requests-per-level 50 --ttft-budget-ms 2000
+#
+# Start the server with ANSWER_CACHE_SIZE=0, otherwise repeated questions are
+# replayed from the answer cache and never reach the LLM.
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def one_stream(client, url, query):
+    start = time.perf_counter()
+    first_token = None
+    chunks = 0
+    async with client.stream("GET", url, params={"query": query}) as response:
+        response.raise_for_status()
+        async for piece in response.aiter_text():
+            if not piece:
+                continue
+            chunks += 1
+            if first_token is None:
+                first_token = time.perf_counter() - start
+    return first_token or 0.0, time.perf_counter() - start, chunks
+
+
+async def run_level(client, url, queries, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    ttft, totals, chunk_counts, errors = [], [], [], 0
+
+    async def worker(i):
+        nonlocal errors
+        async with semaphore:
+            try:
+                first, total, chunks = await one_stream(client, url, queries[i % len(queries)])
+                ttft.append(first)
+                totals.append(total)
+                chunk_counts.append(chunks)
+            except Exception as e:
+                errors += 1
+                if errors <= 3:
+                    print(f"❌ Stream {i} failed: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(requests)))
+    return ttft, totals, chunk_counts, errors, time.perf_counter() - started
+
+
+async def run(args):
+    url = f"{args.base_url.rstrip('/')}/stream-query"
+    levels = [int(level) for level in args.levels.split(",")]
+    queries = [line.strip() for line in args.queries.split("|") if line.strip()]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+
+    capacity = 0
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout, headers=headers) as client:
+        for concurrency in levels:
+            ttft, totals, chunk_counts, errors, elapsed = await run_level(client, url, queries, concurrency, args.requests_per_level)
+            if not ttft:
+                print(f"concurrency {concurrency:4d}: all {errors} streams failed")
+                break
+            p95_ttft = percentile(ttft, 95)
+            print(f"concurrency {concurrency:4d}: TTFT p50 {percentile(ttft, 50) * 1000:7.0f} ms | "
+                  f"p95 {p95_ttft * 1000:7.0f} ms | total p50 {percentile(totals, 50) * 1000:7.0f} ms | "
+                  f"{statistics.mean(chunk_counts):5.1f} chunks/answer | {len(ttft) / elapsed:5.2f} streams/s | {errors} failed")
+            if p95_ttft * 1000 <= args.ttft_budget_ms and not errors:
+                capacity = concurrency
+
+    print(f"\n📊 Highest concurrency with p95 TTFT <= {args.ttft_budget_ms:.0f} ms and no failures: {capacity or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming time-to-first-token benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", default="", help="JWT for the Authorization header")
+    parser.add_argument("--queries", default="What are your features?|How does pricing work?|Do you offer a free trial?")
+    parser.add_argument("--levels", default="1,5,10,25,50")
+    parser.add_argument("--requests-per-level", type=int, default=50)
+    parser.add_argument("--ttft-budget-ms", type=float, default=2000)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.crawl_manifest import parse_lastmod
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024", utc(2024, 1, 1)),
+    ("2024-05", utc(2024, 5, 1)),
+    ("2024-05-01", utc(2024, 5, 1)),
+    ("2024-05-01T10:00Z", utc(2024, 5, 1, 10)),
+    ("2024-05-01T10:00:00Z", utc(2024, 5, 1, 10)),
+    ("2024-05-01T10:00:00z", utc(2024, 5, 1, 10)),
+    ("2024-05-01T10:00:00.5Z", utc(2024, 5, 1, 10, 0, 0, 500000)),
+    ("2024-05-01T10:00:00.123456789Z", utc(2024, 5, 1, 10, 0, 0, 123456)),
+    ("2024-05-01T12:00:00+02:00", utc(2024, 5, 1, 10)),
+    ("2024-05-01T05:30:00-04:30", utc(2024, 5, 1, 10)),
+    ("2024-05-01T10:00:00", utc(2024, 5, 1, 10)),
+    ("  2024-05-01\n", utc(2024, 5, 1)),
+])
+def test_parse_lastmod(value, expected):
+    assert parse_lastmod(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "yesterday", "2024-13", "2024-05-32", "24-05-01", "2024-05-01T25:00:00Z", "Z"])
+def test_parse_lastmod_invalid(value):
+    assert parse_lastmod(value) is None